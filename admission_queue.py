@@ -0,0 +1,113 @@
+# admission_queue.py
+
+import asyncio
+import collections
+from typing import Deque, Dict, Optional, Tuple
+
+Waiter = Tuple[asyncio.AbstractEventLoop, asyncio.Future, int]  # (loop, future, lease)
+
+class AdmissionQueueFull(Exception):
+    """Raised when an allocation cannot be queued; retry_after estimates when it could succeed."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Admission queue full, retry after {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+class AdmissionQueue:
+    """
+    Bounded queue of allocation waiters, served by weighted round-robin across client keys.
+
+    Each key (API key or client address) has its own FIFO. The key at the head of
+    the rotation is served up to its weight in a row, then moves to the back, so a
+    client that queues hundreds of requests cannot starve one that queues a few.
+    Waiters whose future is already done (timed out or cancelled) are skipped and
+    stop counting against the bounds once they are pruned.
+    """
+    def __init__(self, max_size: int, max_per_key: int = 0, weights: Optional[Dict[str, int]] = None, default_weight: int = 1):
+        self.max_size = max_size
+        self.max_per_key = max_per_key  # 0 means only max_size applies
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self._queues: Dict[str, Deque[Waiter]] = {}
+        self._rotation: Deque[str] = collections.deque()  # Keys with queued waiters, head is served next
+        self._credit = 0  # Waiters the head key may still take before rotating
+        self._size = 0
+        self.last_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def weight(self, key: str) -> int:
+        return max(1, self.weights.get(key, self.default_weight))
+
+    def can_push(self, key: str, count: int = 1) -> int:
+        """How many of `count` waiters for `key` would fit right now."""
+        if self._size + count > self.max_size:
+            self._prune()
+        room = self.max_size - self._size
+        if self.max_per_key:
+            queued = self._queues.get(key)
+            room = min(room, self.max_per_key - (self._pending(queued) if queued else 0))
+        return max(0, min(count, room))
+
+    def push(self, key: str, waiter: Waiter) -> bool:
+        """Queues a waiter behind the others with the same key; False if a bound is reached."""
+        if not self.can_push(key):
+            return False
+        queued = self._queues.get(key)
+        if queued is None:
+            queued = self._queues[key] = collections.deque()
+            self._rotation.append(key)
+            if len(self._rotation) == 1:
+                self._credit = self.weight(key)
+        queued.append(waiter)
+        self._size += 1
+        self.last_loop = waiter[0]
+        return True
+
+    def pop(self) -> Optional[Waiter]:
+        """Removes and returns the next live waiter in weighted round-robin order."""
+        while self._rotation:
+            key = self._rotation[0]
+            queued = self._queues[key]
+            while queued and queued[0][1].done():
+                queued.popleft()
+                self._size -= 1
+            if not queued:
+                self._drop_head()
+                continue
+            waiter = queued.popleft()
+            self._size -= 1
+            self._credit -= 1
+            if not queued:
+                self._drop_head()
+            elif self._credit <= 0:
+                self._rotation.rotate(-1)
+                self._credit = self.weight(self._rotation[0])
+            return waiter
+        return None
+
+    def pending(self) -> int:
+        """Waiters still waiting for a grant."""
+        return sum(self._pending(queued) for queued in self._queues.values())
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _pending(queued: Deque[Waiter]) -> int:
+        return sum(1 for _, future, _ in queued if not future.done())
+
+    def _drop_head(self):
+        del self._queues[self._rotation.popleft()]
+        self._credit = self.weight(self._rotation[0]) if self._rotation else 0
+
+    def _prune(self):
+        for key in list(self._rotation):
+            queued = self._queues[key]
+            live = collections.deque(waiter for waiter in queued if not waiter[1].done())
+            self._size -= len(queued) - len(live)
+            if live:
+                self._queues[key] = live
+            else:
+                del self._queues[key]
+                head = self._rotation[0] == key
+                self._rotation.remove(key)
+                if head:
+                    self._credit = self.weight(self._rotation[0]) if self._rotation else 0
@@ -0,0 +1,155 @@
+# autoscaler.py
+
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+def poisson_quantile(mean: float, tail: float) -> int:
+    """Smallest k with P(X > k) <= tail for X ~ Poisson(mean)."""
+    if mean <= 0:
+        return 0
+    if mean > 50:
+        # Normal approximation; the exact sum underflows for large means
+        z = math.sqrt(2) * _erfinv(1 - 2 * tail)
+        return max(0, math.ceil(mean + z * math.sqrt(mean)))
+    k = 0
+    pmf = math.exp(-mean)
+    cdf = pmf
+    while 1 - cdf > tail:
+        k += 1
+        pmf *= mean / k
+        cdf += pmf
+    return k
+
+def _erfinv(y: float) -> float:
+    """Inverse error function by bisection; only used for the normal approximation."""
+    lo, hi = 0.0, 6.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if math.erf(mid) < y:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+class Autoscaler:
+    """
+    Sizes the warm pool from observed demand instead of a fixed count.
+
+    Allocation arrivals are tracked with a fast and a slow EWMA of the arrival rate,
+    and the faster of the two is used so bursts are picked up quickly but drain
+    slowly. The warm target is the number of idle browsers that covers the arrivals
+    expected while one browser launches, so that an allocation finds no warm
+    browser with probability at most `cold_probability`. Sessions recycled within
+    that window (see RECYCLE_BROWSERS) are subtracted, using the mean hold time.
+
+    Scale-up is immediate but bounded per tick. Scale-down waits until the target
+    has stayed below the idle count for `scale_down_delay` seconds and only removes
+    browsers that have been idle at least that long.
+    """
+    def __init__(self, min_warm: int, max_warm: int, cold_probability: float = 0.05, fast_window: float = 10,
+                 slow_window: float = 120, max_step_up: int = 4, max_step_down: int = 1, scale_down_delay: float = 30,
+                 recycles: bool = False):
+        self.min_warm = min_warm
+        self.max_warm = max_warm
+        self.cold_probability = cold_probability
+        self.fast_window = fast_window
+        self.slow_window = slow_window
+        self.max_step_up = max_step_up
+        self.max_step_down = max_step_down
+        self.scale_down_delay = scale_down_delay
+        self.recycles = recycles
+
+        self.rate_fast = 0.0
+        self.rate_slow = 0.0
+        self.mean_hold = 0.0
+        self.launch_seconds = 2.0  # Prior until the first launch is measured
+        self.target = min_warm
+        self.above_since: Optional[float] = None
+        self.last_decision: dict = {}
+
+        self._arrivals = 0
+        self._last_tick = time.monotonic()
+        self._session_starts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record_arrival(self):
+        with self._lock:
+            self._arrivals += 1
+
+    def session_started(self, session_id: str):
+        with self._lock:
+            self._session_starts[session_id] = time.monotonic()
+
+    def session_ended(self, session_id: str):
+        with self._lock:
+            started = self._session_starts.pop(session_id, None)
+            if started is not None:
+                hold = time.monotonic() - started
+                self.mean_hold = hold if self.mean_hold == 0 else 0.9 * self.mean_hold + 0.1 * hold
+
+    def record_launch(self, duration: float):
+        with self._lock:
+            self.launch_seconds = 0.8 * self.launch_seconds + 0.2 * duration
+
+    def decide(self, idle: int, busy: int, launching: int, capacity: int, now: Optional[float] = None) -> int:
+        """
+        Updates the demand estimate and returns how many browsers to launch (> 0)
+        or to retire (< 0). capacity is how many more browsers may be started.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            elapsed = max(now - self._last_tick, 1e-3)
+            observed = self._arrivals / elapsed
+            self._arrivals = 0
+            self._last_tick = now
+            self.rate_fast += (1 - math.exp(-elapsed / self.fast_window)) * (observed - self.rate_fast)
+            self.rate_slow += (1 - math.exp(-elapsed / self.slow_window)) * (observed - self.rate_slow)
+            rate = max(self.rate_fast, self.rate_slow)
+
+            # Arrivals that must be served while a replacement launches
+            expected = rate * self.launch_seconds
+            target = poisson_quantile(expected, self.cold_probability)
+            if self.recycles and self.mean_hold > 0:
+                target -= int(busy * self.launch_seconds / self.mean_hold)
+            target = min(max(target, self.min_warm), self.max_warm)
+            self.target = target
+
+            supply = idle + launching
+            if supply < target:
+                self.above_since = None
+                delta = min(target - supply, self.max_step_up, capacity)
+                reason = "below target"
+            elif idle > target:
+                if self.above_since is None:
+                    self.above_since = now
+                if now - self.above_since >= self.scale_down_delay:
+                    delta = -min(idle - target, self.max_step_down)
+                    reason = "above target"
+                else:
+                    delta = 0
+                    reason = "above target, holding"
+            else:
+                self.above_since = None
+                delta = 0
+                reason = "at target"
+
+            self.last_decision = {"time": time.time(), "delta": delta, "reason": reason,
+                                  "idle": idle, "busy": busy, "launching": launching}
+            return delta
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "arrival_rate_fast": self.rate_fast,
+                "arrival_rate_slow": self.rate_slow,
+                "mean_hold_seconds": self.mean_hold,
+                "offered_load": max(self.rate_fast, self.rate_slow) * self.mean_hold,
+                "launch_seconds": self.launch_seconds,
+                "cold_probability": self.cold_probability,
+                "target_warm": self.target,
+                "min_warm": self.min_warm,
+                "max_warm": self.max_warm,
+                "last_decision": self.last_decision,
+            }
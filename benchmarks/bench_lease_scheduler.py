@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of session lease extend/expire throughput.
+
+Compares the single-thread LeaseScheduler with the previous approach of one
+threading.Timer per allocation and per extension.
+
+Run from the repository root:
+    python -m benchmarks.bench_lease_scheduler --sessions 500 --extends 20
+"""
+import argparse
+import threading
+import time
+from lease_scheduler import LeaseScheduler
+
+def bench_scheduler(sessions: int, extends: int) -> dict:
+    expired = threading.Semaphore(0)
+    scheduler = LeaseScheduler(lambda resource_id, session_id: expired.release())
+
+    start = time.perf_counter()
+    for i in range(sessions):
+        scheduler.schedule(f"s{i}", i, 3600)
+    for _ in range(extends):
+        for i in range(sessions):
+            scheduler.schedule(f"s{i}", i, 3600)
+    extend_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(sessions):
+        scheduler.schedule(f"s{i}", i, 0)
+    for _ in range(sessions):
+        expired.acquire()
+    expire_elapsed = time.perf_counter() - start
+
+    return {
+        "extend_ops_per_sec": sessions * (extends + 1) / extend_elapsed,
+        "expire_ops_per_sec": sessions / expire_elapsed,
+        "threads": threading.active_count(),
+    }
+
+def bench_timers(sessions: int, extends: int) -> dict:
+    expired = threading.Semaphore(0)
+    timers = {}
+
+    def schedule(session_id, timeout):
+        old = timers.get(session_id)
+        if old:
+            old.cancel()
+        timer = threading.Timer(timeout, expired.release)
+        timers[session_id] = timer
+        timer.start()
+
+    start = time.perf_counter()
+    for _ in range(extends + 1):
+        for i in range(sessions):
+            schedule(f"s{i}", 3600)
+    extend_elapsed = time.perf_counter() - start
+    threads = threading.active_count()
+
+    start = time.perf_counter()
+    for i in range(sessions):
+        schedule(f"s{i}", 0)
+    for _ in range(sessions):
+        expired.acquire()
+    expire_elapsed = time.perf_counter() - start
+
+    return {
+        "extend_ops_per_sec": sessions * (extends + 1) / extend_elapsed,
+        "expire_ops_per_sec": sessions / expire_elapsed,
+        "threads": threads,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--extends", type=int, default=20, help="Extensions per session")
+    args = parser.parse_args()
+
+    for name, bench in (("lease_scheduler", bench_scheduler), ("threading.Timer", bench_timers)):
+        result = bench(args.sessions, args.extends)
+        print(f"{name:16} extend: {result['extend_ops_per_sec']:>12,.0f} ops/s   "
+              f"expire: {result['expire_ops_per_sec']:>10,.0f} ops/s   threads: {result['threads']}")
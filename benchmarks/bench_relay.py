@@ -0,0 +1,110 @@
+"""
+Throughput benchmark for the CDP WebSocket relay.
+
+Starts an echoing upstream and a proxy that relays through relay.py, then drives
+it with concurrent clients that keep a window of messages in flight. Reports
+messages per second and bytes per second for the queued relay and the legacy one.
+
+Run from the repository root:
+    python -m benchmarks.bench_relay --clients 10 --messages 2000 --size 256
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import aiohttp
+from aiohttp import web
+from relay import relay_websocket, relay_websocket_legacy
+
+RELAYS = {"queued": relay_websocket, "legacy": relay_websocket_legacy}
+
+async def echo_handler(request):
+    ws = web.WebSocketResponse(max_msg_size=0)
+    await ws.prepare(request)
+    async for msg in ws:
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            await ws.send_str(msg.data)
+        elif msg.type == aiohttp.WSMsgType.BINARY:
+            await ws.send_bytes(msg.data)
+    return ws
+
+async def start_site(app) -> tuple:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def run_client(session, proxy_url: str, messages: int, payload: str, window: int):
+    async with session.ws_connect(proxy_url, max_msg_size=0) as ws:
+        sent = received = 0
+        while sent < min(window, messages):
+            await ws.send_str(payload)
+            sent += 1
+        while received < messages:
+            msg = await ws.receive()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise RuntimeError(f"Relay closed early: {msg.type}")
+            received += 1
+            if sent < messages:
+                await ws.send_str(payload)
+                sent += 1
+
+async def bench(mode: str, clients: int, messages: int, size: int, window: int) -> dict:
+    upstream_app = web.Application()
+    upstream_app.router.add_get("/", echo_handler)
+    upstream_runner, upstream_port = await start_site(upstream_app)
+
+    upstream_session = aiohttp.ClientSession()
+    relay = RELAYS[mode]
+
+    async def proxy_handler(request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        async with upstream_session.ws_connect(f"http://127.0.0.1:{upstream_port}/", max_msg_size=0) as upstream:
+            await relay(ws, upstream, "bench")
+        return ws
+
+    proxy_app = web.Application()
+    proxy_app.router.add_get("/", proxy_handler)
+    proxy_runner, proxy_port = await start_site(proxy_app)
+
+    payload = "x" * size
+    try:
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                run_client(session, f"http://127.0.0.1:{proxy_port}/", messages, payload, window)
+                for _ in range(clients)
+            ])
+            elapsed = time.perf_counter() - start
+    finally:
+        await proxy_runner.cleanup()
+        await upstream_session.close()
+        await upstream_runner.cleanup()
+
+    # Every message crosses the relay twice: once each way
+    relayed = clients * messages * 2
+    return {
+        "messages_per_sec": relayed / elapsed,
+        "bytes_per_sec": relayed * size / elapsed,
+    }
+
+async def main(args):
+    for mode in args.modes:
+        result = await bench(mode, args.clients, args.messages, args.size, args.window)
+        print(f"{mode:8} {result['messages_per_sec']:>12,.0f} msg/s   {result['bytes_per_sec'] / 1e6:>10,.2f} MB/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=2000, help="Messages each client sends")
+    parser.add_argument("--size", type=int, default=256, help="Message size in bytes")
+    parser.add_argument("--window", type=int, default=16, help="Messages each client keeps in flight")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "queued"], choices=sorted(RELAYS))
+    args = parser.parse_args()
+
+    # Match main.py, which logs at INFO; the output is discarded so only formatting is measured.
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"))
+    asyncio.run(main(args))
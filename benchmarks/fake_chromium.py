@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+A stand-in for chromium-browser used by the load benchmark.
+
+Accepts the flags BrowserLauncher passes, serves /json/version and /json/list on
+the debugging port, writes DevToolsActivePort like Chromium does, and answers
+CDP commands over WebSocket through simulated_launcher.SimulatedBrowser, the
+same stand-in the in-process simulated backend uses. With --remote-debugging-pipe
+it answers on fds 3 and 4 instead and exits once the pool closes its end.
+
+Environment:
+    FAKE_CHROMIUM_STARTUP_DELAY  Seconds to sleep before listening (default: 0.5)
+    FAKE_CHROMIUM_MEMORY_MB      Memory to allocate and touch, to simulate RSS (default: 0)
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+
+# Runs as a standalone executable, so make the repository modules importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulated_launcher import SimulatedBrowser
+
+def parse_args(argv: list) -> dict:
+    options = {}
+    for arg in argv:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+    return options
+
+async def serve(options: dict, pipe: bool):
+    browser = SimulatedBrowser()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+
+    if pipe:
+        await browser.start_pipe(3, 4)
+        while browser.running and not stop.is_set():
+            await asyncio.sleep(0.1)
+        await browser.stop()
+        return
+
+    await browser.start(int(options.get("remote-debugging-port", 0)))
+
+    user_data_dir = options.get("user-data-dir")
+    if user_data_dir:
+        os.makedirs(user_data_dir, exist_ok=True)
+        with open(os.path.join(user_data_dir, "DevToolsActivePort"), "w") as f:
+            f.write(f"{browser.port}\n/devtools/browser/simulated\n")
+
+    await stop.wait()
+    await browser.stop()
+
+def main():
+    options = parse_args(sys.argv[1:])
+    time.sleep(float(os.getenv("FAKE_CHROMIUM_STARTUP_DELAY", 0.5)))
+
+    # Touch every page so the allocation shows up in RSS
+    ballast = bytearray(int(float(os.getenv("FAKE_CHROMIUM_MEMORY_MB", 0)) * 1024 * 1024))
+    for offset in range(0, len(ballast), 4096):
+        ballast[offset] = 1
+
+    asyncio.run(serve(options, "--remote-debugging-pipe" in sys.argv[1:]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+End-to-end load benchmark for the proxy, with no real Chromium or network needed.
+
+Starts main.py with benchmarks/fake_chromium.py as the browser (or, with
+--backend simulated, with the in-process simulated launcher), then runs
+concurrent clients that each allocate a browser, make CDP round trips through
+the WebSocket relay, and deallocate, for a number of iterations. Reports the
+allocation latency percentiles, allocations per second, relayed messages per
+second and proxy RSS as JSON, so runs can be compared across commits.
+
+Run from the repository root:
+    python -m benchmarks.load_test --clients 10 --iterations 20 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from proc_stats import process_rss_bytes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_CHROMIUM = os.path.join(REPO_ROOT, "benchmarks", "fake_chromium.py")
+PROXY_URL = "http://127.0.0.1:8888"
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile; 0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def start_proxy(args, work_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "CHROMIUM_BINARY": FAKE_CHROMIUM,
+        "CHROMIUM_PROFILE_BASE_DIR": os.path.join(work_dir, "profiles"),
+        "PROFILE_TEMPLATE_DIR": os.path.join(work_dir, "template"),
+        "MAX_INSTANCES": str(args.max_instances),
+        "NUM_WARM": str(args.num_warm),
+        "ALLOCATION_MODE": args.allocation_mode,
+        "FAKE_CHROMIUM_STARTUP_DELAY": str(args.startup_delay),
+        "FAKE_CHROMIUM_MEMORY_MB": str(args.memory_mb),
+        "LAUNCHER_BACKEND": "simulated" if args.backend == "simulated" else "chromium",
+        "DEBUGGING_TRANSPORT": args.transport,
+        "SIMULATED_STARTUP_DELAY": str(args.startup_delay),
+        "SESSION_JOURNAL": "",  # Without a journal main.py terminates its browsers on SIGTERM
+    })
+    return subprocess.Popen([sys.executable, "main.py"], cwd=REPO_ROOT, env=env, start_new_session=True,
+                            stdout=open(os.path.join(work_dir, "main.log"), "w"), stderr=subprocess.STDOUT)
+
+def stop_proxy(proxy: subprocess.Popen):
+    """Stops main.py, which terminates its browsers, then kills anything left in its process group."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proxy.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proxy.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            pass
+
+async def wait_for_proxy(session: aiohttp.ClientSession, proxy: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proxy.poll() is not None:
+            raise RuntimeError("main.py exited during startup")
+        try:
+            async with session.get(f"{PROXY_URL}/browsers") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("main.py did not start listening in time")
+
+async def run_client(session: aiohttp.ClientSession, args, stats: dict):
+    payload = "x" * args.payload
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        async with session.post(f"{PROXY_URL}/browser?timeout={args.lease}") as response:
+            body = await response.json() if response.status == 200 else None
+        if body is None:
+            stats["failed_allocations"] += 1
+            continue
+        stats["allocation_seconds"].append(time.perf_counter() - start)
+        session_id = body["session_id"]
+
+        try:
+            async with session.ws_connect(f"{PROXY_URL}/session/{session_id}", max_msg_size=0) as ws:
+                for message_id in range(args.round_trips):
+                    sent = time.perf_counter()
+                    await ws.send_str(json.dumps({"id": message_id, "method": "Bench.echo", "params": {"data": payload}}))
+                    reply = await ws.receive()
+                    if reply.type != aiohttp.WSMsgType.TEXT:
+                        raise RuntimeError(f"Relay closed early: {reply.type}")
+                    stats["round_trip_seconds"].append(time.perf_counter() - sent)
+        except (aiohttp.ClientError, RuntimeError) as e:
+            stats["relay_errors"] += 1
+            print(f"Relay error for session {session_id}: {e}", file=sys.stderr)
+
+        async with session.delete(f"{PROXY_URL}/browser/{session_id}") as response:
+            await response.read()
+
+async def sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        samples.append(process_rss_bytes(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+
+async def bench(args) -> dict:
+    stats = {"allocation_seconds": [], "round_trip_seconds": [], "failed_allocations": 0, "relay_errors": 0}
+    rss_samples = []
+    with tempfile.TemporaryDirectory(prefix="browser-pool-bench-") as work_dir:
+        proxy = start_proxy(args, work_dir)
+        try:
+            connector = aiohttp.TCPConnector(limit=0)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await wait_for_proxy(session, proxy, args.startup_timeout)
+                await asyncio.sleep(args.warmup)
+
+                stop = asyncio.Event()
+                sampler = asyncio.create_task(sample_rss(proxy.pid, rss_samples, stop))
+                start = time.perf_counter()
+                await asyncio.gather(*[run_client(session, args, stats) for _ in range(args.clients)])
+                elapsed = time.perf_counter() - start
+                stop.set()
+                await sampler
+        finally:
+            stop_proxy(proxy)
+
+    allocations = len(stats["allocation_seconds"])
+    # Every round trip crosses the relay twice: the command and its reply
+    relayed = len(stats["round_trip_seconds"]) * 2
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "params": vars(args),
+        "elapsed_seconds": elapsed,
+        "allocations": {
+            **summarize(stats["allocation_seconds"]),
+            "failed": stats["failed_allocations"],
+            "per_second": allocations / elapsed,
+        },
+        "cdp_round_trip_seconds": summarize(stats["round_trip_seconds"]),
+        "relay": {
+            "messages": relayed,
+            "messages_per_second": relayed / elapsed,
+            "errors": stats["relay_errors"],
+        },
+        "proxy_rss_mb": {
+            "peak": max(rss_samples, default=0) / (1024 * 1024),
+            "final": (rss_samples[-1] if rss_samples else 0) / (1024 * 1024),
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent clients")
+    parser.add_argument("--iterations", type=int, default=20, help="Allocate/relay/deallocate cycles per client")
+    parser.add_argument("--round-trips", type=int, default=20, help="CDP round trips per session")
+    parser.add_argument("--payload", type=int, default=256, help="Bytes of params per CDP command")
+    parser.add_argument("--lease", type=int, default=30, help="Session timeout requested on allocation")
+    parser.add_argument("--max-instances", type=int, default=10)
+    parser.add_argument("--num-warm", type=int, default=2)
+    parser.add_argument("--allocation-mode", default="process", choices=["process", "context"])
+    parser.add_argument("--backend", default="fake", choices=["fake", "simulated"],
+                        help="fake: fake_chromium.py processes; simulated: in-process simulated browsers")
+    parser.add_argument("--transport", default="websocket", choices=["websocket", "pipe"],
+                        help="DevTools transport between the pool and its browsers")
+    parser.add_argument("--startup-delay", type=float, default=0.5, help="Seconds the fake browser takes to start")
+    parser.add_argument("--memory-mb", type=float, default=0, help="Memory each fake browser allocates")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="Seconds to wait for main.py to listen")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds to let the warm pool fill before starting")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(bench(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
@@ -1,26 +1,150 @@
 import os
+import signal
 import subprocess
 import time
-import shutil
-from typing import Optional
-from models import BrowserInstance
-from config import CHROMIUM_ARGS, CHROMIUM_PROFILE_BASE_DIR, HEALTH_CHECK_INTERVAL
+import json
+import asyncio
+import urllib.request
+from typing import Callable, Dict, List, Optional, Tuple
+import aiohttp
+from cdp import CDPConnection, CDPError
+from launcher_backend import LauncherBackend
+from models import BrowserInstance, LaunchProfile
+from pipe_transport import PipeConnection
+from metrics import LEAKED_PROCESSES
+from proc_stats import child_map, list_pids, process_cmdline, process_start_time, process_state, process_tree_memory, process_tree_pids, session_pids
+from profile_template import ProfileTemplate
+from config import CHROMIUM_ARGS, CHROMIUM_BINARY, CHROMIUM_PROFILE_BASE_DIR, DEBUGGING_PORT_MODE, DEBUGGING_TRANSPORT, LAUNCH_READY_TIMEOUT, LAUNCH_PROBE_INTERVAL, PROFILE_CLONE_MODE, PROFILE_TEMPLATE_RETRY_INTERVAL
+from config import LAUNCH_PROFILES
 
-class BrowserLauncher:
-    def __init__(self):
+STDERR_LOG = "chromium-stderr.log"  # Written inside each instance profile
+DEVTOOLS_ACTIVE_PORT = "DevToolsActivePort"  # Chromium writes its bound debugging port here
+# Moves the pipes handed over as stdin and stdout to the fds --remote-debugging-pipe uses
+PIPE_FDS_WRAPPER = ["/bin/sh", "-c", 'exec "$@" 3<&0 4>&1 0</dev/null 1>/dev/null', "sh"]
+
+class AdoptedProcess:
+    """
+    Stands in for the subprocess.Popen of a Chromium started by a previous run of the pool.
+
+    The process is no longer our child, so its state is read from /proc and it is
+    stopped with signals instead of through a Popen handle.
+    """
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None and process_state(self.pid) in (None, "Z", "X"):
+            try:
+                os.waitpid(self.pid, os.WNOHANG)  # Reap it if it was reparented to us
+            except ChildProcessError:
+                pass
+            self.returncode = 0
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+class BrowserLauncher(LauncherBackend):
+    """Launches real Chromium processes, each with its own debugging port (or pipe) and cloned profile."""
+    def __init__(self, launch_profile: LaunchProfile):
         self.chromium_profile_dir = "/config/xdg/config/chromium"  # Or get it from your config
+        self.launch_profile = launch_profile
+        self.profile_base_dir = launch_profile.profile_base_dir
+        self.profile_template = ProfileTemplate(launch_profile.template_dir, PROFILE_CLONE_MODE, PROFILE_TEMPLATE_RETRY_INTERVAL)
+
+        # Leftovers from a previous run are purged by purge_orphans once adoption is done
+        self._unlock_chromium_profile()
 
-    def _purge_old_session_data(self):
-        """Purges old session data from the specified directory."""
-        session_data_dir = "/config/chromium_profiles"
+    def _purge_old_session_data(self, keep_profiles: frozenset = frozenset()):
+        """Purges old session data from the specified directory, except the profiles to keep."""
+        session_data_dir = self.profile_base_dir
         print("Purging old session data...")
         try:
-            shutil.rmtree(session_data_dir, ignore_errors=True)  # Use ignore_errors=True to avoid issues if the directory doesn't exist
+            if os.path.isdir(session_data_dir):
+                for entry in os.listdir(session_data_dir):
+                    profile_path = os.path.join(session_data_dir, entry)
+                    if profile_path not in keep_profiles:
+                        self.profile_template.discard(profile_path)
             os.makedirs(session_data_dir, exist_ok=True) #recreate to avoid issues later
             print("Session data purged.")
         except Exception as e:
             print(f"Error purging session data: {e}")
 
+    def _owned_profile(self, pid: int) -> Optional[str]:
+        """The instance profile a process was started with, if it is a Chromium browser of this pool."""
+        for arg in process_cmdline(pid):
+            if arg.startswith("--user-data-dir="):
+                profile_path = arg.split("=", 1)[1]
+                if os.path.dirname(profile_path.rstrip("/")) == self.profile_base_dir.rstrip("/"):
+                    return profile_path
+                return None
+        return None
+
+    def _stray_profile(self, pid: int) -> bool:
+        """
+        Whether a process runs on a profile in CHROMIUM_PROFILE_BASE_DIR that no
+        launch profile owns, like the flat profile-NNNN directories used before
+        launch profiles existed.
+        """
+        base_dir = os.path.normpath(CHROMIUM_PROFILE_BASE_DIR)
+        for arg in process_cmdline(pid):
+            if arg.startswith("--user-data-dir="):
+                relative = os.path.relpath(os.path.normpath(arg.split("=", 1)[1]), base_dir)
+                return relative != "." and not relative.startswith("..") and relative.split(os.sep)[0] not in LAUNCH_PROFILES
+        return False
+
+    def purge_orphans(self, adopted: List[BrowserInstance]):
+        """Kills browsers of a previous run that were not adopted and deletes every other profile."""
+        keep_pids = {instance.process.pid for instance in adopted}
+        own_pid = os.getpid()
+        for pid in list_pids():
+            if pid in keep_pids or pid == own_pid or process_state(pid) in (None, "Z"):
+                continue
+            # Only the browser process carries --remote-debugging-*; its helpers go with its process group
+            if (self._owned_profile(pid) or self._stray_profile(pid)) and any(arg.startswith(("--remote-debugging-port=", "--remote-debugging-pipe")) for arg in process_cmdline(pid)):
+                print(f"Killing orphaned browser process {pid}.")
+                self._stop_process_tree(AdoptedProcess(pid), f"orphaned browser {pid}", grace=0)
+        self._purge_old_session_data(frozenset(instance.profile_path for instance in adopted))
+
+    def adopt(self, record: dict) -> Optional[BrowserInstance]:
+        """Adopts the journaled browser if its process still runs with the same port and profile and DevTools answers."""
+        pid, debugging_port, profile_path = record["pid"], record["debugging_port"], record["profile_path"]
+        instance_id = record.get("instance_id", debugging_port)
+        cmdline = process_cmdline(pid)
+        if (process_state(pid) in (None, "Z") or f"--remote-debugging-port={self._port_argument(instance_id)}" not in cmdline
+                or f"--user-data-dir={profile_path}" not in cmdline):
+            return None
+        version = self._probe_devtools(debugging_port, timeout=1)
+        if version is None:
+            return None
+        return BrowserInstance(
+            process=AdoptedProcess(pid),
+            debugging_port=debugging_port,
+            last_used=record.get("last_used") or time.time(),
+            profile_path=profile_path,
+            instance_id=instance_id,
+            ws_debugger_url=version.get("webSocketDebuggerUrl")
+        )
+
     def _unlock_chromium_profile(self):
         """Removes Chromium lock files to unlock the profile."""
         if os.path.isdir(self.chromium_profile_dir):
@@ -38,38 +162,304 @@ class BrowserLauncher:
         else:
             print("Chromium profile directory not found. Please check the path.")
 
-    def launch_browser(self, debugging_port: int) -> Optional[BrowserInstance]:
-        """Launches a new browser instance with a dedicated profile, after purging data and unlocking profiles."""
-        
-        # Purge old session data and unlock profile before launching each browser
-        self._purge_old_session_data()
-        self._unlock_chromium_profile()
+    def _chrome_command(self, debugging_port: Optional[int], profile_path: str) -> list:
+        """The Chromium command line; DevTools goes over fds 3 and 4 instead of a port if debugging_port is None."""
+        return [
+            CHROMIUM_BINARY,
+            "--disable-gpu",
+            "--no-first-run",
+            f"--remote-debugging-port={debugging_port}" if debugging_port is not None else "--remote-debugging-pipe",
+            f"--user-data-dir={profile_path}"  # Use a dedicated profile
+        ] + CHROMIUM_ARGS + self.launch_profile.args
+
+    def discard_profile(self, profile_path: str):
+        """Deletes an instance profile, leaving the template untouched."""
+        self.profile_template.discard(profile_path)
+
+    def is_ready(self, instance: BrowserInstance) -> bool:
+        if instance.pipe is not None:
+            return not instance.pipe.closed
+        return self._probe_devtools(instance.debugging_port, timeout=1) is not None
+
+    def is_alive(self, instance: BrowserInstance) -> bool:
+        return instance.process.poll() is None
+
+    def stop(self, instance: BrowserInstance):
+        self._stop_process_tree(instance.process, f"browser on {instance.endpoint}")
+        if instance.pipe is not None:
+            instance.pipe.close()
+
+    def terminate(self, instance: BrowserInstance):
+        """Stops Chromium with all its helper processes and deletes its profile."""
+        self.stop(instance)
+
+        try:
+            self.discard_profile(instance.profile_path)
+            print(f"Removed profile directory: {instance.profile_path}")
+        except Exception as e:
+            print(f"Error removing profile directory {instance.profile_path}: {e}")
+
+    def _stop_process_tree(self, process, description: str, grace: float = 5):
+        """
+        Stops a browser's whole process group, then makes sure none of its processes survive.
+
+        Chromium runs in its own session and process group (start_new_session), so
+        killpg reaches the renderer, GPU and zygote processes too, which otherwise
+        outlive the browser and keep writing to its profile. Descendants are recorded
+        before signalling because they are reparented once the browser exits. Any
+        that left the process group are killed one by one and counted as leaked.
+        """
+        pid = process.pid
+        tree = {p: process_start_time(p) for p in set(process_tree_pids(pid)) | set(session_pids(pid)) if p != pid}
+        self._signal_group(pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            if grace:
+                print(f"Force killing {description}")
+        # Also reaches helpers that ignore SIGTERM or were still shutting down
+        self._signal_group(pid, signal.SIGKILL)
+        process.kill()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            print(f"Process {pid} of the {description} did not exit after SIGKILL.")
+
+        for p in session_pids(pid):
+            tree.setdefault(p, process_start_time(p))
+        tree.pop(pid, None)
+        survivors = self._wait_for_exit(tree, timeout=1)
+        if not survivors:
+            return
+        LEAKED_PROCESSES.inc(len(survivors))
+        print(f"{len(survivors)} processes of the {description} outlived its process group; killing them.")
+        for p in survivors:
+            try:
+                os.kill(p, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        remaining = self._wait_for_exit(survivors, timeout=1)
+        if remaining:
+            print(f"Processes {sorted(remaining)} of the {description} are still running.")
+
+    @staticmethod
+    def _signal_group(pgid: int, sig: int):
+        try:
+            os.killpg(pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass  # The group is already gone
+
+    @staticmethod
+    def _wait_for_exit(processes: Dict[int, Optional[int]], timeout: float) -> Dict[int, Optional[int]]:
+        """Waits for the processes (pid: start time) to exit and returns those still running at the deadline."""
+        deadline = time.monotonic() + timeout
+        while True:
+            running = {}
+            for pid, start_time in processes.items():
+                state = process_state(pid)
+                if state is None or process_start_time(pid) != start_time:
+                    continue  # Gone, or the pid now belongs to another process
+                if state in ("Z", "X"):
+                    try:
+                        os.waitpid(pid, os.WNOHANG)  # Ours to reap when the proxy runs as PID 1
+                    except ChildProcessError:
+                        pass
+                    continue
+                running[pid] = start_time
+            if not running or time.monotonic() >= deadline:
+                return running
+            processes = running
+            time.sleep(0.05)
+
+    def resource_usage(self, instance: BrowserInstance) -> Dict[str, int]:
+        return process_tree_memory(instance.process.pid)
 
-        profile_path = os.path.join(CHROMIUM_PROFILE_BASE_DIR, f"profile-{debugging_port}")
-        os.makedirs(profile_path, exist_ok=True)
+    def resource_usages(self, instances: List[BrowserInstance]) -> Dict[int, Dict[str, int]]:
+        children = child_map()  # One /proc scan for every tree
+        return {instance.instance_id: process_tree_memory(instance.process.pid, children) for instance in instances}
 
+    def _start_process(self, instance_id: int) -> tuple:
+        """Prepares the profile and spawns Chromium without waiting for it; returns the process, profile and pipe."""
+        # Port 0 lets the template build run next to live browsers
+        self.profile_template.ensure(
+            lambda user_data_dir: self._chrome_command(0, user_data_dir),
+            stop_process=lambda process: self._stop_process_tree(process, "profile template build", grace=10)
+        )
+
+        profile_path = os.path.join(self.profile_base_dir, f"profile-{instance_id}")
+        self.profile_template.clone(profile_path)
+        try:
+            # Left behind when a crashed browser is restarted in its profile; it names the old port
+            os.remove(os.path.join(profile_path, DEVTOOLS_ACTIVE_PORT))
+        except FileNotFoundError:
+            pass
+
+        if DEBUGGING_TRANSPORT == "pipe":
+            return self._start_piped_process(profile_path)
+
+        chrome_cmd = self._chrome_command(self._port_argument(instance_id), profile_path)
+        # Own session and no pipes back to us, so the browser outlives a restart of the pool
+        with open(os.path.join(profile_path, STDERR_LOG), "wb") as stderr_log:
+            chrome_process = subprocess.Popen(chrome_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                              stderr=stderr_log, start_new_session=True)
+        return chrome_process, profile_path, None
+
+    def _start_piped_process(self, profile_path: str) -> tuple:
+        """Spawns Chromium with --remote-debugging-pipe; the browser exits with the pool, which owns the other ends."""
+        to_browser, from_pool = os.pipe()
+        to_pool, from_browser = os.pipe()
+        try:
+            with open(os.path.join(profile_path, STDERR_LOG), "wb") as stderr_log:
+                chrome_process = subprocess.Popen(PIPE_FDS_WRAPPER + self._chrome_command(None, profile_path),
+                                                  stdin=to_browser, stdout=from_browser, stderr=stderr_log,
+                                                  start_new_session=True)
+        except Exception:
+            os.close(from_pool)
+            os.close(to_pool)
+            raise
+        finally:
+            os.close(to_browser)
+            os.close(from_browser)
+        return chrome_process, profile_path, PipeConnection.open(to_pool, from_pool)
+
+    @staticmethod
+    def _port_argument(instance_id: int) -> int:
+        """The --remote-debugging-port value: the instance ID itself, or 0 to let the OS pick a free port."""
+        return 0 if DEBUGGING_PORT_MODE == "auto" else instance_id
+
+    def _devtools_port(self, instance_id: int, profile_path: str) -> Optional[int]:
+        """The port DevTools listens on, or None while Chromium has not yet written DevToolsActivePort."""
+        if DEBUGGING_PORT_MODE != "auto":
+            return instance_id
+        try:
+            with open(os.path.join(profile_path, DEVTOOLS_ACTIVE_PORT)) as f:
+                return int(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def _launch_failed(self, chrome_process: subprocess.Popen, instance_id: int, pipe: Optional[PipeConnection] = None):
+        """Reports why a launch never became ready and makes sure the process is gone."""
+        if chrome_process.poll() is not None:
+            try:
+                with open(os.path.join(self.profile_base_dir, f"profile-{instance_id}", STDERR_LOG), "rb") as f:
+                    stderr = f.read()[-4096:].decode(errors="replace")
+            except OSError:
+                stderr = ""
+            print(f"Chromium process failed to start (browser {instance_id}): {stderr}")
+        else:
+            print(f"Chromium of browser {instance_id} did not answer DevTools within {LAUNCH_READY_TIMEOUT} seconds.")
+        self._stop_process_tree(chrome_process, f"browser {instance_id}", grace=0)
+        if pipe is not None:
+            pipe.close()
+
+    def _probe_devtools(self, debugging_port: int, timeout: float) -> Optional[dict]:
+        """Returns the /json/version payload if DevTools is accepting connections."""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{debugging_port}/json/version", timeout=timeout) as resp:
+                return json.loads(resp.read())
+        except (OSError, ValueError):
+            return None
+
+    async def _pipe_version(self, pipe: PipeConnection) -> Optional[dict]:
+        """Browser.getVersion over the pipe. Chromium reads it once it is up, so there is nothing to poll."""
+        cdp = CDPConnection(pipe.open_channel())
+        try:
+            return await cdp.send("Browser.getVersion", timeout=LAUNCH_READY_TIMEOUT)
+        except (CDPError, asyncio.TimeoutError):
+            return None  # Also raised when the browser exits and closes the pipe
+        finally:
+            await cdp.close()
+
+    def wait_until_ready(self, chrome_process: subprocess.Popen, instance_id: int, profile_path: str,
+                         pipe: Optional[PipeConnection] = None) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        Polls /json/version with a short backoff until DevTools answers, the process exits, or the deadline passes.
+
+        Returns the debugging port and the /json/version payload, or (None, None).
+        On a pipe the port is None and the payload is the result of Browser.getVersion.
+        """
+        if pipe is not None:
+            return None, asyncio.run(self._pipe_version(pipe))
+        deadline = time.monotonic() + LAUNCH_READY_TIMEOUT
+        delay = LAUNCH_PROBE_INTERVAL
+        while time.monotonic() < deadline and chrome_process.poll() is None:
+            debugging_port = self._devtools_port(instance_id, profile_path)
+            if debugging_port is not None:
+                version = self._probe_devtools(debugging_port, timeout=max(delay, 0.5))
+                if version is not None:
+                    return debugging_port, version
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return None, None
+
+    async def wait_until_ready_async(self, chrome_process: subprocess.Popen, instance_id: int, profile_path: str,
+                                     pipe: Optional[PipeConnection] = None) -> Tuple[Optional[int], Optional[dict]]:
+        """Async variant of wait_until_ready that never blocks the event loop."""
+        if pipe is not None:
+            return None, await self._pipe_version(pipe)
+        deadline = time.monotonic() + LAUNCH_READY_TIMEOUT
+        delay = LAUNCH_PROBE_INTERVAL
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline and chrome_process.poll() is None:
+                debugging_port = self._devtools_port(instance_id, profile_path)
+                if debugging_port is not None:
+                    url = f"http://127.0.0.1:{debugging_port}/json/version"
+                    try:
+                        async with session.get(url, timeout=aiohttp.ClientTimeout(total=max(delay, 0.5))) as resp:
+                            if resp.status == 200:
+                                return debugging_port, await resp.json(content_type=None)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                        pass
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+        return None, None
+
+    def launch_browser(self, instance_id: int) -> Optional[BrowserInstance]:
+        """Launches a new browser instance and returns it once DevTools answers on its debugging port."""
+        try:
+            chrome_process, profile_path, pipe = self._start_process(instance_id)
+
+            debugging_port, version = self.wait_until_ready(chrome_process, instance_id, profile_path, pipe)
+            if version is None:
+                self._launch_failed(chrome_process, instance_id, pipe)
+                return None
+
+            return BrowserInstance(
+                process=chrome_process,
+                debugging_port=debugging_port,
+                last_used=time.time(),
+                profile_path=profile_path,
+                instance_id=instance_id,
+                ws_debugger_url=version.get("webSocketDebuggerUrl"),
+                pipe=pipe
+            )
+        except Exception as e:
+            print(f"Failed to launch browser: {e}")
+            return None
+
+    async def launch_browser_async(self, reserve_instance_id: Callable[[], int]) -> Optional[BrowserInstance]:
+        """Launches a new browser instance from the event loop, returning it once DevTools answers."""
         try:
-            chrome_cmd = [
-                "chromium-browser",
-                "--disable-gpu",
-                "--no-first-run",
-                f"--remote-debugging-port={debugging_port}",
-                #f"--user-data-dir={profile_path}"  # Use a dedicated profile
-            ] + CHROMIUM_ARGS
-            chrome_process = subprocess.Popen(chrome_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # Check if the process started successfully
-            time.sleep(HEALTH_CHECK_INTERVAL)
-            if chrome_process.poll() is not None:
-                stderr = chrome_process.stderr.read().decode()
-                print(f"Chromium process failed to start (port {debugging_port}): {stderr}")
+            loop = asyncio.get_running_loop()
+            # Reserving the ID takes the pool lock and profile housekeeping touches the disk, so keep both off the loop.
+            def start() -> tuple:
+                instance_id = reserve_instance_id()
+                return (instance_id, *self._start_process(instance_id))
+            instance_id, chrome_process, profile_path, pipe = await loop.run_in_executor(None, start)
+
+            debugging_port, version = await self.wait_until_ready_async(chrome_process, instance_id, profile_path, pipe)
+            if version is None:
+                await loop.run_in_executor(None, self._launch_failed, chrome_process, instance_id, pipe)
                 return None
 
             return BrowserInstance(
                 process=chrome_process,
                 debugging_port=debugging_port,
                 last_used=time.time(),
-                profile_path=profile_path
+                profile_path=profile_path,
+                instance_id=instance_id,
+                ws_debugger_url=version.get("webSocketDebuggerUrl"),
+                pipe=pipe
             )
         except Exception as e:
             print(f"Failed to launch browser: {e}")
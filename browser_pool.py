@@ -1,140 +1,475 @@
+import asyncio
+import aiohttp
 import os
-import subprocess
 import queue
 import threading
 import time
 import uuid
-from typing import List, Optional, Dict, Tuple, Callable, Any
-from models import BrowserInstance
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple, Any
+from models import BrowserInstance, LaunchProfile
 from config import *
+from admission_queue import AdmissionQueue
+from autoscaler import Autoscaler
 from browser_launcher import BrowserLauncher
+from simulated_launcher import SimulatedLauncher
+from browser_reset import reset_browser
+from cdp import CDPConnection, CDPError
+from memory_budget import MemoryBudget
+from metrics import HEALTH_CHECK_FAILURES_TOTAL, LAUNCH_SECONDS, RESTARTS, SESSION_TIMEOUTS, TEARDOWN_SECONDS
 from resource_pool import ResourcePool
+from session_journal import SessionJournal
+
+LAUNCHER_BACKENDS = {"chromium": BrowserLauncher, "simulated": SimulatedLauncher}
 
 class BrowserPool(ResourcePool):
-    def __init__(self):
-        self.browser_launcher = BrowserLauncher()
+    def __init__(self, launch_profile: LaunchProfile, memory_budget: MemoryBudget):
+        self.launch_profile = launch_profile
+        self.memory_budget = memory_budget
+        memory_budget.register(self)
+        self.browser_launcher = LAUNCHER_BACKENDS[LAUNCHER_BACKEND](launch_profile)
         self.session_browser_map: Dict[str, int] = {}
-        self.next_available_port = DEBUGGING_PORT_START
-        self.available_ports = queue.Queue()
+        # Browsers are keyed by instance ID, which is their debugging port unless the OS assigns ports or there are none
+        fixed_ports = DEBUGGING_PORT_MODE == "fixed" and DEBUGGING_TRANSPORT == "websocket"
+        self.first_instance_id = launch_profile.debugging_port_start if fixed_ports else 1
+        self.next_instance_id = self.first_instance_id
+        self.available_instance_ids = queue.Queue()
         self.all_resources_occupied = False
         self._lock_owner = None
+        self.closed = False  # Set by shutdown(); stops the warm pool from launching more browsers
+        self._restarting = set()  # Ports whose browser is being restarted by the health check
+        autoscaler = Autoscaler(
+            min_warm=launch_profile.min_warm,
+            max_warm=min(AUTOSCALE_MAX_WARM, launch_profile.max_instances),
+            cold_probability=AUTOSCALE_COLD_PROBABILITY,
+            fast_window=AUTOSCALE_FAST_WINDOW,
+            slow_window=AUTOSCALE_SLOW_WINDOW,
+            max_step_up=AUTOSCALE_MAX_STEP_UP,
+            max_step_down=AUTOSCALE_MAX_STEP_DOWN,
+            scale_down_delay=AUTOSCALE_SCALE_DOWN_DELAY,
+            recycles=RECYCLE_BROWSERS
+        )
 
-        if not os.path.exists(CHROMIUM_PROFILE_BASE_DIR):
-            os.makedirs(CHROMIUM_PROFILE_BASE_DIR)
+        if not os.path.exists(launch_profile.profile_base_dir):
+            os.makedirs(launch_profile.profile_base_dir)
+
+        # Context mode keeps its sessions in ContextPool, which is not journaled, and
+        # browsers on a pipe exit with the proxy, so there is nothing to re-adopt
+        journal = None
+        if launch_profile.journal_path and ALLOCATION_MODE == "process" and DEBUGGING_TRANSPORT == "websocket":
+            journal = SessionJournal(launch_profile.journal_path, self.journal_snapshot)
 
         super().__init__(
-            max_instances=MAX_INSTANCES,
+            max_instances=launch_profile.max_instances,
             create_resource_func=self.create_browser,
             cleanup_resource_func=self.cleanup_browser,
             health_check_func=self.check_browser_health,
-            warm_resources=NUM_WARM,
+            warm_resources=launch_profile.min_warm,
             health_check_interval=HEALTH_CHECK_INTERVAL,
-            scale_down_interval=SCALE_DOWN_INTERVAL
+            scale_down_interval=SCALE_DOWN_INTERVAL,
+            reaper_workers=REAPER_WORKERS,
+            reaper_queue_size=REAPER_QUEUE_SIZE,
+            autoscaler=autoscaler,
+            admission_queue=AdmissionQueue(ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_PER_KEY, ADMISSION_WEIGHTS),
+            journal=journal
         )
 
+    def journal_snapshot(self) -> List[dict]:
+        """The browser table as written to the session journal; lease deadlines are wall-clock times."""
+        with self.lock:
+            now = time.time()
+            records = []
+            for instance_id, instance in self.resources.items():
+                if not instance.is_active:
+                    continue
+                remaining = self.lease_scheduler.remaining(instance.session_id) if instance.session_id else None
+                records.append({
+                    "instance_id": instance_id,
+                    "debugging_port": instance.debugging_port,
+                    "pid": instance.process.pid,
+                    "profile_path": instance.profile_path,
+                    "session_id": instance.session_id,
+                    "recycling": instance.session_id is not None and instance.session_id not in self.sessions,
+                    "timeout": instance.timeout,
+                    "deadline": None if remaining is None else now + remaining,
+                    "last_used": instance.last_used,
+                    "uses": instance.uses,
+                })
+            return records
+
+    def restore_resources(self):
+        """
+        Re-adopts the browsers recorded in the session journal and purges everything else.
+
+        Browsers are probed in parallel. Sessions get their remaining lease back,
+        browsers that were being reset are reset again, and leases that ran out
+        while the pool was down expire right away.
+        """
+        start = time.monotonic()
+        records = self.journal.load() if self.journal else []
+        if records:
+            with ThreadPoolExecutor(max_workers=min(32, len(records))) as executor:
+                instances = list(executor.map(self.browser_launcher.adopt, records))
+        else:
+            instances = []
+
+        adopted = []
+        with self.lock:
+            now = time.time()
+            for record, instance in zip(records, instances):
+                if instance is None:
+                    continue
+                instance.uses = record.get("uses", 0)
+                instance.timeout = record.get("timeout")
+                self.resources[instance.instance_id] = instance
+                adopted.append(instance)
+                session_id = record.get("session_id")
+                if session_id and record.get("recycling"):
+                    instance.session_id = session_id
+                    if not self.reaper.submit(instance, work=self._recycle_browser, spill=False):
+                        self.terminate_resource(instance.instance_id)
+                elif session_id:
+                    instance.session_id = session_id
+                    self.sessions[session_id] = instance.instance_id
+                    self.session_browser_map[session_id] = instance.instance_id
+                    self.autoscaler.session_started(session_id)
+                    if record.get("deadline") is not None:
+                        self.lease_scheduler.schedule(session_id, instance.instance_id, max(0.0, record["deadline"] - now))
+
+            if self.resources:
+                self.next_instance_id = max(self.next_instance_id, max(self.resources) + 1)
+            for instance_id in range(self.first_instance_id, self.next_instance_id):
+                if instance_id not in self.resources:
+                    self.available_instance_ids.put(instance_id)
+
+        self.browser_launcher.purge_orphans(adopted)
+        if records:
+            print(f"Re-adopted {len(adopted)} of {len(records)} journaled {self.launch_profile.name} browsers in {time.monotonic() - start:.2f}s.")
+        self._journal_changed()
+
+    def shutdown(self):
+        """
+        Called when the proxy stops. With a session journal the browsers keep running
+        for the next start to re-adopt; without one they are terminated.
+        """
+        with self.lock:
+            self.closed = True
+        if self.journal:
+            self.journal.flush()
+            print("Session journal written; browsers left running for re-adoption.")
+            return
+
+        # Let in-flight launches register and queued teardowns and resets finish, so nothing is missed
+        deadline = time.monotonic() + LAUNCH_READY_TIMEOUT
+        while self.launching and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.reaper.drain(max(deadline - time.monotonic(), 0))
+        with self.lock:
+            instances = [instance for instance in self.resources.values() if instance.is_active]
+            for instance in instances:
+                instance.is_active = False
+        for instance in instances:
+            self.cleanup_browser(instance)
+        print(f"Terminated {len(instances)} browsers on shutdown.")
+
+    def _launch_slots(self) -> int:
+        slots = super()._launch_slots()
+        room = self.memory_budget.room(self)
+        return slots if room is None else min(slots, room)
+
+    def evict_browser(self, instance_id: int, session_id: Optional[str]) -> bool:
+        """Terminates a browser to free memory if it is still idle (session_id None) or still serves session_id."""
+        with self.lock:
+            instance = self.resources.get(instance_id)
+            if instance is None or not instance.is_active or instance.session_id != session_id:
+                return False
+            if session_id is not None:
+                if session_id not in self.sessions:
+                    return False  # Released meanwhile and queued for a reset
+                self.session_browser_map.pop(session_id, None)
+            return self.terminate_resource(instance_id)
+
+    def _reserve_instance_id(self) -> int:
+        """Takes a recycled instance ID, or the next unused one."""
+        with self.lock:
+            if self.available_instance_ids.empty():
+                instance_id = self.next_instance_id
+                self.next_instance_id += 1
+            else:
+                instance_id = self.available_instance_ids.get()
+            return instance_id
+
     def create_browser(self, resource_id: Optional[int] = None) -> Optional[BrowserInstance]:
         """Creates a new browser instance."""
         if resource_id is None:
-          if self.available_ports.empty():
-              debugging_port = self.next_available_port
-              self.next_available_port += 1
-          else:
-              debugging_port = self.available_ports.get()
+          instance_id = self._reserve_instance_id()
         else:
-          debugging_port = resource_id
+          instance_id = resource_id
 
-        instance = self.browser_launcher.launch_browser(debugging_port)
+        start = time.monotonic()
+        instance = self.browser_launcher.launch_browser(instance_id)
         if instance:
+            LAUNCH_SECONDS.observe(time.monotonic() - start)
+            self.autoscaler.record_launch(time.monotonic() - start)
             return instance
         else:
-            print(f"Failed to launch browser at port {debugging_port}.")
+            print(f"Failed to launch browser {instance_id}.")
             if resource_id is None:
-              self.available_ports.put(debugging_port)
+              self.available_instance_ids.put(instance_id)
             return None
 
+    async def create_browser_async(self) -> Optional[BrowserInstance]:
+        """Creates a new browser instance on the event loop, returning once DevTools answers."""
+        instance_id = None
+
+        def reserve() -> int:
+            # Runs on the launcher's executor thread, since the pool lock must not be taken on the loop
+            nonlocal instance_id
+            instance_id = self._reserve_instance_id()
+            return instance_id
+
+        start = time.monotonic()
+        instance = await self.browser_launcher.launch_browser_async(reserve)
+        if instance:
+            LAUNCH_SECONDS.observe(time.monotonic() - start)
+            self.autoscaler.record_launch(time.monotonic() - start)
+            return instance
+        print(f"Failed to launch browser {instance_id}.")
+        if instance_id is not None:
+            self.available_instance_ids.put(instance_id)
+        return None
+
     def cleanup_browser(self, instance: BrowserInstance):
         """Cleans up a browser instance."""
-        try:
-            instance.process.terminate()
-            instance.process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            print(f"Force killing browser process at port {instance.debugging_port}")
-            instance.process.kill()
+        start = time.monotonic()
+        self.browser_launcher.terminate(instance)
+        TEARDOWN_SECONDS.observe(time.monotonic() - start)
+
+    def _release_instance_id(self, instance: BrowserInstance):
+        """Called by the reaper once a browser is gone, making its instance ID (and fixed port) reusable."""
+        with self.lock:
+            self.available_instance_ids.put(instance.instance_id)
+            self._dispatch_waiters()
+
+    def recycle_resource(self, resource_id: int) -> bool:
+        """
+        Ends a browser's session and queues it to be reset and handed out again.
+
+        Without RECYCLE_BROWSERS, or once the browser has served RECYCLE_MAX_REUSES
+        sessions, it is terminated instead.
+        """
+        with self.lock:
+            resource = self.resources.get(resource_id)
+            if resource is None or not resource.is_active or resource.session_id is None:
+                print(f"No assigned resource {resource_id} found to recycle.")
+                return False
+            if not RECYCLE_BROWSERS or not (resource.ws_debugger_url or resource.pipe) or resource.uses + 1 >= RECYCLE_MAX_REUSES:
+                return self.terminate_resource(resource_id)
+            # The reset never runs on the caller's thread; with a full reaper queue the browser is replaced instead
+            if not self.reaper.submit(resource, work=self._recycle_browser, spill=False):
+                print(f"Reaper queue is full; terminating resource {resource_id} instead of recycling it.")
+                return self.terminate_resource(resource_id)
+
+            # The old session stops being valid now, but session_id stays set until the
+            # reset is done so the browser is not handed out in its used state
+            self.lease_scheduler.cancel(resource.session_id)
+            self.sessions.pop(resource.session_id, None)
+            self.session_browser_map.pop(resource.session_id, None)
+            self._session_ended(resource.session_id)
+            self._journal_changed()
+            print(f"Resource {resource_id} released; reset queued.")
+            return True
+
+    def _recycle_browser(self, instance: BrowserInstance):
+        """Runs on a reaper thread: resets the browser over CDP and returns it to the idle set."""
+        rss_mb = self.browser_launcher.resource_usage(instance)["rss_bytes"] / (1024 * 1024)
+        if rss_mb > RECYCLE_MAX_RSS_MB:
+            print(f"Browser on {instance.endpoint} uses {rss_mb:.0f} MB, replacing it instead of recycling.")
+            reset = False
+        else:
+            try:
+                reset = asyncio.run(reset_browser(instance.ws_debugger_url, RECYCLE_RESET_TIMEOUT, instance.pipe))
+            except Exception as e:
+                print(f"Failed to reset browser on {instance.endpoint}: {e}")
+                reset = False
+
+        with self.lock:
+            if self.resources.get(instance.instance_id) is not instance or not instance.is_active:
+                return  # Restarted or terminated while it was being reset
+            if not reset:
+                self.terminate_resource(instance.instance_id)
+                return
+            instance.uses += 1
+            instance.session_id = None
+            instance.timeout = None
+            instance.last_used = time.time()
+            self._journal_changed()
+            print(f"Browser on {instance.endpoint} recycled ({instance.uses} sessions served).")
+            self._dispatch_waiters()
+
+    def start_health_check_thread(self):
+        """Probes all browsers concurrently from an event loop of their own, without holding the pool lock."""
+        thread = threading.Thread(target=lambda: asyncio.run(self._health_check_loop()),
+                                  name=f"health-{self.launch_profile.name}", daemon=True)
+        thread.start()
 
+    async def _health_check_loop(self):
+        semaphore = asyncio.Semaphore(HEALTH_CHECK_CONCURRENCY)
+        async with aiohttp.ClientSession() as session:
+            while not self.closed:
+                start = time.monotonic()
+                with self.lock:
+                    instances = [r for instance_id, r in self.resources.items() if r.is_active and instance_id not in self._restarting]
+                states = await asyncio.gather(*(self._probe_browser(session, semaphore, instance) for instance in instances))
+                for instance, state in zip(instances, states):
+                    self.check_browser_health(instance, state)
+                await asyncio.sleep(max(self.health_check_interval - (time.monotonic() - start), 0))
+
+    async def _probe_browser(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, instance: BrowserInstance) -> str:
+        """Returns "healthy", "exited", or "unresponsive" if Browser.getVersion gets no answer within HEALTH_CHECK_TIMEOUT."""
+        if not self.browser_launcher.is_alive(instance):
+            return "exited"
+        if not instance.ws_debugger_url and instance.pipe is None:
+            return "healthy"
+        async with semaphore:
+            try:
+                if instance.pipe is not None:
+                    connection = CDPConnection(instance.pipe.open_channel())
+                else:
+                    connection = await asyncio.wait_for(
+                        CDPConnection.connect(session, instance.ws_debugger_url, timeout=HEALTH_CHECK_TIMEOUT), HEALTH_CHECK_TIMEOUT)
+                try:
+                    await connection.send("Browser.getVersion", timeout=HEALTH_CHECK_TIMEOUT)
+                finally:
+                    await connection.close()
+                return "healthy"
+            except (aiohttp.ClientError, asyncio.TimeoutError, CDPError, OSError):
+                return "unresponsive"
+
+    def check_browser_health(self, instance: BrowserInstance, state: Optional[str] = None):
+        """
+        Acts on a probe result, checking only that the process runs if none is given.
+
+        Exited browsers are restarted at once, unresponsive ones after
+        HEALTH_CHECK_FAILURES failed probes in a row. Restarts run on threads of
+        their own so a slow launch delays neither allocations nor other checks.
+        """
+        if state is None:
+            state = "healthy" if self.browser_launcher.is_alive(instance) else "exited"
+        if state == "healthy":
+            instance.health_failures = 0
+            return
+        if state == "unresponsive":
+            HEALTH_CHECK_FAILURES_TOTAL.inc()
+            instance.health_failures += 1
+            if instance.health_failures < HEALTH_CHECK_FAILURES:
+                return
+            print(f"Browser on {instance.endpoint} did not answer {instance.health_failures} health checks in a row. Restarting it...")
+        else:
+            print(f"Browser on {instance.endpoint} has exited. Attempting to restart...")
+
+        with self.lock:
+            instance_id = instance.instance_id
+            if self.resources.get(instance_id) is not instance or not instance.is_active or instance_id in self._restarting:
+                return
+            self._restarting.add(instance_id)
+        threading.Thread(target=self._restart_browser, args=(instance,), daemon=True).start()
+
+    def _restart_browser(self, instance: BrowserInstance):
+        """Replaces a crashed or hung browser under the same instance ID, keeping its session."""
+        instance_id, endpoint = instance.instance_id, instance.endpoint
         try:
-            import shutil
-            shutil.rmtree(instance.profile_path)
-            print(f"Removed profile directory: {instance.profile_path}")
-        except Exception as e:
-            print(f"Error removing profile directory {instance.profile_path}: {e}")
-
-    def check_browser_health(self, instance: BrowserInstance):
-        """Checks the health of a browser instance and restarts it if necessary."""
-        if instance.process.poll() is not None:
-            print(f"Browser on port {instance.debugging_port} has exited. Attempting to restart...")
             instance.startup_attempts += 1
-            if instance.startup_attempts < MAX_STARTUP_ATTEMPTS:
-                new_instance = self.browser_launcher.launch_browser(instance.debugging_port)
-                if new_instance:
-                    if self.lock.acquire(timeout=5):
-                        try:
-                            # Check if the current thread is the lock owner
-                            if self.lock._is_owned():
-                              self.resources[instance.debugging_port] = new_instance
-                              self._lock_owner = threading.current_thread()
-                            else:
-                              self.resources[instance.debugging_port] = new_instance
-                              self._lock_owner = threading.current_thread()
-                        finally:
-                            self.lock.release()
-                    else:
-                        print(f"Failed to acquire lock to update browser on port {instance.debugging_port}.")
-                        return
+            if instance.startup_attempts >= MAX_STARTUP_ATTEMPTS:
+                print(f"Max restart attempts reached for browser on {endpoint}.")
+                self.handle_failed_restart(instance)
+                return
 
-                    print(f"Browser on port {instance.debugging_port} restarted successfully.")
-                else:
-                    print(f"Failed to restart browser on port {instance.debugging_port} after multiple attempts.")
-                    self.handle_failed_restart(instance)
-            else:
-                print(f"Max restart attempts reached for browser on port {instance.debugging_port}.")
+            self.browser_launcher.stop(instance)  # Also the helpers a crashed browser leaves behind, which keep its profile busy
+            new_instance = self.browser_launcher.launch_browser(instance_id)
+            if not new_instance:
+                RESTARTS.labels("failure").inc()
+                print(f"Failed to restart browser on {endpoint} after multiple attempts.")
                 self.handle_failed_restart(instance)
+                return
+
+            with self.lock:
+                if self.resources.get(instance_id) is not instance or not instance.is_active:
+                    # Terminated while it was being restarted
+                    self.reaper.submit(new_instance)
+                    return
+                if instance.session_id in self.sessions:
+                    # A browser being reset for reuse comes back fresh and idle instead
+                    new_instance.session_id = instance.session_id
+                    new_instance.timeout = instance.timeout
+                    new_instance.last_used = instance.last_used
+                new_instance.uses = instance.uses
+                new_instance.startup_attempts = instance.startup_attempts
+                self.resources[instance_id] = new_instance
+                self._journal_changed()
+                self._dispatch_waiters()
+            RESTARTS.labels("success").inc()
+            if new_instance.endpoint == endpoint:
+                print(f"Browser on {endpoint} restarted successfully.")
+            else:
+                print(f"Browser on {endpoint} restarted successfully, now on {new_instance.endpoint}.")
+        finally:
+            with self.lock:
+                self._restarting.discard(instance_id)
 
     def handle_failed_restart(self, instance: BrowserInstance):
         """Handles the case where a browser instance fails to restart after multiple attempts."""
-        self.cleanup_browser(instance)
         if self.lock.acquire(timeout=5):
             try:
                 # Check if the current thread is the lock owner
                 if self.lock._is_owned():
                     instance.is_active = False
-                    instance.session_id = None
-                    self.available_ports.put(instance.debugging_port)
                     self._lock_owner = threading.current_thread()
                 else:
                   instance.is_active = False
-                  instance.session_id = None
-                  self.available_ports.put(instance.debugging_port)
                   self._lock_owner = threading.current_thread()
+                if instance.session_id:
+                    # The session is lost with its browser; its client gets 404 from now on
+                    self.lease_scheduler.cancel(instance.session_id)
+                    if self.sessions.pop(instance.session_id, None) is not None:
+                        self._session_ended(instance.session_id)
+                    self.session_browser_map.pop(instance.session_id, None)
+                    instance.session_id = None
+                self.reaper.submit(instance, self._release_instance_id)
+                self._journal_changed()
+                self._dispatch_waiters()
             finally:
                 self.lock.release()
         else:
-            print(f"Failed to acquire lock to handle failed restart for browser at port {instance.debugging_port}.")
+            print(f"Failed to acquire lock to handle failed restart for browser on {instance.endpoint}.")
             return
-        print(f"Browser at port {instance.debugging_port} marked as inactive and resources cleaned up.")
+        print(f"Browser on {instance.endpoint} marked as inactive and resources cleaned up.")
+
+    def _granted_browsers(self, grants: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
+        """Looks up the debugging port of each grant, dropping those whose browser went away since it was granted."""
+        with self.lock:
+            browsers = []
+            for instance_id, session_id in grants:
+                instance = self.resources.get(instance_id)
+                if instance is None or not instance.is_active or instance.session_id != session_id:
+                    print(f"Browser {instance_id} was lost before session {session_id} could be handed out.")
+                    continue
+                browsers.append((instance.debugging_port, None, session_id))
+            return browsers
 
     def get_browser(self, timeout: int = 30) -> Optional[Tuple[int, int, str]]:
         """Gets a browser instance, creating a new one if necessary."""
         result = self.get_resource(timeout)
         if result:
-            debugging_port, session_id = result
+            instance_id, session_id = result
             if self.lock.acquire(timeout=5):
                 try:
                   # Check if the current thread is the lock owner
                     if self.lock._is_owned():
-                        self.session_browser_map[session_id] = debugging_port
+                        self.session_browser_map[session_id] = instance_id
                         self._lock_owner = threading.current_thread()
                     else:
-                      self.session_browser_map[session_id] = debugging_port
+                      self.session_browser_map[session_id] = instance_id
                       self._lock_owner = threading.current_thread()
                 finally:
                     self.lock.release()
@@ -142,16 +477,81 @@ class BrowserPool(ResourcePool):
                 print("Failed to acquire lock to update session_browser_map.")
                 return None
 
-            return debugging_port, None, session_id
+            browsers = self._granted_browsers([result])
+            return browsers[0] if browsers else None
         else:
             return None
 
+    async def acquire_browser(self, timeout: int = 30, lease: Optional[int] = None, key: str = "") -> Optional[Tuple[int, int, str]]:
+        """Waits in the admission queue for a browser without blocking the event loop."""
+        result = await self.acquire_resource(timeout, lease, key)
+        if result:
+            # The pool lock can be held by background threads, so never take it on the loop.
+            browsers = await asyncio.get_running_loop().run_in_executor(None, self._granted_browsers, [result])
+            return browsers[0] if browsers else None
+        return None
+
+    async def acquire_browsers(self, count: int, timeout: int = 30, lease: Optional[int] = None, atomic: bool = False, key: str = "") -> List[Tuple[int, int, str]]:
+        """Reserves `count` browsers in one pass, launching the shortfall in parallel."""
+        grants = await self.acquire_resources(count, timeout, lease, atomic, key)
+        if not grants:
+            return []
+        loop = asyncio.get_running_loop()
+        browsers = await loop.run_in_executor(None, self._granted_browsers, grants)
+        if atomic and len(browsers) < len(grants):
+            # Part of the batch was lost after the grant; the rest goes back to the idle set
+            await loop.run_in_executor(None, self._release_grants, grants)
+            return []
+        return browsers
+
+    def terminate_browsers_by_session(self, session_ids: List[str]) -> List[str]:
+        """Releases several sessions under one lock acquisition and returns those that were found."""
+        with self.lock:
+            return [session_id for session_id in session_ids if self.terminate_browser_by_session(session_id)]
+
+    def _create_and_register(self) -> Optional[int]:
+        """Launches a browser under the next free instance ID and stores it in the pool."""
+        resource = self.create_resource_func()
+        if not resource:
+            return None
+        self._register_browser(resource)
+        return resource.instance_id
+
+    async def _create_and_register_async(self) -> Optional[int]:
+        resource = await self.create_browser_async()
+        if not resource:
+            return None
+        await asyncio.get_running_loop().run_in_executor(None, self._register_browser, resource)
+        return resource.instance_id
+
+    def _register_browser(self, resource: BrowserInstance):
+        with self.lock:
+            self.resources[resource.instance_id] = resource
+            self._journal_changed()
+
+    def release_resource(self, resource_id: Any, session_id: str) -> bool:
+        with self.lock:
+            self.session_browser_map.pop(session_id, None)
+            return super().release_resource(resource_id, session_id)
+
+    def occupancy(self) -> Dict[str, int]:
+        """Counts active, idle and launching browsers and queued allocations."""
+        with self.lock:
+            active = sum(1 for r in self.resources.values() if r.is_active)
+            idle = sum(1 for r in self.resources.values() if r.is_active and r.session_id is None)
+            return {"active": active, "idle": idle, "launching": self.launching, "waiting": self._pending_waiters()}
+
     def list_browsers(self) -> List[dict]:
         """Lists all browser instances with details."""
         browser_list = super().list_resources()
         for browser_info in browser_list:
-            debugging_port = browser_info["resource_id"]
-            browser_info["debugging_port"] = debugging_port
+            instance_id = browser_info["resource_id"]
+            instance = self.resources.get(instance_id)
+            browser_info["instance_id"] = instance_id
+            browser_info["debugging_port"] = instance.debugging_port if instance else None
+            browser_info["profile"] = self.launch_profile.name
+            browser_info["rss_bytes"] = instance.rss_bytes if instance else None
+            browser_info["pss_bytes"] = instance.pss_bytes if instance else None
             del browser_info["resource_id"]
         return browser_list
 
@@ -199,7 +599,7 @@ class BrowserPool(ResourcePool):
         """Terminates the browser instance associated with a session ID."""
         instance, port = self.get_browser_by_session(session_id)
         if instance:
-            self.terminate_resource(port)
+            self.recycle_resource(port)
             if self.lock.acquire(timeout=5):
                 try:
                     # Check if the current thread is the lock owner
@@ -220,46 +620,70 @@ class BrowserPool(ResourcePool):
         else:
             return False
 
+    def session_browser(self, session_id: str) -> Tuple[Optional[BrowserInstance], bool]:
+        """The browser currently serving a session, if any, and whether the health check is restarting it."""
+        with self.lock:
+            instance_id = self.sessions.get(session_id)
+            if instance_id is None:
+                return None, False
+            return self.resources.get(instance_id), instance_id in self._restarting
+
+    def terminate_session(self, session_id: str) -> bool:
+        """Terminates the browser only if it is still assigned to the given session."""
+        with self.lock:
+            resource_id = self.sessions.get(session_id)
+            if resource_id is None or self.resources[resource_id].session_id != session_id:
+                self.session_browser_map.pop(session_id, None)
+                return False
+            self.session_browser_map.pop(session_id, None)
+            return self.terminate_resource(resource_id)
+
     def maintain_warm_pool(self):
+      """Resizes the warm set every AUTOSCALE_INTERVAL seconds as the autoscaler decides."""
       def _maintain():
           while True:
-              if self.lock.acquire(timeout=5):
-                  try:
-                      # Check if the current thread is the lock owner
-                      if self.lock._is_owned():
-                          unassigned_count = sum(1 for r in self.resources.values() if r.is_active and r.session_id is None)
-                          needed = self.warm_resources - unassigned_count
-                          self._lock_owner = threading.current_thread()
-                      else:
-                        unassigned_count = sum(1 for r in self.resources.values() if r.is_active and r.session_id is None)
-                        needed = self.warm_resources - unassigned_count
-                        self._lock_owner = threading.current_thread()
-
-                      if needed > 0:
-                          for _ in range(needed):
-                              resource = self.create_resource_func()
-                              if resource:
-                                  self.resources[resource.debugging_port] = resource
-                                  print(f"Warming up: Created resource at port {resource.debugging_port}")
-                              else:
-                                  print("Failed to create resource for warming up.")
-                      elif needed < 0:
-                          for resource_id, resource in self.resources.items():
-                              if resource.is_active and resource.session_id is None:
-                                  self.terminate_resource(resource_id)
-                                  needed += 1
-                                  print(f"Scaling down: Terminated resource at port {resource_id}")
-                                  if needed == 0:
-                                      break
-                  finally:
-                      self.lock.release()
-              else:
-                  print("Failed to acquire lock for maintain_warm_pool.")
-              time.sleep(5)
+              launch = 0
+              with self.lock:
+                  if self.closed:
+                      return
+                  idle = [(port, r) for port, r in self.resources.items() if r.is_active and r.session_id is None]
+                  active = sum(1 for r in self.resources.values() if r.is_active)
+                  capacity = max(self.max_instances - active - self.launching - len(self.reaper.pending_teardowns()), 0)
+                  room = self.memory_budget.room(self)
+                  if room is not None:
+                      capacity = min(capacity, room)
+                  delta = self.autoscaler.decide(len(idle), active - len(idle), self.launching, capacity)
+                  if delta > 0:
+                      # Reserve the slots now and launch in parallel once the lock is released
+                      self.launching += delta
+                      launch = delta
+                  elif delta < 0:
+                      # Retire the longest-idle browsers, never ones that were just released
+                      cutoff = time.time() - self.autoscaler.scale_down_delay
+                      for resource_id, resource in sorted(idle, key=lambda item: item[1].last_used)[:-delta]:
+                          if resource.last_used <= cutoff:
+                              self.terminate_resource(resource_id)
+                              print(f"Scaling down: Terminated resource {resource_id}")
+
+              for _ in range(launch):
+                  threading.Thread(target=self._warm_one, daemon=True).start()
+              time.sleep(AUTOSCALE_INTERVAL)
 
       thread = threading.Thread(target=_maintain, daemon=True)
       thread.start()
 
+    def _warm_one(self):
+        resource = self.create_resource_func()
+        with self.lock:
+            self.launching -= 1
+            if resource:
+                self.resources[resource.instance_id] = resource
+                self._journal_changed()
+                print(f"Warming up: Created resource on {resource.endpoint}")
+            else:
+                print("Failed to create resource for warming up.")
+            self._dispatch_waiters()
+
     def start_resource_replacement_thread(self):
         """Starts a thread to periodically replace terminated resources."""
         def _replace_resources():
@@ -278,12 +702,12 @@ class BrowserPool(ResourcePool):
                                 new_resource = self.create_resource_func(resource_id)
                                 if new_resource:
                                     self.resources[resource_id] = new_resource
-                                    print(f"Replaced terminated resource at port {resource_id}.")
+                                    print(f"Replaced terminated resource {resource_id}.")
                                 else:
-                                    print(f"Failed to launch replacement resource at port {resource_id}.")
+                                    print(f"Failed to launch replacement resource {resource_id}.")
 
                             except Exception as e:
-                                print(f"Error replacing resource at port {resource_id}: {e}")
+                                print(f"Error replacing resource {resource_id}: {e}")
                     finally:
                         self.lock.release()
                 else:
@@ -302,13 +726,15 @@ class BrowserPool(ResourcePool):
                     # Check if the current thread is the lock owner
                     if self.lock._is_owned():
                         if resource.session_id == session_id:
-                            print(f"Session {session_id} timed out. Terminating resource at port {resource_id}.")
-                            self.terminate_resource(resource_id)
+                            SESSION_TIMEOUTS.inc()
+                            print(f"Session {session_id} timed out. Releasing resource {resource_id}.")
+                            self.recycle_resource(resource_id)
                         self._lock_owner = threading.current_thread()
                     else:
                       if resource.session_id == session_id:
-                        print(f"Session {session_id} timed out. Terminating resource at port {resource_id}.")
-                        self.terminate_resource(resource_id)
+                        SESSION_TIMEOUTS.inc()
+                        print(f"Session {session_id} timed out. Releasing resource {resource_id}.")
+                        self.recycle_resource(resource_id)
                       self._lock_owner = threading.current_thread()
             finally:
                 self.lock.release()
@@ -316,39 +742,34 @@ class BrowserPool(ResourcePool):
             print("Failed to acquire lock for _timeout_handler.")
 
     def get_resource(self, timeout: int = 30) -> Optional[Tuple[Any, str]]:
+        self.autoscaler.record_arrival()
         start_time = time.time()
         while time.time() - start_time < timeout:
+            launch = False
             if self.lock.acquire(timeout=5):
                 try:
-                    # Check if the current thread is the lock owner
-                    if self.lock._is_owned():
-                        if len(self.resources) < self.max_instances and all(r.session_id is not None for r in self.resources.values() if r.is_active):
-                            self.all_resources_occupied = False
-                            resource = self.create_resource_func()
-                            if resource:
-                                self.resources[resource.debugging_port] = resource
-                                return self.assign_resource(resource, resource.debugging_port, timeout)
-                        else:
-                            for resource_id, resource in self.resources.items():
-                                if resource.is_active and resource.session_id is None:
-                                    return self.assign_resource(resource, resource_id, timeout)
-                        self._lock_owner = threading.current_thread()
-                    else:
-                      if len(self.resources) < self.max_instances and all(r.session_id is not None for r in self.resources.values() if r.is_active):
+                    idle = self._find_idle_resource()
+                    if idle:
+                        resource_id, resource = idle
+                        return self.assign_resource(resource, resource_id, timeout)
+                    if self._has_capacity():
+                        # Reserve the slot; the launch itself runs without the lock
+                        self.launching += 1
                         self.all_resources_occupied = False
-                        resource = self.create_resource_func()
-                        if resource:
-                            self.resources[resource.debugging_port] = resource
-                            return self.assign_resource(resource, resource.debugging_port, timeout)
-                      else:
-                        for resource_id, resource in self.resources.items():
-                            if resource.is_active and resource.session_id is None:
-                                return self.assign_resource(resource, resource_id, timeout)
-                      self._lock_owner = threading.current_thread()
+                        launch = True
+                    self._lock_owner = threading.current_thread()
                 finally:
                     self.lock.release()
             else:
                 print("Failed to acquire lock for get_resource.")
+
+            if launch:
+                resource = self.create_resource_func()
+                with self.lock:
+                    self.launching -= 1
+                    if resource:
+                        self.resources[resource.instance_id] = resource
+                        return self.assign_resource(resource, resource.instance_id, timeout)
             time.sleep(0.5)
 
         print(f"No resource available within the timeout of {timeout} seconds.")
@@ -374,18 +795,13 @@ class BrowserPool(ResourcePool):
                     resource.startup_attempts = 0
                     self._lock_owner = threading.current_thread()
 
-                if resource.timeout_thread:
-                    resource.timeout_thread.cancel()
-
                 if timeout > 0:
-                    resource.timeout_thread = threading.Timer(
-                        timeout,
-                        self._timeout_handler,
-                        args=[resource_id, session_id]
-                    )
-                    resource.timeout_thread.start()
+                    self.lease_scheduler.schedule(session_id, resource_id, timeout)
 
                 self.sessions[session_id] = resource_id
+                self.session_browser_map[session_id] = resource_id
+                self.autoscaler.session_started(session_id)
+                self._journal_changed()
             finally:
                 self.lock.release()
         else:
@@ -398,35 +814,32 @@ class BrowserPool(ResourcePool):
         """Terminates a resource and cleans up."""
         if self.lock.acquire(timeout=5):
             try:
-                if resource_id in self.resources:
+                if resource_id in self.resources and self.resources[resource_id].is_active:
                     resource = self.resources[resource_id]
 
-                    # Cancel the timer if it exists
-                    if resource.timeout_thread:
-                        resource.timeout_thread.cancel()
-                        resource.timeout_thread = None
-
-                    # Remove session
+                    # Remove session and its lease
                     if resource.session_id:
+                        self.lease_scheduler.cancel(resource.session_id)
                         self.sessions.pop(resource.session_id, None)
-
-                    self.cleanup_browser(resource)
+                        self._session_ended(resource.session_id)
 
                     # Check if the current thread is the lock owner
                     if self.lock._is_owned():
                         resource.is_active = False
                         resource.session_id = None
-                        self.available_ports.put(resource_id)
                         self._lock_owner = threading.current_thread()
                     else:
                         resource.is_active = False
                         resource.session_id = None
-                        self.available_ports.put(resource_id)
                         self._lock_owner = threading.current_thread()
-                    print(f"Resource at port {resource_id} terminated and resources cleaned up.")
+                    # The instance ID and port stay quarantined until the reaper has torn the browser down
+                    self.reaper.submit(resource, self._release_instance_id)
+                    self._journal_changed()
+                    print(f"Resource {resource_id} terminated; teardown queued.")
+                    self._dispatch_waiters()
 
                     return True
-                print(f"No resource found at port {resource_id} to terminate.")
+                print(f"No resource {resource_id} found to terminate.")
                 return False
             finally:
                 self.lock.release()
@@ -441,8 +854,6 @@ class BrowserPool(ResourcePool):
                     resource_id = self.sessions[session_id]
                     resource = self.resources[resource_id]
 
-                    if resource.timeout_thread:
-                        resource.timeout_thread.cancel()
                     # Check if the current thread is the lock owner
                     if self.lock._is_owned():
                         resource.timeout = additional_time
@@ -451,12 +862,8 @@ class BrowserPool(ResourcePool):
                         resource.timeout = additional_time
                         self._lock_owner = threading.current_thread()
 
-                    resource.timeout_thread = threading.Timer(
-                        additional_time,
-                        self._timeout_handler,
-                        args=[resource_id, session_id]
-                    )
-                    resource.timeout_thread.start()
+                    self.lease_scheduler.schedule(session_id, resource_id, additional_time)
+                    self._journal_changed()
                     print(f"Timeout for session {session_id} extended by {additional_time} seconds.")
                     return True
                 print(f"Session {session_id} not found.")
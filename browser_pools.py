@@ -0,0 +1,161 @@
+# browser_pools.py
+
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from browser_pool import BrowserPool
+from memory_budget import MemoryBudget
+from profile_template import ProfileTemplate
+from models import BrowserInstance, LaunchProfile
+from config import CHROMIUM_PROFILE_BASE_DIR, DEBUGGING_PORT_START, LAUNCHER_BACKEND, PROFILE_TEMPLATE_DIR, SESSION_JOURNAL
+from config import LAUNCH_PROFILES, LAUNCH_PROFILE_ARGS, LAUNCH_PROFILE_PORT_SPAN
+from config import MEMORY_BUDGET_MB, MEMORY_BROWSER_ESTIMATE_MB, MEMORY_EVICT_SESSIONS, MEMORY_METRIC, MEMORY_SAMPLE_INTERVAL
+
+def configured_launch_profiles() -> List[LaunchProfile]:
+    """The profiles named in LAUNCH_PROFILES, each with its own port range, directories and journal."""
+    journal_root, journal_ext = os.path.splitext(SESSION_JOURNAL)
+    launch_profiles = []
+    for index, (name, (max_instances, min_warm)) in enumerate(LAUNCH_PROFILES.items()):
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+            raise ValueError(f"Invalid launch profile name {name!r}")
+        if name not in LAUNCH_PROFILE_ARGS:
+            raise ValueError(f"Launch profile {name!r} has no arguments; set LAUNCH_PROFILE_ARGS_{name.upper()}")
+        launch_profiles.append(LaunchProfile(
+            name=name,
+            args=LAUNCH_PROFILE_ARGS[name],
+            max_instances=max_instances,
+            min_warm=min_warm,
+            debugging_port_start=DEBUGGING_PORT_START + index * LAUNCH_PROFILE_PORT_SPAN,
+            profile_base_dir=os.path.join(CHROMIUM_PROFILE_BASE_DIR, name),
+            template_dir=os.path.join(PROFILE_TEMPLATE_DIR, name),
+            journal_path=f"{journal_root}.{name}{journal_ext}" if SESSION_JOURNAL else "",
+        ))
+    return launch_profiles
+
+def purge_unowned_data(launch_profiles: List[LaunchProfile]):
+    """
+    Deletes what no launch profile owns from the profile, template and journal locations.
+
+    That is mostly what a pool from before launch profiles left behind: flat
+    profile-NNNN directories, a template directly in PROFILE_TEMPLATE_DIR and the
+    single SESSION_JOURNAL file. Their browsers were already stopped by purge_orphans.
+    """
+    names = {launch_profile.name for launch_profile in launch_profiles}
+    legacy_template = ProfileTemplate(PROFILE_TEMPLATE_DIR)  # Discards the overlay layers of its old clones
+    # Warm-up launches may already be building templates next to the template directories
+    template_entries = names | {f"{name}.building" for name in names} | {".overlay"}
+    for base_dir, keep in ((CHROMIUM_PROFILE_BASE_DIR, names), (PROFILE_TEMPLATE_DIR, template_entries)):
+        if not os.path.isdir(base_dir):
+            continue
+        for entry in os.listdir(base_dir):
+            if entry in keep:
+                continue
+            path = os.path.join(base_dir, entry)
+            print(f"Removing {path}, which no launch profile owns.")
+            try:
+                if os.path.isdir(path) or os.path.ismount(path):
+                    legacy_template.discard(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"Error removing {path}: {e}")
+    if SESSION_JOURNAL and os.path.isfile(SESSION_JOURNAL):
+        print(f"Removing {SESSION_JOURNAL}; each launch profile keeps its own journal.")
+        os.remove(SESSION_JOURNAL)
+
+class BrowserPools:
+    """
+    One BrowserPool per launch profile.
+
+    Allocations go to the pool of the profile they name; everything after that is
+    routed by session ID to the pool holding the session. Each pool has its own
+    warm pool, autoscaler, admission queue, capacity, port range and journal, so
+    demand for one profile never takes browsers or slots from another. Memory
+    is the exception: all pools are admitted against one node-wide budget.
+    """
+    def __init__(self, launch_profiles: List[LaunchProfile], default_profile: str):
+        if default_profile not in {launch_profile.name for launch_profile in launch_profiles}:
+            raise ValueError(f"Default launch profile {default_profile!r} is not in LAUNCH_PROFILES")
+        self.memory_budget = MemoryBudget(
+            budget_bytes=MEMORY_BUDGET_MB * 1024 * 1024,
+            metric=MEMORY_METRIC,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
+            default_estimate=MEMORY_BROWSER_ESTIMATE_MB * 1024 * 1024,
+            evict_sessions=MEMORY_EVICT_SESSIONS
+        )
+        self.pools: Dict[str, BrowserPool] = {}
+        for launch_profile in launch_profiles:
+            self.pools[launch_profile.name] = BrowserPool(launch_profile, self.memory_budget)
+        if LAUNCHER_BACKEND == "chromium":
+            purge_unowned_data(launch_profiles)
+        self.default_profile = default_profile
+        self.memory_budget.start()
+
+    def get(self, name: Optional[str] = None) -> Optional[BrowserPool]:
+        """The pool for a launch profile, the default one if no name is given, or None if unknown."""
+        return self.pools.get(name or self.default_profile)
+
+    def for_session(self, session_id: str) -> Optional[BrowserPool]:
+        for pool in self.pools.values():
+            if session_id in pool.session_browser_map:
+                return pool
+        return None
+
+    @property
+    def max_instances(self) -> int:
+        return sum(pool.max_instances for pool in self.pools.values())
+
+    def get_browser_by_session(self, session_id: str) -> Tuple[Optional[BrowserInstance], Optional[int]]:
+        pool = self.for_session(session_id)
+        return pool.get_browser_by_session(session_id) if pool else (None, None)
+
+    def validate_session(self, session_id: str, port: int) -> bool:
+        pool = self.for_session(session_id)
+        return pool is not None and pool.validate_session(session_id, port)
+
+    def extend_timeout(self, session_id: str, additional_time: int) -> bool:
+        pool = self.for_session(session_id)
+        return pool is not None and pool.extend_timeout(session_id, additional_time)
+
+    def terminate_browser_by_session(self, session_id: str) -> bool:
+        pool = self.for_session(session_id)
+        return pool is not None and pool.terminate_browser_by_session(session_id)
+
+    def terminate_browsers_by_session(self, session_ids: List[str]) -> List[str]:
+        """Releases sessions grouped by pool, one lock acquisition per pool."""
+        by_pool: Dict[str, List[str]] = defaultdict(list)
+        for session_id in session_ids:
+            pool = self.for_session(session_id)
+            if pool is not None:
+                by_pool[pool.launch_profile.name].append(session_id)
+        deallocated = set()
+        for name, pool_session_ids in by_pool.items():
+            deallocated.update(self.pools[name].terminate_browsers_by_session(pool_session_ids))
+        return [session_id for session_id in session_ids if session_id in deallocated]
+
+    def list_browsers(self) -> List[dict]:
+        return [browser for pool in self.pools.values() for browser in pool.list_browsers()]
+
+    def occupancy(self) -> dict:
+        """Counts over all profiles, with max_instances and the same counts per profile under "profiles"."""
+        profiles = {}
+        for name, pool in self.pools.items():
+            profiles[name] = pool.occupancy()
+            profiles[name]["max_instances"] = pool.max_instances
+        totals = {
+            key: sum(occupancy[key] for occupancy in profiles.values())
+            for key in ("active", "idle", "launching", "waiting", "max_instances")
+        }
+        memory = {"memory_bytes": self.memory_budget.used(), "memory_budget_bytes": self.memory_budget.budget_bytes}
+        return {**totals, **memory, "default_profile": self.default_profile, "profiles": profiles}
+
+    def reaper_stats(self) -> Dict[str, dict]:
+        return {name: pool.reaper.stats() for name, pool in self.pools.items()}
+
+    def autoscaler_stats(self) -> Dict[str, dict]:
+        return {name: pool.autoscaler.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
@@ -0,0 +1,99 @@
+# browser_reset.py
+
+import asyncio
+from typing import List, Optional, Set
+from urllib.parse import urlsplit
+import aiohttp
+from cdp import CDPConnection, CDPError
+from pipe_transport import PipeConnection
+
+async def reset_browser(ws_debugger_url: Optional[str], timeout: float = 10, pipe: Optional[PipeConnection] = None) -> bool:
+    """
+    Sanitizes a released browser over CDP so it can be handed to the next session.
+
+    Opens a fresh about:blank page, disposes every browser context the client
+    created, closes every other target, clears cookies, cache and the storage
+    of every origin the session is seen to have used, and resets granted
+    permissions. Returns False if any step fails or a target outlives the reset,
+    in which case the browser should be replaced rather than reused. With a pipe
+    the reset goes over it instead of ws_debugger_url.
+    """
+    try:
+        async with aiohttp.ClientSession() as http_session:
+            if pipe is not None:
+                cdp = CDPConnection(pipe.open_channel())
+            else:
+                cdp = await CDPConnection.connect(http_session, ws_debugger_url, timeout=timeout)
+            try:
+                return await asyncio.wait_for(_reset(cdp), timeout)
+            finally:
+                await cdp.close()
+    except (CDPError, asyncio.TimeoutError, aiohttp.ClientError, KeyError) as e:
+        print(f"Failed to reset browser at {ws_debugger_url or 'its pipe'}: {e}")
+        return False
+
+async def _reset(cdp: CDPConnection) -> bool:
+    blank = (await cdp.send("Target.createTarget", {"url": "about:blank"}))["targetId"]
+    targets = [t for t in (await cdp.send("Target.getTargets"))["targetInfos"] if t["targetId"] != blank]
+
+    # CDP cannot list the origins that hold storage, so collect every origin the session
+    # shows: open targets, each page's frames and history, and the domains of its cookies
+    origins = set()
+    for target in targets:
+        _add_origin(origins, target.get("url", ""))
+        if target["type"] == "page":
+            await _page_origins(cdp, target["targetId"], origins)
+    for cookie in (await cdp.send("Storage.getCookies"))["cookies"]:
+        domain = cookie["domain"].lstrip(".")
+        origins.update((f"https://{domain}", f"http://{domain}"))
+
+    # Disposing a context drops its pages, workers and storage with it
+    for context_id in (await cdp.send("Target.getBrowserContexts"))["browserContextIds"]:
+        await cdp.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+    for target in await _other_targets(cdp, blank):
+        if target["type"] == "page":
+            await cdp.send("Target.closeTarget", {"targetId": target["targetId"]})
+
+    session = await cdp.send("Target.attachToTarget", {"targetId": blank, "flatten": True})
+    session_id = session["sessionId"]
+    await cdp.send("Network.clearBrowserCookies", session_id=session_id)
+    await cdp.send("Network.clearBrowserCache", session_id=session_id)
+    for origin in origins:
+        await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+    await cdp.send("Browser.resetPermissions")
+    await cdp.send("Target.detachFromTarget", {"sessionId": session_id})
+
+    # Workers not owned by a closed page, such as service and shared workers
+    for target in await _other_targets(cdp, blank):
+        try:
+            await cdp.send("Target.closeTarget", {"targetId": target["targetId"]})
+        except CDPError:
+            pass
+    left = await _other_targets(cdp, blank)
+    if left:
+        print(f"Reset left {len(left)} targets open ({', '.join(sorted({t['type'] for t in left}))}); the browser will be replaced.")
+        return False
+    return True
+
+async def _other_targets(cdp: CDPConnection, blank: str) -> List[dict]:
+    return [t for t in (await cdp.send("Target.getTargets"))["targetInfos"] if t["targetId"] != blank]
+
+async def _page_origins(cdp: CDPConnection, target_id: str, origins: Set[str]):
+    """Adds the origins of a page's frames, third-party iframes included, and of its navigation history."""
+    session_id = (await cdp.send("Target.attachToTarget", {"targetId": target_id, "flatten": True}))["sessionId"]
+    try:
+        history = await cdp.send("Page.getNavigationHistory", session_id=session_id)
+        for entry in history["entries"]:
+            _add_origin(origins, entry.get("url", ""))
+        frames = [(await cdp.send("Page.getFrameTree", session_id=session_id))["frameTree"]]
+        while frames:
+            node = frames.pop()
+            _add_origin(origins, node["frame"].get("url", ""))
+            frames.extend(node.get("childFrames", []))
+    finally:
+        await cdp.send("Target.detachFromTarget", {"sessionId": session_id})
+
+def _add_origin(origins: Set[str], url: str):
+    parts = urlsplit(url)
+    if parts.scheme in ("http", "https") and parts.netloc:
+        origins.add(f"{parts.scheme}://{parts.netloc.rpartition('@')[2]}")
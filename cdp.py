@@ -0,0 +1,77 @@
+# cdp.py
+
+import asyncio
+import itertools
+import json
+import logging
+from typing import Any, Dict, Optional
+import aiohttp
+
+class CDPError(Exception):
+    """Raised when Chrome answers a CDP command with an error, or the connection is lost."""
+
+class CDPConnection:
+    """
+    A minimal Chrome DevTools Protocol client used by the pool itself.
+
+    Commands are pipelined over one WebSocket; a reader task matches responses to
+    callers by id. Events are ignored.
+    """
+    def __init__(self, websocket: aiohttp.ClientWebSocketResponse):
+        self.websocket = websocket
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader = asyncio.create_task(self._read())
+
+    @classmethod
+    async def connect(cls, session: aiohttp.ClientSession, ws_url: str, timeout: float = 5) -> "CDPConnection":
+        websocket = await session.ws_connect(ws_url, timeout=timeout, max_msg_size=0)
+        return cls(websocket)
+
+    @property
+    def closed(self) -> bool:
+        return self._reader.done()
+
+    async def send(self, method: str, params: Optional[dict] = None, session_id: Optional[str] = None, timeout: float = 10) -> Dict[str, Any]:
+        """Sends a command and returns its result, raising CDPError on errors and asyncio.TimeoutError on timeouts."""
+        if self.closed:
+            raise CDPError("CDP connection is closed")
+        message_id = next(self._ids)
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self.websocket.send_str(json.dumps(message))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def wait_closed(self):
+        """Returns once the connection to Chrome has been lost or closed."""
+        await asyncio.wait({self._reader})
+
+    async def close(self):
+        self._reader.cancel()
+        await self.websocket.close()
+
+    async def _read(self):
+        try:
+            async for msg in self.websocket:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                future = self._pending.get(data.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in data:
+                    future.set_exception(CDPError(data["error"].get("message", str(data["error"]))))
+                else:
+                    future.set_result(data.get("result", {}))
+        except Exception as e:
+            logging.error(f"CDP connection failed: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CDPError("CDP connection closed"))
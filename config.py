@@ -1,22 +1,83 @@
 # config.py
 
 import os
+import shlex
 
 # Constants
+LAUNCHER_BACKEND = os.getenv("LAUNCHER_BACKEND", "chromium")  # "chromium" or "simulated" (in-process stand-in for load tests)
+SIMULATED_STARTUP_DELAY = float(os.getenv("SIMULATED_STARTUP_DELAY", 0))  # Simulated backend: seconds before a browser answers
+CHROMIUM_BINARY = os.getenv("CHROMIUM_BINARY", "chromium-browser")  # Executable to launch (benchmarks point this at a stand-in)
 CHROMIUM_PROFILE_BASE_DIR = os.getenv("CHROMIUM_PROFILE_BASE_DIR", "/config/chromium_profiles")  # Base directory for profiles
+PROFILE_TEMPLATE_DIR = os.getenv("PROFILE_TEMPLATE_DIR", "/config/chromium_profile_template")  # Pre-initialized profile cloned per instance
+PROFILE_CLONE_MODE = os.getenv("PROFILE_CLONE_MODE", "reflink")  # "reflink", "overlay", "copy" or "none" (empty profiles)
+PROFILE_TEMPLATE_RETRY_INTERVAL = float(os.getenv("PROFILE_TEMPLATE_RETRY_INTERVAL", 300))  # Seconds before a failed template build is tried again
 BASE_PORT = int(os.getenv("BASE_PORT", 9000))
 DEBUGGING_PORT_START = int(os.getenv("DEBUGGING_PORT_START", 9222))
+DEBUGGING_PORT_MODE = os.getenv("DEBUGGING_PORT_MODE", "fixed")  # "fixed" (ports from DEBUGGING_PORT_START) or "auto" (OS-assigned, read from DevToolsActivePort)
+DEBUGGING_TRANSPORT = os.getenv("DEBUGGING_TRANSPORT", "websocket")  # "websocket" (TCP debugging port) or "pipe" (--remote-debugging-pipe, no port)
 NUM_WARM = int(os.getenv("NUM_WARM", 1))
 MAX_INSTANCES = int(os.getenv("MAX_INSTANCES", 15))
+AUTOSCALE_MIN_WARM = int(os.getenv("AUTOSCALE_MIN_WARM", NUM_WARM))  # Idle browsers kept even without demand
+AUTOSCALE_MAX_WARM = int(os.getenv("AUTOSCALE_MAX_WARM", MAX_INSTANCES))  # Upper bound on the warm target
+AUTOSCALE_COLD_PROBABILITY = float(os.getenv("AUTOSCALE_COLD_PROBABILITY", 0.05))  # Target chance that an allocation finds no warm browser
+AUTOSCALE_FAST_WINDOW = float(os.getenv("AUTOSCALE_FAST_WINDOW", 10))  # Seconds, time constant of the burst-tracking arrival EWMA
+AUTOSCALE_SLOW_WINDOW = float(os.getenv("AUTOSCALE_SLOW_WINDOW", 120))  # Seconds, time constant of the baseline arrival EWMA
+AUTOSCALE_MAX_STEP_UP = int(os.getenv("AUTOSCALE_MAX_STEP_UP", 4))  # Browsers launched per tick at most
+AUTOSCALE_MAX_STEP_DOWN = int(os.getenv("AUTOSCALE_MAX_STEP_DOWN", 1))  # Browsers retired per tick at most
+AUTOSCALE_SCALE_DOWN_DELAY = float(os.getenv("AUTOSCALE_SCALE_DOWN_DELAY", 30))  # Seconds of surplus (and idleness) before retiring
+AUTOSCALE_INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", 1))  # Seconds between autoscaler ticks
 IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", 300))
 SCALE_DOWN_INTERVAL = int(os.getenv("SCALE_DOWN_INTERVAL", 60))
 MAX_STARTUP_ATTEMPTS = int(os.getenv("MAX_STARTUP_ATTEMPTS", 3))
-HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", 2))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 2))  # Seconds between health check rounds over all browsers
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 2))  # Seconds a browser has to answer Browser.getVersion
+HEALTH_CHECK_FAILURES = int(os.getenv("HEALTH_CHECK_FAILURES", 3))  # Unanswered checks in a row before a running browser is restarted
+HEALTH_CHECK_CONCURRENCY = int(os.getenv("HEALTH_CHECK_CONCURRENCY", 64))  # Browsers probed at the same time
+LAUNCH_PROFILES = {  # "name=max_instances[:min_warm],..."; each launch profile has its own warm pool and capacity
+    name.strip(): (int(limits.split(":")[0]), int(limits.split(":")[1]) if ":" in limits else AUTOSCALE_MIN_WARM)
+    for name, limits in (item.split("=", 1) for item in os.getenv("LAUNCH_PROFILES", f"headed={MAX_INSTANCES}:{AUTOSCALE_MIN_WARM}").split(",") if item.strip())
+}
+DEFAULT_LAUNCH_PROFILE = os.getenv("DEFAULT_LAUNCH_PROFILE", next(iter(LAUNCH_PROFILES)))  # Used when an allocation names no profile
+LAUNCH_PROFILE_PORT_SPAN = int(os.getenv("LAUNCH_PROFILE_PORT_SPAN", 1000))  # Debugging ports per profile, in LAUNCH_PROFILES order
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", 0))  # Browser memory admitted on this node across all profiles (0 = only counts apply)
+MEMORY_METRIC = os.getenv("MEMORY_METRIC", "pss")  # "pss" (shared pages split between processes) or "rss"
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", 5))  # Seconds between /proc samples of every browser's process tree
+MEMORY_BROWSER_ESTIMATE_MB = int(os.getenv("MEMORY_BROWSER_ESTIMATE_MB", 250))  # Charged per launch until idle browsers have been measured
+MEMORY_EVICT_SESSIONS = os.getenv("MEMORY_EVICT_SESSIONS", "largest")  # Over budget once idle browsers are gone: "largest" or "none"
+SESSION_JOURNAL = os.getenv("SESSION_JOURNAL", "/config/session_journal.json")  # Browser/session table kept across restarts ("" = off)
+REAPER_WORKERS = int(os.getenv("REAPER_WORKERS", 2))  # Threads tearing down terminated browsers
+REAPER_QUEUE_SIZE = int(os.getenv("REAPER_QUEUE_SIZE", 64))  # Queued teardowns; more wait in an overflow list
+RECYCLE_BROWSERS = os.getenv("RECYCLE_BROWSERS", "0") == "1"  # Reset and reuse released browsers instead of killing them
+RECYCLE_MAX_REUSES = int(os.getenv("RECYCLE_MAX_REUSES", 20))  # Sessions a browser may serve before it is replaced
+RECYCLE_MAX_RSS_MB = int(os.getenv("RECYCLE_MAX_RSS_MB", 1024))  # Browsers whose process tree exceeds this are replaced
+RECYCLE_RESET_TIMEOUT = float(os.getenv("RECYCLE_RESET_TIMEOUT", 10))  # Max seconds for the CDP reset of a released browser
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 256))  # Allocations that may wait for a browser; beyond that 503 + Retry-After
+ADMISSION_QUEUE_PER_KEY = int(os.getenv("ADMISSION_QUEUE_PER_KEY", 0))  # Waiting allocations per client key (0 = only the total applies)
+ADMISSION_KEY_HEADER = os.getenv("ADMISSION_KEY_HEADER", "X-API-Key")  # Request header naming the client; its address is used without it
+ADMISSION_WEIGHTS = {  # "key=weight,..."; a key with weight 3 is served three times per round-robin turn
+    key.strip(): int(weight)
+    for key, weight in (item.rsplit("=", 1) for item in os.getenv("ADMISSION_WEIGHTS", "").split(",") if item.strip())
+}
+COORDINATOR_NODES = {  # "name=url,..."; when set, main.py fronts these pool nodes instead of running browsers itself
+    (entry.split("=", 1)[0].strip() if "=" in entry else f"node{i}"): entry.split("=", 1)[-1].strip()
+    for i, entry in enumerate(item for item in os.getenv("COORDINATOR_NODES", "").split(",") if item.strip())
+}
+COORDINATOR_POLL_INTERVAL = float(os.getenv("COORDINATOR_POLL_INTERVAL", 1))  # Seconds between node occupancy polls
+COORDINATOR_FAILURE_THRESHOLD = int(os.getenv("COORDINATOR_FAILURE_THRESHOLD", 3))  # Failed node requests in a row before it is considered lost
 PROXY_CONNECTION_TIMEOUT = int(os.getenv("PROXY_CONNECTION_TIMEOUT", 5))
+UPSTREAM_CONNECTION_LIMIT = int(os.getenv("UPSTREAM_CONNECTION_LIMIT", 0))  # Pooled HTTP connections to all browsers and nodes (0 = unlimited)
+UPSTREAM_CONNECTION_LIMIT_PER_HOST = int(os.getenv("UPSTREAM_CONNECTION_LIMIT_PER_HOST", 0))  # Per debugging port (0 = unlimited)
+UPSTREAM_KEEPALIVE_TIMEOUT = float(os.getenv("UPSTREAM_KEEPALIVE_TIMEOUT", 30))  # Seconds an idle pooled connection is kept
+RELAY_MODE = os.getenv("RELAY_MODE", "queued")  # "queued" (event-driven, backpressured) or "legacy"
+RELAY_QUEUE_SIZE = int(os.getenv("RELAY_QUEUE_SIZE", 64))  # Frames buffered per direction before reads pause
+ALLOCATION_MODE = os.getenv("ALLOCATION_MODE", "process")  # "process" (one browser per session) or "context"
+CONTEXTS_PER_BROWSER = int(os.getenv("CONTEXTS_PER_BROWSER", 10))  # Context mode: sessions sharing one browser process
+CONTEXT_WARM_BROWSERS = int(os.getenv("CONTEXT_WARM_BROWSERS", 1))  # Context mode: host browsers started up front
+LAUNCH_READY_TIMEOUT = float(os.getenv("LAUNCH_READY_TIMEOUT", 15))  # Max seconds to wait for DevTools to answer
+LAUNCH_PROBE_INTERVAL = float(os.getenv("LAUNCH_PROBE_INTERVAL", 0.05))  # First readiness probe delay, doubled up to 0.5s
 
 # Chromium command-line arguments to ensure clean, private browsing
 CHROMIUM_ARGS = [
-    "--start-maximized",#"--headless=new",
     "--disable-backgrounding-occluded-windows",
     "--disable-hang-monitor",
     "--metrics-recording-only",
@@ -58,4 +119,21 @@ CHROMIUM_ARGS = [
     "--disable-component-extensions-with-background-pages", # Disables component extensions that have background pages
     "--disable-backing-store", # Disables the backing store for each renderer, which helps manage memory by not caching content when navigating back/forward
     "--disable-features=OptimizationHints", # Disables optimization hints that can be used for tracking or profiling
-]
\ No newline at end of file
+]
+
+# Arguments each launch profile adds to CHROMIUM_ARGS; LAUNCH_PROFILE_ARGS_<NAME>="--a --b" defines or replaces one
+LAUNCH_PROFILE_ARGS = {
+    "headed": ["--start-maximized"],
+    "headless": ["--headless=new"],
+    "mobile": [
+        "--headless=new",
+        "--window-size=412,915",
+        "--force-device-scale-factor=2.625",
+        "--touch-events=enabled",
+        "--user-agent=Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36",
+    ],
+}
+LAUNCH_PROFILE_ARGS.update({
+    key[len("LAUNCH_PROFILE_ARGS_"):].lower(): shlex.split(value)
+    for key, value in os.environ.items() if key.startswith("LAUNCH_PROFILE_ARGS_")
+})
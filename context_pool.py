@@ -0,0 +1,251 @@
+# context_pool.py
+
+import asyncio
+import math
+import time
+import uuid
+from typing import Dict, List, Optional
+import aiohttp
+from cdp import CDPConnection, CDPError
+from config import DEBUGGING_TRANSPORT, HEALTH_CHECK_INTERVAL, LAUNCH_READY_TIMEOUT, MAX_STARTUP_ATTEMPTS
+from lease_scheduler import LeaseScheduler
+from metrics import SESSION_TIMEOUTS
+from models import BrowserInstance, ContextHost, ContextSession
+
+class ContextPool:
+    """
+    Allocates isolated browser contexts inside a few shared Chromium processes.
+
+    Host processes are taken from the BrowserPool with a lease that never expires.
+    Each allocation creates a fresh `Target.createBrowserContext` plus a page in the
+    least-loaded host, and deallocation disposes of the context. Sessions, leases
+    and validation are keyed on the context rather than on the debugging port.
+    """
+    def __init__(self, browser_pool, contexts_per_browser: int, warm_browsers: int):
+        if DEBUGGING_TRANSPORT != "websocket":
+            raise ValueError("Context mode connects clients to page endpoints and needs DEBUGGING_TRANSPORT=websocket")
+        self.browser_pool = browser_pool
+        self.contexts_per_browser = contexts_per_browser
+        self.warm_browsers = warm_browsers
+        self.hosts: Dict[int, ContextHost] = {}
+        self.sessions: Dict[str, ContextSession] = {}
+        self.lease_scheduler = LeaseScheduler(self._timeout_handler)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self._host_lock: Optional[asyncio.Lock] = None
+
+    async def start(self, http_session: aiohttp.ClientSession):
+        """Binds the pool to the running loop and warms up host browsers in the background."""
+        self.loop = asyncio.get_running_loop()
+        self.http_session = http_session
+        self._host_lock = asyncio.Lock()
+        self._warm_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        async with self._host_lock:
+            while len(self.hosts) < self.warm_browsers:
+                if await self._add_host(timeout=60) is None:
+                    print("Failed to warm up a context host browser.")
+                    return
+
+    def _pick_host(self) -> Optional[ContextHost]:
+        """Returns the least-loaded host that still has room for a context."""
+        candidates = [
+            host for host in self.hosts.values()
+            if not host.cdp.closed and len(host.contexts) + host.reserved < self.contexts_per_browser
+        ]
+        return min(candidates, key=lambda host: len(host.contexts) + host.reserved, default=None)
+
+    async def _add_host(self, timeout: float) -> Optional[ContextHost]:
+        """Takes a browser process from the BrowserPool and opens a CDP connection to it."""
+        result = await self.browser_pool.acquire_browser(timeout, lease=0)
+        if not result:
+            return None
+        _, _, pool_session_id = result
+        loop = asyncio.get_running_loop()
+        instance, _ = await loop.run_in_executor(None, self.browser_pool.get_browser_by_session, pool_session_id)
+        return await self._connect_host(pool_session_id, instance)
+
+    async def _connect_host(self, pool_session_id: str, instance: BrowserInstance) -> Optional[ContextHost]:
+        """Opens a CDP connection to the browser of a pool session, or ends the session if that fails."""
+        try:
+            cdp = await CDPConnection.connect(self.http_session, instance.ws_debugger_url)
+        except Exception as e:
+            print(f"Failed to open CDP connection to host browser on port {instance.debugging_port}: {e}")
+            await asyncio.get_running_loop().run_in_executor(None, self.browser_pool.terminate_session, pool_session_id)
+            return None
+
+        host = ContextHost(debugging_port=instance.debugging_port, pool_session_id=pool_session_id, cdp=cdp, instance=instance)
+        self.hosts[host.debugging_port] = host
+        asyncio.create_task(self._watch_host(host))
+        print(f"Context host ready on port {host.debugging_port}.")
+        return host
+
+    async def _watch_host(self, host: ContextHost):
+        """
+        Drops a host and all of its sessions once its CDP connection is lost.
+
+        If the BrowserPool's health check restarted the browser under the same pool
+        session, the restarted browser becomes a new, empty host; only a browser
+        that is still the one the host connected to is terminated.
+        """
+        await host.cdp.wait_closed()
+        if self.hosts.get(host.debugging_port) is not host:
+            return
+        del self.hosts[host.debugging_port]
+        lost = [s for s in self.sessions.values() if s.debugging_port == host.debugging_port]
+        for session in lost:
+            self.lease_scheduler.cancel(session.session_id)
+            del self.sessions[session.session_id]
+        print(f"Lost context host on port {host.debugging_port}; dropped {len(lost)} sessions.")
+
+        # A crashed browser is only restarted once the health check notices, so wait for that too
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + HEALTH_CHECK_INTERVAL + MAX_STARTUP_ATTEMPTS * LAUNCH_READY_TIMEOUT
+        while True:
+            instance, restarting = await loop.run_in_executor(None, self.browser_pool.session_browser, host.pool_session_id)
+            crashed = instance is host.instance and not self.browser_pool.browser_launcher.is_alive(instance)
+            if not (restarting or crashed) or loop.time() >= deadline:
+                break
+            await asyncio.sleep(0.5)
+        if instance is None:
+            return  # The pool ended the session itself
+        if instance is host.instance or restarting:
+            # Still the browser this host connected to, or its restart did not finish
+            await loop.run_in_executor(None, self.browser_pool.terminate_session, host.pool_session_id)
+            return
+        async with self._host_lock:
+            await self._connect_host(host.pool_session_id, instance)
+
+    async def allocate(self, timeout: int = 30) -> Optional[ContextSession]:
+        """Creates an isolated context with one page and returns its session."""
+        host = self._pick_host()
+        if host is None:
+            async with self._host_lock:
+                host = self._pick_host() or await self._add_host(timeout)
+            if host is None:
+                return None
+
+        host.reserved += 1
+        context_id = None
+        try:
+            context = await host.cdp.send("Target.createBrowserContext", {"disposeOnDetach": False})
+            context_id = context["browserContextId"]
+            target = await host.cdp.send("Target.createTarget", {"url": "about:blank", "browserContextId": context_id})
+        except (CDPError, asyncio.TimeoutError, KeyError) as e:
+            print(f"Failed to create a browser context on port {host.debugging_port}: {e}")
+            if context_id:
+                await self._dispose(host, context_id)
+            return None
+        finally:
+            host.reserved -= 1
+
+        session = ContextSession(
+            session_id=str(uuid.uuid4()),
+            debugging_port=host.debugging_port,
+            context_id=context_id,
+            target_id=target["targetId"],
+            last_used=time.time(),
+            timeout=timeout,
+        )
+        host.contexts.add(context_id)
+        self.sessions[session.session_id] = session
+        if timeout > 0:
+            self.lease_scheduler.schedule(session.session_id, context_id, timeout)
+        return session
+
+    async def _dispose(self, host: ContextHost, context_id: str):
+        try:
+            await host.cdp.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+        except (CDPError, asyncio.TimeoutError) as e:
+            print(f"Failed to dispose browser context {context_id} on port {host.debugging_port}: {e}")
+
+    async def release(self, session_id: str) -> bool:
+        """Disposes of a session's browser context."""
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.lease_scheduler.cancel(session_id)
+        host = self.hosts.get(session.debugging_port)
+        if host is not None:
+            host.contexts.discard(session.context_id)
+            await self._dispose(host, session.context_id)
+        print(f"Context {session.context_id} on port {session.debugging_port} released.")
+        return True
+
+    def _timeout_handler(self, context_id: str, session_id: str):
+        """Runs on the lease scheduler thread and hands the expiry to the event loop."""
+        asyncio.run_coroutine_threadsafe(self._expire(context_id, session_id), self.loop)
+
+    async def _expire(self, context_id: str, session_id: str):
+        session = self.sessions.get(session_id)
+        if session is not None and session.context_id == context_id:
+            SESSION_TIMEOUTS.inc()
+            print(f"Session {session_id} timed out. Disposing context {context_id}.")
+            await self.release(session_id)
+
+    def retry_after(self, count: int = 1) -> float:
+        """
+        Estimates the seconds until `count` more contexts could be created.
+
+        That is when the last of the `count` soonest-expiring context leases runs
+        out, or, with too few leases running, when the BrowserPool expects a
+        browser for another host. Takes the BrowserPool lock, so call it off the loop.
+        """
+        expiries = self.lease_scheduler.soonest(count)
+        if len(expiries) < count:
+            return self.browser_pool.retry_after(1)
+        return max(1, math.ceil(expiries[-1]))
+
+    def get_session(self, session_id: str) -> Optional[ContextSession]:
+        return self.sessions.get(session_id)
+
+    def validate_session(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        host = self.hosts.get(session.debugging_port)
+        is_valid = host is not None and not host.cdp.closed and session.context_id in host.contexts
+        if not is_valid:
+            print(f"Session validation failed for session_id: {session_id}, context_id: {session.context_id}")
+        return is_valid
+
+    def extend_timeout(self, session_id: str, additional_time: int) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            print(f"Session {session_id} not found.")
+            return False
+        session.timeout = additional_time
+        session.last_used = time.time()
+        self.lease_scheduler.schedule(session_id, session.context_id, additional_time)
+        return True
+
+    async def list_targets(self, session_id: str) -> Optional[List[dict]]:
+        """Lists the targets that belong to a session's context, in /json/list form."""
+        session = self.sessions.get(session_id)
+        host = session and self.hosts.get(session.debugging_port)
+        if host is None:
+            return None
+        try:
+            result = await host.cdp.send("Target.getTargets")
+        except (CDPError, asyncio.TimeoutError):
+            return None
+        return [
+            {"id": t["targetId"], "type": t["type"], "title": t.get("title", ""), "url": t.get("url", "")}
+            for t in result.get("targetInfos", [])
+            if t.get("browserContextId") == session.context_id
+        ]
+
+    def list_contexts(self) -> List[dict]:
+        return [
+            {
+                "session_id": session.session_id,
+                "debugging_port": session.debugging_port,
+                "context_id": session.context_id,
+                "target_id": session.target_id,
+                "active": True,
+                "last_used": session.last_used,
+                "timeout": session.timeout,
+            }
+            for session in self.sessions.values()
+        ]
@@ -0,0 +1,294 @@
+# coordinator.py
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from models import PoolNode
+
+SESSION_SEPARATOR = "."  # Global session IDs are "<node>.<session id on that node>"
+RESPONSE_MARGIN = 5  # Seconds a node gets beyond an allocation's own timeout to answer before it counts as stalled
+
+class Coordinator:
+    """
+    Spreads sessions over several pool nodes, each a main.py running its own BrowserPool.
+
+    Node occupancy is polled from GET /occupancy and allocations go to the
+    least-loaded node that is healthy, not draining and serves the requested
+    launch profile; load is then measured for that profile alone. The node's name is
+    prefixed to every session ID, so later traffic for a session is routed by
+    parsing the ID alone. A node that misses `failure_threshold` polls in a row
+    is taken out of placement until it answers again; a drained node keeps
+    serving its sessions but gets no new ones.
+    """
+    def __init__(self, nodes: Dict[str, str], poll_interval: float, failure_threshold: int, key_header: str):
+        for name in nodes:
+            if not name or SESSION_SEPARATOR in name:
+                raise ValueError(f"Invalid node name {name!r}")
+        self.nodes: Dict[str, PoolNode] = {name: PoolNode(name, url.rstrip("/")) for name, url in nodes.items()}
+        self.poll_interval = poll_interval
+        self.failure_threshold = failure_threshold
+        self.key_header = key_header
+        self.http_session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self, http_session: aiohttp.ClientSession):
+        """Polls every node once, then keeps polling in the background."""
+        self.http_session = http_session
+        await asyncio.gather(*[self._poll(node) for node in self.nodes.values()])
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await asyncio.gather(*[self._poll(node) for node in self.nodes.values()])
+
+    async def _poll(self, node: PoolNode):
+        placed = node.placed  # Granted before the poll is sent, so the reply counts them
+        try:
+            timeout = aiohttp.ClientTimeout(total=max(self.poll_interval, 1))
+            async with self.http_session.get(f"{node.url}/occupancy", timeout=timeout) as resp:
+                resp.raise_for_status()
+                node.occupancy = await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self._node_failed(node, e)
+            return
+        node.placed -= placed
+        node.failures = 0
+        node.last_seen = time.time()
+        if not node.healthy:
+            node.healthy = True
+            print(f"Node {node.name} is reachable again.")
+
+    def _node_failed(self, node: PoolNode, error: Exception):
+        node.failures += 1
+        if node.healthy and node.failures >= self.failure_threshold:
+            node.healthy = False
+            print(f"Node {node.name} lost after {node.failures} failed requests: {error}")
+
+    def occupancy(self, node: PoolNode, profile: Optional[str] = None) -> Dict[str, int]:
+        """The node's last reported counts for one launch profile, or for the whole node."""
+        if profile is None:
+            return node.occupancy
+        return node.occupancy.get("profiles", {}).get(profile, {})
+
+    def load(self, node: PoolNode, profile: Optional[str] = None) -> float:
+        """Share of the node's capacity that is busy or already promised to waiting allocations."""
+        occupancy = self.occupancy(node, profile)
+        busy = occupancy.get("active", 0) - occupancy.get("idle", 0)
+        pending = occupancy.get("waiting", 0) + node.in_flight + node.placed
+        return (busy + pending) / max(occupancy.get("max_instances", 1), 1)
+
+    def free(self, node: PoolNode, profile: Optional[str] = None) -> int:
+        """Browsers the node could hand out now or launch, minus allocations already sent its way."""
+        occupancy = self.occupancy(node, profile)
+        busy = occupancy.get("active", 0) - occupancy.get("idle", 0)
+        return occupancy.get("max_instances", 0) - busy - occupancy.get("waiting", 0) - node.in_flight - node.placed
+
+    def candidates(self, profile: Optional[str] = None) -> List[PoolNode]:
+        """Nodes that may take new sessions of the launch profile, least-loaded first."""
+        nodes = [
+            node for node in self.nodes.values()
+            if node.healthy and not node.draining and (profile is None or profile in node.occupancy.get("profiles", {}))
+        ]
+        return sorted(nodes, key=lambda node: self.load(node, profile))
+
+    def session_id(self, node: PoolNode, local_session_id: str) -> str:
+        return f"{node.name}{SESSION_SEPARATOR}{local_session_id}"
+
+    def resolve(self, session_id: str) -> Tuple[Optional[PoolNode], str]:
+        """Splits a global session ID into its node and the session ID on that node."""
+        name, _, local_session_id = session_id.partition(SESSION_SEPARATOR)
+        return self.nodes.get(name), local_session_id
+
+    def _headers(self, key: str) -> Dict[str, str]:
+        # Keeps fair queuing per client on the nodes, which only see the coordinator's address
+        return {self.key_header: key} if key else {}
+
+    def _params(self, profile: Optional[str], **params) -> Dict[str, str]:
+        # Without a profile each node uses its own default
+        if profile is not None:
+            params["profile"] = profile
+        return params
+
+    async def allocate(self, timeout: int, key: str = "", profile: Optional[str] = None) -> Tuple[Optional[dict], Optional[float]]:
+        """
+        Allocates a session on the least-loaded node, falling back to the next on failure.
+
+        The timeout is split over the candidates: each node may wait for an equal
+        share of the time left when it is tried.
+
+        Returns:
+            The node's allocation response with a global session ID and the node
+            name, or None and the shortest Retry-After reported by a node.
+        """
+        deadline = time.monotonic() + timeout
+        retry_after = None
+        candidates = self.candidates(profile)
+        for index, node in enumerate(candidates):
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                break
+            # Each node gets an equal share of what is left, so one that stalls leaves time for the fallbacks
+            share = int(remaining / (len(candidates) - index))
+            node.in_flight += 1
+            try:
+                async with self.http_session.post(
+                    f"{node.url}/browser", params=self._params(profile, timeout=share), headers=self._headers(key),
+                    timeout=aiohttp.ClientTimeout(total=share + RESPONSE_MARGIN)
+                ) as resp:
+                    if resp.status == 200:
+                        data = await resp.json()
+                        data["session_id"] = self.session_id(node, data["session_id"])
+                        data["node"] = node.name
+                        node.placed += 1
+                        return data, None
+                    if resp.status == 503 and "Retry-After" in resp.headers:
+                        node_retry = float(resp.headers["Retry-After"])
+                        retry_after = node_retry if retry_after is None else min(retry_after, node_retry)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._node_failed(node, e)
+            finally:
+                node.in_flight -= 1
+        return None, retry_after
+
+    async def allocate_batch(self, count: int, timeout: int, atomic: bool = False, key: str = "",
+                             profile: Optional[str] = None) -> Tuple[List[dict], Optional[float]]:
+        """
+        Splits a batch over the nodes by free capacity and allocates the parts in parallel.
+
+        With atomic, every part is atomic and the whole batch is given back if any part fails.
+        """
+        shares: Dict[str, int] = {}
+        remaining = count
+        candidates = self.candidates(profile)
+        for node in candidates:
+            share = min(remaining, max(self.free(node, profile), 0))
+            if share:
+                shares[node.name] = share
+                remaining -= share
+        if remaining and candidates:
+            # Nobody has room for the rest; it waits on the least-loaded node
+            shares[candidates[0].name] = shares.get(candidates[0].name, 0) + remaining
+        if not shares:
+            return [], None
+
+        parts = await asyncio.gather(*[
+            self._allocate_part(self.nodes[name], share, timeout, atomic, key, profile) for name, share in shares.items()
+        ])
+        sessions = [session for part, _ in parts for session in part]
+        retry_afters = [retry_after for _, retry_after in parts if retry_after is not None]
+        if atomic and len(sessions) < count:
+            await self.release_batch([session["session_id"] for session in sessions])
+            sessions = []
+        return sessions, min(retry_afters, default=None)
+
+    async def _allocate_part(self, node: PoolNode, count: int, timeout: int, atomic: bool, key: str,
+                             profile: Optional[str]) -> Tuple[List[dict], Optional[float]]:
+        node.in_flight += count
+        try:
+            async with self.http_session.post(
+                f"{node.url}/browsers/batch", params=self._params(profile, count=count, timeout=timeout, atomic=int(atomic)),
+                headers=self._headers(key), timeout=aiohttp.ClientTimeout(total=timeout + RESPONSE_MARGIN)
+            ) as resp:
+                if resp.status == 200:
+                    sessions = (await resp.json())["sessions"]
+                    for session in sessions:
+                        session["session_id"] = self.session_id(node, session["session_id"])
+                        session["node"] = node.name
+                    node.placed += len(sessions)
+                    return sessions, None
+                return [], float(resp.headers["Retry-After"]) if "Retry-After" in resp.headers else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._node_failed(node, e)
+            return [], None
+        finally:
+            node.in_flight -= count
+
+    async def release(self, session_id: str) -> bool:
+        """Deallocates a session on its node; False if the session or its node is unknown."""
+        node, local_session_id = self.resolve(session_id)
+        if node is None or not local_session_id:
+            return False
+        try:
+            async with self.http_session.delete(f"{node.url}/browser/{local_session_id}") as resp:
+                return resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._node_failed(node, e)
+            return False
+
+    async def release_batch(self, session_ids: List[str]) -> List[str]:
+        """Deallocates sessions grouped by node, one request per node, and returns those released."""
+        by_node: Dict[str, List[str]] = {}
+        for session_id in session_ids:
+            node, local_session_id = self.resolve(session_id)
+            if node is not None and local_session_id:
+                by_node.setdefault(node.name, []).append(local_session_id)
+
+        async def release_on(node: PoolNode, local_session_ids: List[str]) -> List[str]:
+            try:
+                async with self.http_session.delete(
+                    f"{node.url}/browsers/batch", json={"session_ids": local_session_ids}
+                ) as resp:
+                    resp.raise_for_status()
+                    return [self.session_id(node, s) for s in (await resp.json())["deallocated"]]
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._node_failed(node, e)
+                return []
+
+        released = await asyncio.gather(*[release_on(self.nodes[name], ids) for name, ids in by_node.items()])
+        return [session_id for part in released for session_id in part]
+
+    async def extend_timeout(self, session_id: str, additional_time: int) -> bool:
+        node, local_session_id = self.resolve(session_id)
+        if node is None or not local_session_id:
+            return False
+        try:
+            async with self.http_session.post(
+                f"{node.url}/browser/{local_session_id}/timeout", params={"timeout": additional_time}
+            ) as resp:
+                return resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._node_failed(node, e)
+            return False
+
+    async def list_browsers(self) -> List[dict]:
+        """Every reachable node's browser list, with the node name and global session IDs."""
+        async def list_on(node: PoolNode) -> List[dict]:
+            try:
+                async with self.http_session.get(f"{node.url}/browsers") as resp:
+                    resp.raise_for_status()
+                    browsers = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._node_failed(node, e)
+                return []
+            for browser in browsers:
+                browser["node"] = node.name
+                if browser.get("session_id"):
+                    browser["session_id"] = self.session_id(node, browser["session_id"])
+            return browsers
+
+        lists = await asyncio.gather(*[list_on(node) for node in self.nodes.values()])
+        return [browser for browsers in lists for browser in browsers]
+
+    def set_draining(self, name: str, draining: bool) -> bool:
+        node = self.nodes.get(name)
+        if node is None:
+            return False
+        node.draining = draining
+        print(f"Node {name} {'draining' if draining else 'accepting sessions again'}.")
+        return True
+
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "name": node.name,
+                "url": node.url,
+                "healthy": node.healthy,
+                "draining": node.draining,
+                "load": self.load(node),
+                "in_flight": node.in_flight,
+                "occupancy": node.occupancy,
+                "last_seen": node.last_seen,
+            }
+            for node in self.nodes.values()
+        ]
@@ -0,0 +1,65 @@
+# launcher_backend.py
+
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+from models import BrowserInstance
+
+class LauncherBackend(ABC):
+    """
+    What BrowserPool needs from whatever starts and stops browsers.
+
+    A backend is constructed with the LaunchProfile it starts browsers for.
+    Browsers are identified by the instance ID the pool passes to launch_browser,
+    which is also their debugging port unless DEBUGGING_PORT_MODE is "auto".
+    launch_browser and launch_browser_async return an instance only once its
+    DevTools endpoint answers, with debugging_port and ws_debugger_url filled in
+    (or pipe, with DEBUGGING_TRANSPORT=pipe), or None on failure.
+    The other methods are called from pool threads and must not block for long.
+    """
+
+    @abstractmethod
+    def launch_browser(self, instance_id: int) -> Optional[BrowserInstance]:
+        """Starts the browser with this instance ID and waits until it is ready."""
+
+    @abstractmethod
+    async def launch_browser_async(self, reserve_instance_id: Callable[[], int]) -> Optional[BrowserInstance]:
+        """
+        Like launch_browser, without blocking the running event loop.
+
+        The instance ID comes from reserve_instance_id, which takes the pool lock
+        and so is called on an executor thread, never on the loop.
+        """
+
+    @abstractmethod
+    def is_ready(self, instance: BrowserInstance) -> bool:
+        """Whether the browser's DevTools endpoint currently answers."""
+
+    @abstractmethod
+    def is_alive(self, instance: BrowserInstance) -> bool:
+        """Whether the browser is still running; a dead browser gets restarted."""
+
+    @abstractmethod
+    def terminate(self, instance: BrowserInstance):
+        """Stops the browser and deletes everything it left behind. May take seconds."""
+
+    def stop(self, instance: BrowserInstance):
+        """Stops the browser's processes, including any it left running after exiting, but keeps its profile."""
+
+    @abstractmethod
+    def resource_usage(self, instance: BrowserInstance) -> Dict[str, int]:
+        """Current usage of the browser, with at least an "rss_bytes" entry."""
+
+    def resource_usages(self, instances: List[BrowserInstance]) -> Dict[int, Dict[str, int]]:
+        """resource_usage of several browsers, by instance ID; backends may share the work between them."""
+        return {instance.instance_id: self.resource_usage(instance) for instance in instances}
+
+    def adopt(self, record: dict) -> Optional[BrowserInstance]:
+        """
+        Takes over a browser started by a previous run of the pool, as recorded in
+        the session journal, if it is still running and answering. Backends whose
+        browsers cannot outlive the pool return None.
+        """
+        return None
+
+    def purge_orphans(self, adopted: List[BrowserInstance]):
+        """Stops browsers and deletes profiles left over from a previous run, except the adopted ones."""
@@ -0,0 +1,96 @@
+# lease_scheduler.py
+
+import heapq
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class LeaseScheduler:
+    """
+    Expires session leases from a single background thread.
+
+    Deadlines live in a dict and the thread sleeps on a min-heap of them. Pushing a
+    later deadline for a session that is already queued only updates the dict, so
+    extending a lease is O(1); the stale heap entry is re-queued when it comes due.
+    """
+    def __init__(self, on_expire: Callable[[Any, str], None]):
+        self.on_expire = on_expire
+        self._leases: Dict[str, Tuple[float, Any]] = {}  # session_id -> (deadline, resource_id)
+        self._queued: Dict[str, float] = {}  # session_id -> earliest deadline present in the heap
+        self._heap: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def schedule(self, session_id: str, resource_id: Any, timeout: float):
+        """Sets the lease of a session to expire `timeout` seconds from now."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._leases[session_id] = (deadline, resource_id)
+            queued = self._queued.get(session_id)
+            if queued is not None and queued <= deadline:
+                return
+            self._queued[session_id] = deadline
+            heapq.heappush(self._heap, (deadline, session_id))
+            if self._heap[0][1] == session_id:
+                self._condition.notify()
+
+    def cancel(self, session_id: str):
+        with self._condition:
+            self._leases.pop(session_id, None)
+
+    def remaining(self, session_id: str) -> Optional[float]:
+        """Seconds left on a lease, or None if the session has no lease."""
+        lease = self._leases.get(session_id)
+        if lease is None:
+            return None
+        return max(0.0, lease[0] - time.monotonic())
+
+    def soonest(self, count: int) -> List[float]:
+        """Seconds left on the `count` leases that expire first, soonest first."""
+        with self._condition:
+            deadlines = heapq.nsmallest(count, (deadline for deadline, _ in self._leases.values()))
+        now = time.monotonic()
+        return [max(0.0, deadline - now) for deadline in deadlines]
+
+    def __len__(self) -> int:
+        return len(self._leases)
+
+    def _pop_expired(self) -> List[Tuple[Any, str]]:
+        """Waits for the next due lease and returns every lease that has expired. Caller holds the condition."""
+        while True:
+            if not self._heap:
+                self._condition.wait()
+                continue
+            now = time.monotonic()
+            if self._heap[0][0] > now:
+                self._condition.wait(self._heap[0][0] - now)
+                continue
+
+            expired = []
+            while self._heap and self._heap[0][0] <= now:
+                _, session_id = heapq.heappop(self._heap)
+                lease = self._leases.get(session_id)
+                if lease is None:
+                    self._queued.pop(session_id, None)
+                elif lease[0] > now:
+                    # Extended since it was queued
+                    self._queued[session_id] = lease[0]
+                    heapq.heappush(self._heap, (lease[0], session_id))
+                else:
+                    del self._leases[session_id]
+                    del self._queued[session_id]
+                    expired.append((lease[1], session_id))
+            if expired:
+                return expired
+
+    def _run(self):
+        while True:
+            with self._condition:
+                expired = self._pop_expired()
+            for resource_id, session_id in expired:
+                try:
+                    self.on_expire(resource_id, session_id)
+                except Exception as e:
+                    print(f"Error expiring session {session_id}: {e}")
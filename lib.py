@@ -4,6 +4,8 @@ import json
 import time
 import uuid
 import asyncio
+import contextlib
+import aiohttp
 
 class APIClientBase:
     """Base class to avoid code duplication."""
@@ -16,9 +18,12 @@ class APIClientBase:
         self.pending_cdp_requests = {}
         self.loop = asyncio.get_event_loop() # Get the event loop
 
-    def allocate_browser(self, timeout=120):
+    def allocate_browser(self, timeout=120, profile=None):
         try:
-            response = requests.post(f"{self.api_base_url}/browser", params={"timeout": timeout})
+            params = {"timeout": timeout}
+            if profile:
+                params["profile"] = profile  # Launch profile, e.g. "headless"; the server's default otherwise
+            response = requests.post(f"{self.api_base_url}/browser", params=params)
             response.raise_for_status()
             data = response.json()
             self.session_id = data["session_id"]
@@ -27,6 +32,35 @@ class APIClientBase:
             print(f"Error allocating browser: {e}")
             return None
 
+    def allocate_browsers(self, count, timeout=120, atomic=False, profile=None):
+        """
+        Allocates `count` browsers of one launch profile in one request without connecting to them.
+
+        Returns:
+            A list of {"session_id", "proxy_url"} dicts, empty on failure. Unless
+            atomic, the list can be shorter than `count`.
+        """
+        try:
+            params = {"count": count, "timeout": timeout, "atomic": int(atomic)}
+            if profile:
+                params["profile"] = profile
+            response = requests.post(f"{self.api_base_url}/browsers/batch", params=params)
+            response.raise_for_status()
+            return response.json()["sessions"]
+        except requests.exceptions.RequestException as e:
+            print(f"Error allocating browsers: {e}")
+            return []
+
+    def deallocate_browsers(self, session_ids):
+        """Deallocates several sessions in one request and returns the IDs that were deallocated."""
+        try:
+            response = requests.delete(f"{self.api_base_url}/browsers/batch", json={"session_ids": list(session_ids)})
+            response.raise_for_status()
+            return response.json()["deallocated"]
+        except requests.exceptions.RequestException as e:
+            print(f"Error deallocating browsers: {e}")
+            return []
+
     def deallocate_browser(self):
         if not self.session_id:
             print("No browser session to deallocate.")
@@ -157,17 +191,18 @@ class APIClient(APIClientBase):  # Inherit from APIClientBase
         super().__init__(api_base_url) # Initialize the base class
         self.page_session_id = None  # To store the session ID for the page target
 
-    async def allocate_browser(self, timeout=120):
+    async def allocate_browser(self, timeout=120, profile=None):
         """
         Allocates a browser instance and automatically attaches to a page target.
 
         Args:
             timeout: The timeout in seconds for the allocation and attachment.
+            profile: The launch profile to allocate from, or None for the server's default.
 
         Returns:
             The session ID if successful, None otherwise.
         """
-        if not super().allocate_browser(timeout):
+        if not super().allocate_browser(timeout, profile):
             return None
 
         if not self.connect_ws():
@@ -319,4 +354,368 @@ class APIClient(APIClientBase):  # Inherit from APIClientBase
         response = await self.send_cdp_request("Target.attachToTarget", params)
         if response and "result" in response and "sessionId" in response["result"]:
             return response["result"]["sessionId"]
-        return None
\ No newline at end of file
+        return None
+
+class CDPEventStream:
+    """
+    An async iterator over CDP events received by an AsyncBrowserSession.
+
+    The subscription starts when the stream is created, so events fired by a
+    command sent right afterwards are not missed. Iteration ends when the
+    WebSocket closes. If the consumer falls more than max_queue events behind,
+    the oldest events are dropped and counted in `dropped`, so a slow consumer
+    never stalls CDP responses.
+    """
+    def __init__(self, browser, methods, max_queue):
+        self.browser = browser
+        self.methods = set(methods)
+        self.queue = asyncio.Queue(max_queue)
+        self.dropped = 0
+        browser._event_streams.append(self)
+        if browser.closed:
+            self.queue.put_nowait(None)
+
+    def _deliver(self, event):
+        if event is not None and self.methods and event.get("method") not in self.methods:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is None:
+            self.close()
+            raise StopAsyncIteration
+        return event
+
+    def close(self):
+        """Stops the subscription; already queued events can still be read."""
+        if self in self.browser._event_streams:
+            self.browser._event_streams.remove(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+class AsyncBrowserSession:
+    """
+    One allocated browser, driven over a single CDP WebSocket.
+
+    Any number of send_cdp_request calls may be in flight at once: a reader task
+    matches responses to callers by id, and hands events to CDPEventStreams.
+    Obtain instances from AsyncAPIClient.allocate_browser or AsyncAPIClient.browser.
+    """
+    def __init__(self, client, session_id):
+        self.client = client
+        self.session_id = session_id
+        self.page_session_id = None  # Set once a page target is attached
+        self.ws = None
+        self.next_cdp_id = 1
+        self.pending_cdp_requests = {}
+        self._event_streams = []
+        self._reader = None
+
+    @property
+    def closed(self):
+        return self._reader is None or self._reader.done()
+
+    async def connect(self):
+        """Opens the CDP WebSocket through the proxy."""
+        self.ws = await self.client.http.ws_connect(
+            f"{self.client.api_base_url}/session/{self.session_id}", max_msg_size=0
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for msg in self.ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    print(f"Received non-JSON WebSocket message: {msg.data[:100]}")
+                    continue
+                if "id" in data:
+                    future = self.pending_cdp_requests.pop(data["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(data)
+                elif "method" in data:
+                    for stream in list(self._event_streams):
+                        stream._deliver(data)
+        finally:
+            for future in self.pending_cdp_requests.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("CDP WebSocket closed"))
+            self.pending_cdp_requests.clear()
+            for stream in list(self._event_streams):
+                stream._deliver(None)
+
+    async def send_cdp_request(self, method, params=None, timeout=30, session_id=None):
+        """
+        Sends a CDP request and waits for its response.
+
+        Args:
+            method: The CDP method name (e.g., "Page.navigate").
+            params: The parameters for the method (a dictionary).
+            timeout: Seconds to wait for the response.
+            session_id: The CDP session to send to; defaults to the attached page,
+                pass "" to address the browser itself.
+
+        Returns:
+            The CDP response if one arrived in time, None otherwise.
+        """
+        if self.closed:
+            print("WebSocket not connected.")
+            return None
+
+        cdp_id = self.next_cdp_id
+        self.next_cdp_id += 1
+        request = {"id": cdp_id, "method": method, "params": params or {}}
+        session_id = self.page_session_id if session_id is None else session_id
+        if session_id:
+            request["sessionId"] = session_id
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending_cdp_requests[cdp_id] = future
+        try:
+            await self.ws.send_str(json.dumps(request))
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            print(f"CDP request {method} timed out after {timeout} seconds.")
+            return None
+        except (ConnectionError, aiohttp.ClientError) as e:
+            print(f"Error in CDP request {method}: {e}")
+            return None
+        finally:
+            self.pending_cdp_requests.pop(cdp_id, None)
+
+    def events(self, *methods, max_queue=1000):
+        """
+        Subscribes to CDP events, optionally only those with the given method names.
+
+        Usage:
+            async with browser.events("Page.loadEventFired") as events:
+                await browser.send_cdp_request("Page.navigate", {"url": url})
+                event = await events.__anext__()
+        """
+        return CDPEventStream(self, methods, max_queue)
+
+    async def get_targets(self):
+        """
+        Retrieves a list of available targets.
+        """
+        return await self.send_cdp_request("Target.getTargets", session_id="")
+
+    async def attach_to_target(self, target_id, flatten=True):
+        """
+        Attaches to a specific target and returns the session ID.
+        """
+        params = {"targetId": target_id, "flatten": flatten}
+        response = await self.send_cdp_request("Target.attachToTarget", params, session_id="")
+        if response and "result" in response and "sessionId" in response["result"]:
+            return response["result"]["sessionId"]
+        return None
+
+    async def attach_to_page(self):
+        """Attaches to the first page target and makes it the default for send_cdp_request."""
+        targets_response = await self.get_targets()
+        if not targets_response or "targetInfos" not in targets_response.get("result", {}):
+            print("Failed to get targets.")
+            return None
+        page_target = next((t for t in targets_response["result"]["targetInfos"] if t["type"] == "page"), None)
+        if page_target is None:
+            print("No page target found.")
+            return None
+        self.page_session_id = await self.attach_to_target(page_target["targetId"])
+        return self.page_session_id
+
+    async def extend_timeout(self, additional_timeout=30):
+        return await self.client.extend_timeout(self.session_id, additional_timeout)
+
+    async def close(self):
+        """Closes the WebSocket without deallocating the browser."""
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def deallocate(self):
+        """Closes the WebSocket and deallocates the browser."""
+        await self.close()
+        return await self.client.deallocate_browser(self.session_id)
+
+class AsyncAPIClient:
+    """
+    An asyncio client for the browser automation API.
+
+    All sessions opened through one client share its aiohttp connection pool, so
+    a single process can drive hundreds of browsers concurrently. Use it as an
+    async context manager, or call close() when done.
+
+    Usage:
+        async with AsyncAPIClient("http://localhost:8888") as client:
+            async with client.browser(timeout=120) as browser:
+                await browser.send_cdp_request("Page.navigate", {"url": "https://example.com"})
+    """
+    def __init__(self, api_base_url, connection_limit=0, request_timeout=None):
+        """
+        Args:
+            api_base_url: The base URL of the API (e.g., http://localhost:8888).
+            connection_limit: Maximum pooled HTTP connections to the API, 0 for unlimited.
+            request_timeout: Total seconds allowed per HTTP call; allocation waits for
+                its own timeout on top of this.
+        """
+        self.api_base_url = api_base_url.rstrip("/")
+        self.request_timeout = request_timeout
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=connection_limit),
+            timeout=aiohttp.ClientTimeout(total=request_timeout),
+        )
+
+    async def close(self):
+        await self.http.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def allocate_browser(self, timeout=120, attach=True, profile=None):
+        """
+        Allocates a browser, connects its CDP WebSocket and attaches to a page target.
+
+        `profile` names the launch profile (e.g. "headless"); None uses the server's default.
+
+        Returns:
+            An AsyncBrowserSession if successful, None otherwise.
+        """
+        try:
+            async with self.http.post(
+                f"{self.api_base_url}/browser", params=self._allocation_params(profile, timeout=timeout),
+                timeout=aiohttp.ClientTimeout(total=None if self.request_timeout is None else timeout + self.request_timeout),
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error allocating browser: {e}")
+            return None
+
+        return await self._connect(data["session_id"], attach)
+
+    @staticmethod
+    def _allocation_params(profile, **params):
+        if profile:
+            params["profile"] = profile
+        return params
+
+    async def _connect(self, session_id, attach):
+        browser = AsyncBrowserSession(self, session_id)
+        connected = False
+        try:
+            await browser.connect()
+            if attach and not await browser.attach_to_page():
+                raise ConnectionError("Failed to attach to a page target")
+            connected = True
+        except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError) as e:
+            print(f"Error connecting to browser {browser.session_id}: {e}")
+            return None
+        finally:
+            # Any failure, cancellation included, gives the session back rather than leaving it to its lease
+            if not connected:
+                await asyncio.shield(browser.deallocate())
+        return browser
+
+    async def allocate_browsers(self, count, timeout=120, atomic=False, attach=True, profile=None):
+        """
+        Allocates `count` browsers with one POST /browsers/batch and connects to them concurrently.
+
+        Unless atomic, fewer than `count` browsers may come back. Browsers that fail
+        to connect are deallocated and left out.
+
+        Returns:
+            A list of AsyncBrowserSession objects, empty on failure.
+        """
+        try:
+            async with self.http.post(
+                f"{self.api_base_url}/browsers/batch",
+                params=self._allocation_params(profile, count=count, timeout=timeout, atomic=int(atomic)),
+                timeout=aiohttp.ClientTimeout(total=None if self.request_timeout is None else timeout + self.request_timeout),
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error allocating browsers: {e}")
+            return []
+
+        browsers = await asyncio.gather(*[self._connect(s["session_id"], attach) for s in data["sessions"]])
+        return [browser for browser in browsers if browser is not None]
+
+    async def deallocate_browsers(self, browsers):
+        """
+        Deallocates several browsers in one request.
+
+        Args:
+            browsers: AsyncBrowserSession objects or session IDs.
+
+        Returns:
+            The session IDs that were deallocated.
+        """
+        sessions = [b for b in browsers if isinstance(b, AsyncBrowserSession)]
+        await asyncio.gather(*[b.close() for b in sessions])
+        session_ids = [b.session_id if isinstance(b, AsyncBrowserSession) else b for b in browsers]
+        try:
+            async with self.http.delete(f"{self.api_base_url}/browsers/batch", json={"session_ids": session_ids}) as response:
+                response.raise_for_status()
+                return (await response.json())["deallocated"]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error deallocating browsers: {e}")
+            return []
+
+    @contextlib.asynccontextmanager
+    async def browser(self, timeout=120, attach=True, profile=None):
+        """Allocates a browser for the duration of an `async with` block and always deallocates it."""
+        browser = await self.allocate_browser(timeout, attach, profile)
+        if browser is None:
+            raise ConnectionError("Failed to allocate a browser")
+        try:
+            yield browser
+        finally:
+            await browser.deallocate()
+
+    async def deallocate_browser(self, session_id):
+        try:
+            async with self.http.delete(f"{self.api_base_url}/browser/{session_id}") as response:
+                response.raise_for_status()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error deallocating browser: {e}")
+            return False
+
+    async def extend_timeout(self, session_id, additional_timeout=30):
+        try:
+            async with self.http.post(
+                f"{self.api_base_url}/browser/{session_id}/timeout", params={"timeout": additional_timeout}
+            ) as response:
+                response.raise_for_status()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error extending timeout: {e}")
+            return False
+
+    async def list_browsers(self):
+        try:
+            async with self.http.get(f"{self.api_base_url}/browsers") as response:
+                response.raise_for_status()
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error listing browsers: {e}")
+            return None
@@ -1,19 +1,89 @@
 import asyncio
 import json
 import logging
+import os
+import signal
+import time
+from typing import Optional
 import aiohttp
 from aiohttp import web
-from browser_pool import BrowserPool
+from browser_pools import BrowserPools, configured_launch_profiles
+from config import PROXY_CONNECTION_TIMEOUT, UPSTREAM_CONNECTION_LIMIT, UPSTREAM_CONNECTION_LIMIT_PER_HOST, UPSTREAM_KEEPALIVE_TIMEOUT, RELAY_MODE
+from config import ALLOCATION_MODE, CONTEXTS_PER_BROWSER, CONTEXT_WARM_BROWSERS, ADMISSION_KEY_HEADER, DEFAULT_LAUNCH_PROFILE
+from config import COORDINATOR_NODES, COORDINATOR_POLL_INTERVAL, COORDINATOR_FAILURE_THRESHOLD
+from admission_queue import AdmissionQueueFull
+from cdp import CDPConnection, CDPError
+from context_pool import ContextPool
+from coordinator import Coordinator
+import metrics
+from pipe_transport import PipeConnection
+from relay import relay_websocket, relay_websocket_legacy
 import inspect
 
 # --- Configuration ---
 PROXY_HOST = "0.0.0.0"  # Host for the proxy server
-PROXY_PORT = 8888  # Port for the proxy server
+PROXY_PORT = int(os.getenv("PROXY_PORT", 8888))  # Port for the proxy server
 # ---------------------
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-browser_pool = BrowserPool()
+# With COORDINATOR_NODES set this process runs no browsers and spreads sessions over those nodes
+coordinator = Coordinator(
+    COORDINATOR_NODES, COORDINATOR_POLL_INTERVAL, COORDINATOR_FAILURE_THRESHOLD, ADMISSION_KEY_HEADER
+) if COORDINATOR_NODES else None
+# One pool of browsers per launch profile (headed, headless, ...), each with its own warm set and capacity
+browser_pools = BrowserPools(configured_launch_profiles(), DEFAULT_LAUNCH_PROFILE) if coordinator is None else None
+# In "context" mode each session is a browser context inside a shared process of the default profile
+context_pool = ContextPool(browser_pools.get(), CONTEXTS_PER_BROWSER, CONTEXT_WARM_BROWSERS) if ALLOCATION_MODE == "context" and browser_pools else None
+upstream_session = None  # Shared aiohttp.ClientSession for upstream HTTP requests, created on startup
+upstream_websocket_session = None  # Unlimited session for relayed WebSockets, which hold their connection for their lifetime
+
+async def start_upstream_session(app):
+    """
+    Creates the process-wide client sessions used for upstream DevTools and node requests.
+
+    Connections to each browser's debugging port are kept alive and reused across
+    `/session/{id}/json/*` requests. WebSocket upgrades get a session of their own
+    without a connection limit: a relayed WebSocket keeps its connection until it
+    closes, so sharing the limit would let open sessions starve HTTP requests.
+    """
+    global upstream_session, upstream_websocket_session
+    connector = aiohttp.TCPConnector(
+        limit=UPSTREAM_CONNECTION_LIMIT,
+        limit_per_host=UPSTREAM_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=UPSTREAM_KEEPALIVE_TIMEOUT,
+    )
+    # connect also bounds the wait for a free pooled connection
+    upstream_session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=None, connect=PROXY_CONNECTION_TIMEOUT, sock_connect=PROXY_CONNECTION_TIMEOUT),
+    )
+    upstream_websocket_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0),
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=PROXY_CONNECTION_TIMEOUT),
+    )
+
+async def start_context_pool(app):
+    """Starts warming context host browsers when running in context allocation mode."""
+    if context_pool is not None:
+        await context_pool.start(upstream_websocket_session)
+
+async def start_coordinator(app):
+    """Starts polling the pool nodes when running as a coordinator."""
+    if coordinator is not None:
+        await coordinator.start(upstream_session)
+
+async def close_upstream_session(app):
+    """Closes the shared client sessions and their pooled connections."""
+    if upstream_session is not None:
+        await upstream_session.close()
+    if upstream_websocket_session is not None:
+        await upstream_websocket_session.close()
+
+async def shutdown_browser_pools(app):
+    """Lets the pools write their session journals, or terminate their browsers if they have none."""
+    if browser_pools is not None:
+        await asyncio.to_thread(browser_pools.shutdown)
 
 async def fetch_chrome_data(debugging_port: int, path: str):
     """
@@ -27,13 +97,12 @@ async def fetch_chrome_data(debugging_port: int, path: str):
         A JSON object containing the response from Chrome, or None if the request fails.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://localhost:{debugging_port}{path}") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                else:
-                    logging.error(f"Error fetching data from Chrome on port {debugging_port}: {resp.status}")
-                    return None
+        async with upstream_session.get(f"http://127.0.0.1:{debugging_port}{path}") as resp:
+            if resp.status == 200:
+                return await resp.json()
+            else:
+                logging.error(f"Error fetching data from Chrome on port {debugging_port}: {resp.status}")
+                return None
     except aiohttp.ClientConnectorError as e:
         logging.error(f"Failed to connect to Chrome on port {debugging_port}: {e}")
         return None
@@ -41,6 +110,41 @@ async def fetch_chrome_data(debugging_port: int, path: str):
         logging.error(f"An unexpected error occurred while fetching data from Chrome on port {debugging_port}: {e}")
         return None
 
+async def fetch_pipe_data(pipe: PipeConnection, path: str):
+    """
+    Answers /json/version and /json/list for a browser on a pipe transport, which serves no HTTP.
+
+    Args:
+        pipe: The pool's pipe connection to the Chrome instance.
+        path: The requested path (e.g., '/json/version').
+
+    Returns:
+        The same JSON as Chrome would serve, without WebSocket URLs, or None if the request fails.
+    """
+    cdp = CDPConnection(pipe.open_channel())
+    try:
+        if path == "/json/version":
+            version = await cdp.send("Browser.getVersion", timeout=PROXY_CONNECTION_TIMEOUT)
+            return {
+                "Browser": version.get("product"),
+                "Protocol-Version": version.get("protocolVersion"),
+                "User-Agent": version.get("userAgent"),
+                "V8-Version": version.get("jsVersion"),
+            }
+        if path in ("/json", "/json/list"):
+            targets = (await cdp.send("Target.getTargets", timeout=PROXY_CONNECTION_TIMEOUT))["targetInfos"]
+            return [
+                {"id": target["targetId"], "type": target["type"], "title": target.get("title", ""), "url": target.get("url", "")}
+                for target in targets
+            ]
+        logging.error(f"{path} is not available for browsers on a pipe transport")
+        return None
+    except (CDPError, asyncio.TimeoutError, KeyError) as e:
+        logging.error(f"Failed to fetch {path} over a browser pipe: {e}")
+        return None
+    finally:
+        await cdp.close()
+
 async def handle_request(request):
     """
     Handles all incoming HTTP and WebSocket requests.
@@ -60,12 +164,18 @@ async def handle_request(request):
         parts = request.path.split('/')
         if len(parts) > 2 and parts[1] == 'session':
             session_id = parts[2]
-            browser_instance, port = browser_pool.get_browser_by_session(session_id)
+            if coordinator is not None:
+                return await handle_coordinator_request(request, session_id)
+            if context_pool is not None:
+                return await handle_context_request(request, session_id)
+
+            browser_instance, instance_id = browser_pools.get_browser_by_session(session_id)
             if browser_instance is None:
                 return web.Response(status=404, text="Session not found")
 
-            if not browser_pool.validate_session(session_id, port):
+            if not browser_pools.validate_session(session_id, instance_id):
                 return web.Response(status=403, text="Invalid session")
+            port = browser_instance.debugging_port
 
             if request.headers.get('Upgrade') == 'websocket':
                 # Handle WebSocket Upgrade
@@ -76,9 +186,12 @@ async def handle_request(request):
             else:
                 # Handle HTTP
                 path = request.path.replace(f'/session/{session_id}', '', 1)
-                chrome_data = await fetch_chrome_data(port, path)
+                if browser_instance.pipe is not None:
+                    chrome_data = await fetch_pipe_data(browser_instance.pipe, path)
+                else:
+                    chrome_data = await fetch_chrome_data(port, path)
                 if chrome_data is not None:
-                    browser_pool.extend_timeout(session_id, browser_instance.timeout) # use the original timeout
+                    browser_pools.extend_timeout(session_id, browser_instance.timeout) # use the original timeout
                     return web.json_response(chrome_data)
                 else:
                     return web.Response(status=502)  # Bad Gateway
@@ -86,26 +199,136 @@ async def handle_request(request):
         # If not a session request, handle as a regular request
         elif request.path == '/browser' and request.method == 'POST':
             return await allocate_browser(request)
+        elif request.path == '/browsers/batch' and request.method == 'POST':
+            return await allocate_browsers(request)
+        elif request.path == '/browsers/batch' and request.method == 'DELETE':
+            return await deallocate_browsers(request)
         elif request.path.startswith('/browser') and request.method == 'DELETE':
             return await deallocate_browser(request)
         elif request.path.startswith('/browser') and request.path.endswith('/timeout') and request.method == 'POST':
             return await extend_browser_timeout(request)
         elif request.path == '/browsers' and request.method == 'GET':
             return await list_all_browsers(request)
+        elif request.path == '/reaper' and request.method == 'GET':
+            return await reaper_stats(request)
+        elif request.path == '/autoscaler' and request.method == 'GET':
+            return await autoscaler_stats(request)
+        elif request.path == '/metrics' and request.method == 'GET':
+            return await metrics_endpoint(request)
+        elif request.path == '/occupancy' and request.method == 'GET':
+            return await occupancy_endpoint(request)
+        elif request.path == '/nodes' and request.method == 'GET':
+            return await list_nodes(request)
+        elif request.path.startswith('/nodes/') and request.path.endswith('/drain') and request.method in ('POST', 'DELETE'):
+            return await drain_node(request)
         else:
             return web.Response(status=404, text="Not Found")
     except Exception as e:
         logging.error(f"An unexpected error occurred in handle_request: {e}")
         return web.Response(status=500, text="Internal Server Error")
 
-        
+
+async def handle_context_request(request, session_id):
+    """
+    Proxies a request for a context-mode session.
+
+    The client's CDP traffic is scoped to its context by connecting it to the page
+    target created for the session rather than to the browser endpoint, and
+    `/json/list` only reports targets that belong to the session's context.
+    """
+    session = context_pool.get_session(session_id)
+    if session is None:
+        return web.Response(status=404, text="Session not found")
+
+    if not context_pool.validate_session(session_id):
+        return web.Response(status=403, text="Invalid session")
+
+    if request.headers.get('Upgrade') == 'websocket':
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        page_ws_url = f"ws://127.0.0.1:{session.debugging_port}/devtools/page/{session.target_id}"
+        try:
+            async with upstream_websocket_session.ws_connect(page_ws_url) as chrome_websocket:
+                await relay_websocket(ws, chrome_websocket, session_id)
+        except (aiohttp.ClientConnectorError, aiohttp.WSServerHandshakeError) as e:
+            logging.error(f"Failed to connect to context page for session {session_id}: {e}")
+            await ws.close(code=4005, message=str(e).encode())
+        context_pool.extend_timeout(session_id, session.timeout)
+        return ws
+
+    path = request.path.replace(f'/session/{session_id}', '', 1)
+    if path in ('/json', '/json/list'):
+        chrome_data = await context_pool.list_targets(session_id)
+    elif path == '/json/version':
+        chrome_data = await fetch_chrome_data(session.debugging_port, path)
+        if chrome_data is not None:
+            chrome_data.pop("webSocketDebuggerUrl", None)  # The browser endpoint is shared by other sessions
+    else:
+        return web.Response(status=404, text="Not Found")
+
+    if chrome_data is None:
+        return web.Response(status=502)  # Bad Gateway
+    context_pool.extend_timeout(session_id, session.timeout)
+    return web.json_response(chrome_data)
+
+async def handle_coordinator_request(request, session_id):
+    """
+    Forwards a session request to the pool node named in the session ID.
+
+    The node is found by parsing the ID, so the coordinator keeps no per-session state.
+    """
+    node, local_session_id = coordinator.resolve(session_id)
+    if node is None or not local_session_id:
+        return web.Response(status=404, text="Session not found")
+    if not node.healthy:
+        return web.Response(status=503, text=f"Node {node.name} unavailable",
+                            headers={"Retry-After": str(max(1, int(COORDINATOR_POLL_INTERVAL)))})
+
+    path = request.path.replace(f'/session/{session_id}', f'/session/{local_session_id}', 1)
+    if request.headers.get('Upgrade') == 'websocket':
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        node_ws_url = node.url.replace("http", "ws", 1) + path
+        try:
+            async with upstream_websocket_session.ws_connect(node_ws_url, max_msg_size=0) as node_websocket:
+                await relay_websocket(ws, node_websocket, session_id)
+        except (aiohttp.ClientConnectorError, aiohttp.WSServerHandshakeError) as e:
+            logging.error(f"Failed to connect to node {node.name} for session {session_id}: {e}")
+            await ws.close(code=4005, message=str(e).encode())
+        return ws
+
+    try:
+        async with upstream_session.get(node.url + path) as resp:
+            return web.Response(status=resp.status, body=await resp.read(), content_type=resp.content_type)
+    except aiohttp.ClientError as e:
+        logging.error(f"Failed to reach node {node.name} for session {session_id}: {e}")
+        return web.Response(status=502)  # Bad Gateway
+
 async def handle_websocket(client_websocket, path, port):
     """
     Handles WebSocket connections using aiohttp's client functionality.
     """
     session_id = path.split('/')[2]
-    browser_instance, _ = browser_pool.get_browser_by_session(session_id)
-    chrome_ws_url = await get_chrome_ws_url(port)
+    browser_instance, _ = browser_pools.get_browser_by_session(session_id)
+    if browser_instance.pipe is not None:
+        # The pool owns the browser's only DevTools connection; the client gets a channel on it
+        chrome_websocket = browser_instance.pipe.open_channel()
+        logging.info(f"Connected to Chrome pipe for session: {session_id}")
+        try:
+            if RELAY_MODE == "legacy":
+                await relay_websocket_legacy(client_websocket, chrome_websocket, session_id)
+            else:
+                await relay_websocket(client_websocket, chrome_websocket, session_id)
+            browser_pools.extend_timeout(session_id, browser_instance.timeout)
+        finally:
+            await chrome_websocket.close()
+            logging.info(f"Client disconnected for session: {session_id}")
+        return
+
+    chrome_ws_url = browser_instance.ws_debugger_url
+    if chrome_ws_url is None:
+        chrome_ws_url = await get_chrome_ws_url(port)
+        browser_instance.ws_debugger_url = chrome_ws_url
 
     if chrome_ws_url is None:
         if "reason" in inspect.getfullargspec(client_websocket.close).args:
@@ -115,81 +338,25 @@ async def handle_websocket(client_websocket, path, port):
         return
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.ws_connect(chrome_ws_url) as chrome_websocket:
-                logging.info(f"Connected to Chrome instance for session: {session_id}")
-
-                async def forward_to_chrome(msg):
-                    """Forwards messages from the client to Chrome."""
-                    try:
-                        truncated_msg = (msg[:100] + "...") if isinstance(msg, str) and len(msg) > 100 else msg
-                        logging.info(f"Client -> Chrome: {truncated_msg}")
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            await chrome_websocket.send_str(msg.data)
-                        elif msg.type == aiohttp.WSMsgType.BINARY:
-                            await chrome_websocket.send_bytes(msg.data)
-                    except Exception as e:
-                        logging.error(f"Error forwarding message to Chrome: {e}")
-
-                async def forward_to_client(msg):
-                    """Forwards messages from Chrome to the client."""
-                    try:
-                        truncated_msg = (msg.data[:100] + "...") if isinstance(msg.data, str) and len(msg.data) > 100 else msg.data
-                        logging.info(f"Chrome -> Client: {truncated_msg}")
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            await client_websocket.send_str(msg.data)
-                        elif msg.type == aiohttp.WSMsgType.BINARY:
-                            await client_websocket.send_bytes(msg.data)
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                            logging.error(f"WebSocket error: {msg}")
-                    except Exception as e:
-                        logging.error(f"Error forwarding message to client: {e}")
-
-                # Create tasks for forwarding messages in both directions
-                client_to_chrome_task = asyncio.create_task(
-                    forward_messages(client_websocket, forward_to_chrome), name=f"client_to_chrome_{session_id}"
-                )
-                chrome_to_client_task = asyncio.create_task(
-                    forward_messages(chrome_websocket, forward_to_client), name=f"chrome_to_client_{session_id}"
-                )
-
-                # Keep track of active tasks and remove them when done
-                active_tasks = {client_to_chrome_task, chrome_to_client_task}
-                for task in list(active_tasks):
-                    task.add_done_callback(active_tasks.discard)
-
-                # Let the tasks run concurrently in the background
-                # The loop will continue until the client_websocket is closed externally
-                while not client_websocket.closed:
-                    await asyncio.sleep(0.1)  # Check periodically
-
-                # If client_websocket is closed, cancel the pending tasks
-                for task in active_tasks:
-                    if not task.done():
-                        task.cancel()
-
-                browser_pool.extend_timeout(session_id, browser_instance.timeout)
+        async with upstream_websocket_session.ws_connect(chrome_ws_url) as chrome_websocket:
+            logging.info(f"Connected to Chrome instance for session: {session_id}")
 
-    except aiohttp.ClientConnectorError as e:
+            if RELAY_MODE == "legacy":
+                await relay_websocket_legacy(client_websocket, chrome_websocket, session_id)
+            else:
+                await relay_websocket(client_websocket, chrome_websocket, session_id)
+
+            browser_pools.extend_timeout(session_id, browser_instance.timeout)
+
+    except (aiohttp.ClientConnectorError, aiohttp.WSServerHandshakeError) as e:
         logging.error(f"Failed to connect to Chrome WebSocket for session {session_id}: {e}")
-        await client_websocket.close(code=4005, reason=str(e))
+        browser_instance.ws_debugger_url = None  # Refetch the endpoint on the next connect
+        await client_websocket.close(code=4005, message=str(e).encode())
     except Exception as e:
         logging.error(f"An error occurred for session {session_id}: {e}")
     finally:
         logging.info(f"Client disconnected for session: {session_id}")
 
-async def forward_messages(websocket, forward_func):
-    """
-    Continuously forwards messages between a websocket and a forwarding function.
-    """
-    try:
-        async for message in websocket:
-            await forward_func(message)
-    except asyncio.CancelledError:
-        logging.info("WebSocket task cancelled.")
-    except Exception as e:
-        logging.error(f"Error in WebSocket forwarding: {e}")
-
 async def get_chrome_ws_url(port: int):
     """
     Fetches the WebSocket URL of a specific Chrome instance.
@@ -206,10 +373,44 @@ async def get_chrome_ws_url(port: int):
     else:
         return None
 
+def admission_key(request) -> str:
+    """The client an allocation is queued for: its API key header, or else its address."""
+    return request.headers.get(ADMISSION_KEY_HEADER) or request.remote or ""
+
+def launch_profile(request) -> Optional[str]:
+    """The launch profile an allocation asks for with ?profile=, or None for the default."""
+    return request.rel_url.query.get("profile") or None
+
+def profile_pool(profile: Optional[str]):
+    """The BrowserPool serving a launch profile, or None and a 400 response if this node cannot serve it."""
+    pool = browser_pools.get(profile)
+    if pool is None:
+        return None, web.Response(status=400, text=f"Unknown launch profile {profile!r}")
+    if context_pool is not None and pool is not context_pool.browser_pool:
+        return None, web.Response(status=400, text="Context mode only serves the default launch profile")
+    return pool, None
+
+async def unavailable(text: str, retry_after: float = None, count: int = 1, pool=None):
+    """
+    A 503 telling the client when capacity is expected.
+
+    Unless given, the estimate comes from the lease expiries of `pool`, a
+    BrowserPool or the ContextPool.
+    """
+    metrics.ALLOCATIONS_REJECTED.inc(count)
+    if retry_after is None and coordinator is not None:
+        retry_after = max(1, COORDINATOR_POLL_INTERVAL)
+    elif retry_after is None:
+        retry_after = await asyncio.get_running_loop().run_in_executor(None, pool.retry_after, count)
+    return web.Response(status=503, text=text, headers={"Retry-After": str(int(retry_after))})
+
 async def allocate_browser(request):
     """
     Allocates a browser instance and returns a unique session ID.
 
+    The optional `profile` query parameter picks the launch profile (e.g.
+    `headless`); without it the default profile is used.
+
     Args:
         request: The aiohttp.web.Request object.
 
@@ -223,7 +424,36 @@ async def allocate_browser(request):
     except ValueError:
         return web.Response(status=400, text="Invalid timeout value")
 
-    result = browser_pool.get_browser(timeout)
+    profile = launch_profile(request)
+    if coordinator is not None:
+        data, retry_after = await coordinator.allocate(timeout, admission_key(request), profile)
+        if data is None:
+            return await unavailable("No pool node could allocate a browser", retry_after)
+        data["proxy_url"] = f"http://{PROXY_HOST}:{PROXY_PORT}/session/{data['session_id']}"
+        return web.json_response(data)
+
+    pool, error = profile_pool(profile)
+    if error is not None:
+        return error
+
+    if context_pool is not None:
+        start = time.monotonic()
+        session = await context_pool.allocate(timeout)
+        if session is None:
+            metrics.ALLOCATION_SECONDS.labels("timeout").observe(time.monotonic() - start)
+            return await unavailable("No browser context available", pool=context_pool)
+        metrics.ALLOCATION_SECONDS.labels("context").observe(time.monotonic() - start)
+        return web.json_response({
+            "session_id": session.session_id,
+            "context_id": session.context_id,
+            "proxy_url": f"http://{PROXY_HOST}:{PROXY_PORT}/session/{session.session_id}"
+        })
+
+    try:
+        result = await pool.acquire_browser(timeout, key=admission_key(request))
+    except AdmissionQueueFull as e:
+        metrics.ADMISSION_QUEUE_FULL.inc()
+        return await unavailable("Too many allocations waiting", e.retry_after, pool=pool)
 
     if result:
         debugging_port, external_port, session_id = result
@@ -231,10 +461,109 @@ async def allocate_browser(request):
             "session_id": session_id,
             "proxy_url": f"http://{PROXY_HOST}:{PROXY_PORT}/session/{session_id}"
         })
-    elif browser_pool.all_resources_occupied:
-        return web.Response(status=503, text="All browsers are currently in use")
+    if pool.all_resources_occupied:
+        return await unavailable("All browsers are currently in use", pool=pool)
     else:
-        return web.Response(status=503, text="No browser available")
+        return await unavailable("No browser available", pool=pool)
+
+async def allocate_browsers(request):
+    """
+    Allocates several browser instances in one request.
+
+    Query parameters are `count`, `timeout` and `profile` (as for POST /browser) and `atomic`.
+    Best-effort (the default) returns whatever could be allocated within the
+    timeout; with `atomic=1` the request gets all `count` sessions or none.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response listing the session IDs and proxy URLs,
+        or a 503 if nothing could be allocated.
+    """
+    try:
+        count = int(request.rel_url.query.get("count", "1"))
+        timeout = int(request.rel_url.query.get("timeout", "30"))
+    except ValueError:
+        return web.Response(status=400, text="Invalid count or timeout value")
+    if count < 1:
+        return web.Response(status=400, text="count must be at least 1")
+    atomic = request.rel_url.query.get("atomic", "0").lower() in ("1", "true", "yes")
+
+    profile = launch_profile(request)
+    if coordinator is not None:
+        sessions, retry_after = await coordinator.allocate_batch(count, timeout, atomic, admission_key(request), profile)
+        if not sessions:
+            return await unavailable(f"Could not allocate {count} browsers", retry_after, count)
+        for session in sessions:
+            session["proxy_url"] = f"http://{PROXY_HOST}:{PROXY_PORT}/session/{session['session_id']}"
+        metrics.ALLOCATIONS_REJECTED.inc(count - len(sessions))
+        return web.json_response({"requested": count, "sessions": sessions})
+
+    pool, error = profile_pool(profile)
+    if error is not None:
+        return error
+
+    if context_pool is not None:
+        start = time.monotonic()
+        results = await asyncio.gather(*[context_pool.allocate(timeout) for _ in range(count)])
+        allocated = [session for session in results if session is not None]
+        for session in results:
+            metrics.ALLOCATION_SECONDS.labels("context" if session else "timeout").observe(time.monotonic() - start)
+        if atomic and len(allocated) < count:
+            await asyncio.gather(*[context_pool.release(session.session_id) for session in allocated])
+            allocated = []
+        sessions = [{
+            "session_id": session.session_id,
+            "context_id": session.context_id,
+            "proxy_url": f"http://{PROXY_HOST}:{PROXY_PORT}/session/{session.session_id}"
+        } for session in allocated]
+    else:
+        try:
+            results = await pool.acquire_browsers(count, timeout, atomic=atomic, key=admission_key(request))
+        except AdmissionQueueFull as e:
+            metrics.ADMISSION_QUEUE_FULL.inc()
+            return await unavailable("Too many allocations waiting", e.retry_after, count, pool)
+        sessions = [{
+            "session_id": session_id,
+            "proxy_url": f"http://{PROXY_HOST}:{PROXY_PORT}/session/{session_id}"
+        } for debugging_port, external_port, session_id in results]
+
+    if not sessions:
+        return await unavailable(f"Could not allocate {count} browsers", count=count, pool=context_pool or pool)
+    metrics.ALLOCATIONS_REJECTED.inc(count - len(sessions))
+    return web.json_response({"requested": count, "sessions": sessions})
+
+async def deallocate_browsers(request):
+    """
+    Deallocates several sessions given as a JSON body: {"session_ids": [...]}.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response listing which sessions were deallocated
+        and which were not found.
+    """
+    try:
+        session_ids = (await request.json())["session_ids"]
+    except (ValueError, KeyError, TypeError):
+        return web.Response(status=400, text="Expected a JSON body with a session_ids list")
+    if not isinstance(session_ids, list) or not all(isinstance(s, str) for s in session_ids):
+        return web.Response(status=400, text="session_ids must be a list of strings")
+
+    if coordinator is not None:
+        deallocated = await coordinator.release_batch(session_ids)
+    elif context_pool is not None:
+        released = await asyncio.gather(*[context_pool.release(session_id) for session_id in session_ids])
+        deallocated = [session_id for session_id, ok in zip(session_ids, released) if ok]
+    else:
+        loop = asyncio.get_running_loop()
+        deallocated = await loop.run_in_executor(None, browser_pools.terminate_browsers_by_session, session_ids)
+    return web.json_response({
+        "deallocated": deallocated,
+        "not_found": [session_id for session_id in session_ids if session_id not in deallocated]
+    })
 
 async def deallocate_browser(request):
     """
@@ -252,7 +581,13 @@ async def deallocate_browser(request):
         if not session_id:
             return web.Response(status=400, text="Session ID required")
 
-        success = browser_pool.terminate_browser_by_session(session_id)
+        if coordinator is not None:
+            success = await coordinator.release(session_id)
+        elif context_pool is not None:
+            success = await context_pool.release(session_id)
+        else:
+            loop = asyncio.get_running_loop()
+            success = await loop.run_in_executor(None, browser_pools.terminate_browser_by_session, session_id)
         if success:
             return web.Response(status=200, text="Browser deallocated")
         else:
@@ -270,7 +605,8 @@ async def extend_browser_timeout(request):
     Returns:
         An aiohttp.web.Response indicating success or failure of extending the timeout.
     """
-    session_id = request.match_info['session_id']
+    parts = request.path.split('/')
+    session_id = parts[2] if len(parts) > 3 else None
     if not session_id:
         return web.Response(status=400, text="Session ID required")
 
@@ -280,7 +616,12 @@ async def extend_browser_timeout(request):
     except ValueError:
         return web.Response(status=400, text="Invalid timeout value")
 
-    success = browser_pool.extend_timeout(session_id, additional_time)
+    if coordinator is not None:
+        success = await coordinator.extend_timeout(session_id, additional_time)
+    elif context_pool is not None:
+        success = context_pool.extend_timeout(session_id, additional_time)
+    else:
+        success = browser_pools.extend_timeout(session_id, additional_time)
     if success:
         return web.Response(status=200, text="Timeout extended")
     else:
@@ -296,9 +637,105 @@ async def list_all_browsers(request):
     Returns:
         An aiohttp.web.json_response containing a list of browser details.
     """
-    browsers = browser_pool.list_browsers()
+    if coordinator is not None:
+        return web.json_response(await coordinator.list_browsers())
+    if context_pool is not None:
+        return web.json_response(context_pool.list_contexts())
+    browsers = browser_pools.list_browsers()
     return web.json_response(browsers)
 
+async def reaper_stats(request):
+    """
+    Reports each launch profile's background teardown queue: pending jobs and how long teardowns take.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response containing the reaper statistics.
+    """
+    if browser_pools is None:
+        return web.Response(status=404, text="Not available in coordinator mode")
+    return web.json_response(browser_pools.reaper_stats())
+
+async def autoscaler_stats(request):
+    """
+    Reports each launch profile's warm-pool autoscaler: demand estimate, target and latest decision.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response containing the autoscaler statistics.
+    """
+    if browser_pools is None:
+        return web.Response(status=404, text="Not available in coordinator mode")
+    return web.json_response(browser_pools.autoscaler_stats())
+
+async def metrics_endpoint(request):
+    """
+    Exposes pool and relay metrics in the Prometheus text format.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.Response with the current metric values.
+    """
+    if browser_pools is not None:
+        occupancy = await asyncio.get_running_loop().run_in_executor(None, browser_pools.occupancy)
+        for state in ("active", "idle", "launching"):
+            metrics.BROWSERS.labels(state).set(occupancy[state])
+        metrics.WAITING_ALLOCATIONS.set(occupancy["waiting"])
+    return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def occupancy_endpoint(request):
+    """
+    Reports this node's browser counts and capacity; a coordinator polls it for placement.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response with active, idle, launching and waiting
+        counts and max_instances, in total and per launch profile.
+    """
+    if browser_pools is None:
+        return web.Response(status=404, text="Not available in coordinator mode")
+    occupancy = await asyncio.get_running_loop().run_in_executor(None, browser_pools.occupancy)
+    return web.json_response(occupancy)
+
+async def list_nodes(request):
+    """
+    Lists the pool nodes behind a coordinator with their health, drain state and load.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.json_response containing the node list.
+    """
+    if coordinator is None:
+        return web.Response(status=404, text="Not running as a coordinator")
+    return web.json_response(coordinator.stats())
+
+async def drain_node(request):
+    """
+    Stops (POST) or resumes (DELETE) placing new sessions on a node. Existing sessions are unaffected.
+
+    Args:
+        request: The aiohttp.web.Request object.
+
+    Returns:
+        An aiohttp.web.Response indicating whether the node exists.
+    """
+    if coordinator is None:
+        return web.Response(status=404, text="Not running as a coordinator")
+    name = request.path.split('/')[2]
+    if not coordinator.set_draining(name, request.method == 'POST'):
+        return web.Response(status=404, text="Node not found")
+    return web.Response(status=200, text="Node draining" if request.method == 'POST' else "Node accepting sessions")
+
 async def start_proxy():
     """
     Starts the HTTP and WebSocket proxy server.
@@ -307,6 +744,11 @@ async def start_proxy():
     and starts the server to listen for incoming connections.
     """
     app = web.Application()
+    app.on_startup.append(start_upstream_session)
+    app.on_startup.append(start_context_pool)
+    app.on_startup.append(start_coordinator)
+    app.on_cleanup.append(close_upstream_session)
+    app.on_cleanup.append(shutdown_browser_pools)
 
     # Centralized request handling
     app.router.add_route('*', '/{tail:.*}', handle_request)
@@ -317,7 +759,16 @@ async def start_proxy():
     await site.start()
     logging.info(f"Proxy server started on http://{PROXY_HOST}:{PROXY_PORT}")
 
-    await asyncio.Future()  # Keep the server running indefinitely
+    # Run until SIGTERM (container stop) or SIGINT, then clean up so the pool can hand over to the next start
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        logging.info("Proxy server stopping.")
+    finally:
+        await runner.cleanup()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,149 @@
+# memory_budget.py
+
+import threading
+import time
+from typing import List, Optional
+from metrics import BROWSER_MEMORY_BYTES, MEMORY_EVICTIONS
+
+class MemoryBudget:
+    """
+    Admits browsers against a node-wide memory budget shared by all launch profiles.
+
+    A background thread samples the process tree of every browser from /proc.
+    Admission charges each running browser its last sample (or the estimate if
+    it has not been sampled yet) and each launch in flight the estimate, which
+    is the mean size of the profile's idle browsers. When the samples exceed the
+    budget, idle browsers are evicted largest first, then, unless evict_sessions
+    is "none", the browsers of the largest sessions.
+
+    Pool locks are never held while another pool's state is read, so the
+    budget can be consulted from inside any one pool's lock.
+    """
+    def __init__(self, budget_bytes: int, metric: str = "pss", sample_interval: float = 5,
+                 default_estimate: int = 250 * 1024 * 1024, evict_sessions: str = "largest"):
+        if metric not in ("pss", "rss"):
+            raise ValueError(f"Unknown memory metric {metric!r}; use \"pss\" or \"rss\"")
+        if evict_sessions not in ("largest", "none"):
+            raise ValueError(f"Unknown session eviction policy {evict_sessions!r}; use \"largest\" or \"none\"")
+        self.budget_bytes = budget_bytes
+        self.metric = metric
+        self.sample_interval = sample_interval
+        self.default_estimate = default_estimate
+        self.evict_sessions = evict_sessions
+        self.pools: List = []
+
+    def register(self, pool):
+        self.pools.append(pool)
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name="memory-budget", daemon=True)
+        thread.start()
+
+    def _size(self, instance) -> Optional[int]:
+        return instance.pss_bytes if self.metric == "pss" else instance.rss_bytes
+
+    def estimate(self, pool) -> int:
+        """Bytes charged for one more browser of this pool: the mean of its sampled idle browsers."""
+        sizes = [
+            self._size(instance) for instance in list(pool.resources.values())
+            if instance.is_active and instance.session_id is None and self._size(instance) is not None
+        ]
+        return sum(sizes) // len(sizes) if sizes else self.default_estimate
+
+    def used(self) -> int:
+        """Sampled memory of all running browsers."""
+        return sum(
+            self._size(instance) or 0
+            for pool in self.pools for instance in list(pool.resources.values()) if instance.is_active
+        )
+
+    def committed(self) -> int:
+        """
+        Memory charged to running and launching browsers, and to terminated ones the
+        reaper has not torn down yet. Unsampled ones count at their pool's estimate.
+        """
+        total = 0
+        for pool in self.pools:
+            estimate = self.estimate(pool)
+            instances = [instance for instance in list(pool.resources.values()) if instance.is_active]
+            for instance in instances + pool.reaper.pending_teardowns():
+                size = self._size(instance)
+                total += estimate if size is None else size
+            total += pool.launching * estimate
+        return total
+
+    def room(self, pool) -> Optional[int]:
+        """How many more browsers of this pool fit in the budget, or None without a budget."""
+        if not self.budget_bytes:
+            return None
+        estimate = self.estimate(pool)
+        free = self.budget_bytes - self.committed()
+        if estimate <= 0:
+            return None if free >= 0 else 0
+        return max(free // estimate, 0)
+
+    def has_room(self, pool, count: int = 1) -> bool:
+        room = self.room(pool)
+        return room is None or room >= count
+
+    def sample(self):
+        """Measures every running browser and updates its rss_bytes and pss_bytes."""
+        for pool in self.pools:
+            instances = [instance for instance in list(pool.resources.values()) if instance.is_active]
+            usages = pool.browser_launcher.resource_usages(instances)
+            total = 0
+            for instance in instances:
+                usage = usages.get(instance.instance_id)
+                if usage is None:
+                    continue
+                instance.rss_bytes = usage["rss_bytes"]
+                instance.pss_bytes = usage.get("pss_bytes", usage["rss_bytes"])
+                total += self._size(instance)
+            BROWSER_MEMORY_BYTES.labels(pool.launch_profile.name).set(total)
+
+    def enforce(self):
+        """Evicts browsers until the sampled memory fits the budget again."""
+        over = self.used() - self.budget_bytes
+        if over <= 0:
+            return
+
+        idle, sessions = [], []
+        for pool in self.pools:
+            for instance in list(pool.resources.values()):
+                size = self._size(instance)
+                if not instance.is_active or size is None:
+                    continue
+                if instance.session_id is None:
+                    idle.append((size, pool, instance.instance_id, None))
+                elif instance.session_id in pool.sessions:  # Not while it is being reset for reuse
+                    sessions.append((size, pool, instance.instance_id, instance.session_id))
+
+        candidates = [("idle", victim) for victim in sorted(idle, key=lambda victim: victim[0], reverse=True)]
+        if self.evict_sessions == "largest":
+            candidates += [("session", victim) for victim in sorted(sessions, key=lambda victim: victim[0], reverse=True)]
+        for kind, (size, pool, instance_id, session_id) in candidates:
+            if over <= 0:
+                break
+            instance = pool.resources.get(instance_id)
+            endpoint = instance.endpoint if instance else f"browser {instance_id}"
+            if pool.evict_browser(instance_id, session_id):
+                over -= size
+                MEMORY_EVICTIONS.labels(kind).inc()
+                owner = f"session {session_id}" if session_id else "idle"
+                print(f"Memory budget exceeded: evicted {owner} browser on {endpoint} ({size / (1024 * 1024):.0f} MB).")
+        if over > 0:
+            print(f"Memory budget still exceeded by {over / (1024 * 1024):.0f} MB after evictions.")
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+                if self.budget_bytes:
+                    self.enforce()
+                    # Samples may have shrunk below the estimates, letting queued allocations in
+                    for pool in self.pools:
+                        with pool.lock:
+                            pool._dispatch_waiters()
+            except Exception as e:
+                print(f"Memory sampling failed: {e}")
+            time.sleep(self.sample_interval)
@@ -0,0 +1,161 @@
+# metrics.py
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class _Metric(ABC):
+    """
+    Base for the metric families below, rendered in the Prometheus text format.
+
+    Families with label names hand out one child per label value tuple through
+    labels(); families without labels act as their own single child.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> "_Metric":
+        """A fresh child for one label value tuple."""
+
+    @abstractmethod
+    def _render_samples(self, family: "_Metric", values: Tuple[str, ...]) -> List[str]:
+        """This series' sample lines, labelled by the family."""
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        if self.labelnames:
+            return list(self._children.items())
+        return [((), self)]
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child._render_samples(self, values))
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self):
+        child = Counter.__new__(Counter)
+        child.value = 0.0
+        child._lock = threading.Lock()
+        return child
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def _render_samples(self, family, values):
+        return [f"{family.name}{family._label_text(values)} {self.value}"]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self):
+        child = Gauge.__new__(Gauge)
+        child.value = 0.0
+        child._lock = threading.Lock()
+        return child
+
+    def set(self, value: float):
+        self.value = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._reset()
+
+    def _reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self):
+        child = Histogram.__new__(Histogram)
+        child.buckets = self.buckets
+        child._lock = threading.Lock()
+        child._reset()
+        return child
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def _render_samples(self, family, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            labels = family._label_text(values, 'le="' + le + '"')
+            lines.append(f"{family.name}_bucket{labels} {cumulative}")
+        lines.append(f"{family.name}_sum{family._label_text(values)} {total}")
+        lines.append(f"{family.name}_count{family._label_text(values)} {cumulative}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+ALLOCATION_SECONDS = Histogram(
+    "browser_pool_allocation_seconds",
+    "Time to allocate a session; result is warm (idle browser), cold (waited for a launch or release), context or timeout.",
+    ["result"])
+LAUNCH_SECONDS = Histogram("browser_pool_launch_seconds", "Time from starting Chromium until its DevTools endpoint answers.")
+TEARDOWN_SECONDS = Histogram("browser_pool_teardown_seconds", "Time to stop a browser and delete its profile.")
+BROWSERS = Gauge("browser_pool_browsers", "Browsers by state: active, idle or launching.", ["state"])
+WAITING_ALLOCATIONS = Gauge("browser_pool_waiting_allocations", "Allocation requests queued for a browser.")
+SESSION_TIMEOUTS = Counter("browser_pool_session_timeouts_total", "Sessions whose lease expired.")
+RESTARTS = Counter("browser_pool_restarts_total", "Browser restarts after the process exited, by result.", ["result"])
+ALLOCATIONS_REJECTED = Counter("browser_pool_allocations_rejected_total", "Allocations answered with 503.")
+ADMISSION_QUEUE_FULL = Counter("browser_pool_admission_queue_full_total", "Allocations turned away because the admission queue was full.")
+RELAY_MESSAGES = Counter("browser_pool_relay_messages_total", "CDP WebSocket frames relayed, by direction.", ["direction"])
+RELAY_BYTES = Counter(
+    "browser_pool_relay_bytes_total",
+    "CDP WebSocket payload bytes relayed, by direction; text frames count their UTF-8 encoding.",
+    ["direction"])
+BROWSER_MEMORY_BYTES = Gauge("browser_pool_memory_bytes", "Sampled memory of all browser process trees (MEMORY_METRIC), by launch profile.", ["profile"])
+MEMORY_EVICTIONS = Counter("browser_pool_memory_evictions_total", "Browsers terminated to get back under MEMORY_BUDGET_MB, by kind: idle or session.", ["kind"])
+LEAKED_PROCESSES = Counter(
+    "browser_pool_leaked_processes_total",
+    "Browser helper processes still running after the browser's process group was stopped; each is killed on its own.")
+HEALTH_CHECK_FAILURES_TOTAL = Counter("browser_pool_health_check_failures_total", "Health checks a running browser did not answer within HEALTH_CHECK_TIMEOUT.")
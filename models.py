@@ -1,9 +1,10 @@
 # models.py
 
 import subprocess
-from dataclasses import dataclass
-from typing import Optional
-import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from cdp import CDPConnection
+from pipe_transport import PipeConnection
 
 @dataclass
 class ProxyInstance:
@@ -14,12 +15,67 @@ class ProxyInstance:
 @dataclass
 class BrowserInstance:
     process: subprocess.Popen
-    debugging_port: int
+    debugging_port: Optional[int]  # None with DEBUGGING_TRANSPORT=pipe
     last_used: float
     profile_path: str
+    instance_id: int = 0  # Key of the browser in its pool, kept across restarts; the debugging port unless DEBUGGING_PORT_MODE=auto
     startup_attempts: int = 0
     proxy: Optional[ProxyInstance] = None
     session_id: Optional[str] = None
     timeout: Optional[int] = None
-    timeout_thread: Optional[threading.Timer] = None
-    is_active: bool = True
\ No newline at end of file
+    is_active: bool = True
+    ws_debugger_url: Optional[str] = None  # Browser-level CDP endpoint, cached once DevTools answers
+    pipe: Optional[PipeConnection] = None  # The pool's end of --remote-debugging-pipe, instead of a debugging port
+    uses: int = 0  # Sessions served so far when browsers are recycled
+    health_failures: int = 0  # Health checks in a row that DevTools did not answer
+    rss_bytes: Optional[int] = None  # Process-tree memory at the last sample, None until sampled
+    pss_bytes: Optional[int] = None
+
+    @property
+    def endpoint(self) -> str:
+        """Where the pool reaches DevTools, for log messages."""
+        return f"pipe {self.instance_id}" if self.pipe is not None else f"port {self.debugging_port}"
+
+@dataclass
+class LaunchProfile:
+    """A named Chromium configuration served by its own BrowserPool."""
+    name: str
+    args: List[str]  # Added to CHROMIUM_ARGS
+    max_instances: int
+    min_warm: int
+    debugging_port_start: int
+    profile_base_dir: str  # Instance profiles of this launch profile, and nothing else
+    template_dir: str
+    journal_path: str  # "" when sessions are not journaled
+
+@dataclass
+class ContextHost:
+    """A pooled browser process that hosts isolated browser contexts."""
+    debugging_port: int
+    pool_session_id: str
+    cdp: CDPConnection
+    instance: Optional["BrowserInstance"] = None  # The pool's browser the CDP connection was opened to
+    contexts: Set[str] = field(default_factory=set)
+    reserved: int = 0  # Contexts being created
+
+@dataclass
+class ContextSession:
+    session_id: str
+    debugging_port: int
+    context_id: str
+    target_id: str
+    last_used: float
+    timeout: Optional[int] = None
+
+@dataclass
+class PoolNode:
+    """A pool process fronted by the coordinator."""
+    name: str
+    url: str
+    healthy: bool = True
+    draining: bool = False
+    failures: int = 0  # Consecutive failed occupancy polls
+    occupancy: Dict[str, int] = field(default_factory=dict)
+    in_flight: int = 0  # Allocations sent to the node and not answered yet
+    placed: int = 0  # Allocations granted since the last poll was sent, not yet reflected in occupancy
+    last_seen: Optional[float] = None
@@ -0,0 +1,261 @@
+# pipe_transport.py
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+import aiohttp
+from config import RELAY_QUEUE_SIZE
+
+# Commands whose response names a CDP session that is then routed to the channel that sent them
+_ATTACH_METHODS = ("Target.attachToTarget", "Target.attachToBrowserTarget")
+_SESSION_SUFFIX = ',"sessionId":"'
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def pipe_loop() -> asyncio.AbstractEventLoop:
+    """The event loop, on a thread of its own, that reads and writes every browser pipe of the process."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="cdp-pipes", daemon=True).start()
+        return _loop
+
+class PipeConnection:
+    """
+    The pool's end of a Chromium started with --remote-debugging-pipe.
+
+    Chromium reads NUL-terminated JSON commands from its fd 3 and writes responses
+    and events to its fd 4. That is a single DevTools client, so every user of the
+    browser (the proxied client WebSockets, health checks, resets) gets a
+    PipeChannel on it instead. Command ids are rewritten to be unique on the pipe
+    and restored on the response. Events of a CDP session go to the channel that
+    attached it; all other events go to every channel.
+
+    The pipe is served from pipe_loop(); channels may be used from any event loop.
+    Responses are rewritten without parsing them, relying on Chromium writing "id"
+    first and "sessionId" last, with a JSON fallback for anything else.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._ids = itertools.count(1)
+        self._calls: Dict[int, Tuple["PipeChannel", Any, Optional[str]]] = {}  # Pipe id: channel, client id, attach method
+        self._owners: Dict[str, "PipeChannel"] = {}  # CDP session id: channel that attached it
+        self._channels: Dict[int, "PipeChannel"] = {}
+        self._channel_ids = itertools.count(1)
+        self._reader: Optional[asyncio.ReadTransport] = None
+        self._writer: Optional[asyncio.WriteTransport] = None
+        self._buffer = b""
+        self._paused_by = set()  # Channels whose backlog is full
+        self.closed = False
+
+    @classmethod
+    def open(cls, read_fd: int, write_fd: int) -> "PipeConnection":
+        """Takes over the pool's ends of a browser's pipes. Must not be called from pipe_loop() itself."""
+        loop = pipe_loop()
+        connection = cls(loop)
+        asyncio.run_coroutine_threadsafe(connection._attach(read_fd, write_fd), loop).result()
+        return connection
+
+    async def _attach(self, read_fd: int, write_fd: int):
+        connection = self
+
+        class Reader(asyncio.Protocol):
+            def data_received(self, data: bytes):
+                connection._data_received(data)
+
+            def connection_lost(self, exc: Optional[Exception]):
+                connection._lost()
+
+        class Writer(asyncio.Protocol):
+            def connection_lost(self, exc: Optional[Exception]):
+                connection._lost()
+
+        self._reader, _ = await self.loop.connect_read_pipe(Reader, os.fdopen(read_fd, "rb", buffering=0))
+        self._writer, _ = await self.loop.connect_write_pipe(Writer, os.fdopen(write_fd, "wb", buffering=0))
+
+    def open_channel(self) -> "PipeChannel":
+        """A new client of the browser, bound to the running event loop. Closed right away if the pipe is."""
+        channel = PipeChannel(self, next(self._channel_ids), asyncio.get_running_loop())
+        self._channels[channel.channel_id] = channel
+        if self.closed:  # Checked after registering, so a concurrent _lost cannot miss the channel
+            self._channels.pop(channel.channel_id, None)
+            channel._deliver(None)
+        return channel
+
+    def close(self):
+        """Closes both pipes; callable from any thread."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        for transport in (self._reader, self._writer):
+            if transport is not None:
+                transport.close()
+        self._lost()
+
+    def _lost(self):
+        """The browser closed its end or exited: every channel ends."""
+        if self.closed:
+            return
+        self.closed = True
+        for transport in (self._reader, self._writer):
+            if transport is not None:
+                transport.close()
+        for channel in list(self._channels.values()):
+            channel._post(None)
+        self._channels.clear()
+        self._calls.clear()
+        self._owners.clear()
+
+    def _send(self, channel: "PipeChannel", message: dict, method: Optional[str] = None):
+        """Writes a command of a channel with an id of its own on the pipe; called from the channel's loop."""
+        client_id = message.get("id")
+        pipe_id = next(self._ids)
+        if channel is not None:
+            self._calls[pipe_id] = (channel, client_id, method if method in _ATTACH_METHODS else None)
+        message["id"] = pipe_id
+        self.loop.call_soon_threadsafe(self._write, json.dumps(message, separators=(",", ":")).encode())
+
+    def _write(self, payload: bytes):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(payload + b"\0")
+
+    def _data_received(self, data: bytes):
+        messages = (self._buffer + data).split(b"\0")
+        self._buffer = messages.pop()
+        for message in messages:
+            try:
+                self._dispatch(message.decode())
+            except Exception as e:
+                logging.error(f"Dropped a malformed CDP message from a browser pipe: {e}")
+
+    def _dispatch(self, text: str):
+        if text.startswith('{"id":'):
+            end = text.find(",", 6)
+            pipe_id = text[6:end].strip()
+            call = self._calls.pop(int(pipe_id), None) if end != -1 and pipe_id.isdigit() else None
+            if call is None:
+                return  # Unknown, or sent by a channel that has gone
+            channel, client_id, attach_method = call
+            if attach_method is not None:
+                session_id = json.loads(text).get("result", {}).get("sessionId")
+                if session_id:
+                    self._owners[session_id] = channel
+            channel._post('{"id":' + json.dumps(client_id) + text[end:])
+            return
+        if not text.startswith('{"method":'):
+            data = json.loads(text)
+            if "id" in data:
+                call = self._calls.pop(data["id"], None)
+                if call is not None:
+                    channel, data["id"], attach_method = call
+                    if attach_method is not None and data.get("result", {}).get("sessionId"):
+                        self._owners[data["result"]["sessionId"]] = channel
+                    channel._post(json.dumps(data))
+                return
+
+        session_id = None
+        if text.endswith('"}'):
+            start = text.rfind(_SESSION_SUFFIX)
+            if start != -1:
+                session_id = text[start + len(_SESSION_SUFFIX):-2]
+        if text.startswith('{"method":"Target.detachedFromTarget"'):
+            self._owners.pop(json.loads(text).get("params", {}).get("sessionId"), None)
+        owner = self._owners.get(session_id) if session_id else None
+        if owner is not None:
+            owner._post(text)
+        else:
+            for channel in list(self._channels.values()):
+                channel._post(text)
+
+    def _forget(self, channel: "PipeChannel"):
+        """Drops a closed channel and detaches the CDP sessions it left attached; runs on pipe_loop()."""
+        self._channels.pop(channel.channel_id, None)
+        for session_id, owner in list(self._owners.items()):
+            if owner is channel:
+                del self._owners[session_id]
+                self._send(None, {"method": "Target.detachFromTarget", "params": {"sessionId": session_id}})
+        self._set_paused(channel, False)
+
+    def _set_paused(self, channel: "PipeChannel", paused: bool):
+        """Stops reading the pipe while any channel has RELAY_QUEUE_SIZE messages waiting; runs on pipe_loop()."""
+        if paused:
+            self._paused_by.add(channel)
+        else:
+            self._paused_by.discard(channel)
+        if self._reader is None or self.closed:
+            return
+        if self._paused_by and self._reader.is_reading():
+            self._reader.pause_reading()
+        elif not self._paused_by and not self._reader.is_reading():
+            self._reader.resume_reading()
+
+class PipeChannel:
+    """
+    One client's view of a browser pipe, shaped like an aiohttp WebSocket so that
+    relay_websocket and CDPConnection work with it unchanged.
+    """
+    def __init__(self, connection: PipeConnection, channel_id: int, loop: asyncio.AbstractEventLoop):
+        self.connection = connection
+        self.channel_id = channel_id
+        self.loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._paused = False
+        self.closed = False
+
+    async def send_str(self, data: str):
+        if self.closed:
+            raise ConnectionResetError("CDP pipe channel is closed")
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            logging.error("Dropped a client message that is not a CDP command.")
+            return
+        self.connection._send(self, message, message.get("method"))
+
+    async def send_bytes(self, data: bytes):
+        await self.send_str(data.decode())
+
+    def _post(self, text: Optional[str]):
+        """Hands a message over to the channel's event loop; called on pipe_loop()."""
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, text)
+        except RuntimeError:
+            self.connection._forget(self)  # Its loop is gone without the channel being closed
+
+    def _deliver(self, text: Optional[str]):
+        self._queue.put_nowait(text)
+        if text is not None and not self._paused and self._queue.qsize() >= RELAY_QUEUE_SIZE:
+            self._paused = True
+            self.connection.loop.call_soon_threadsafe(self.connection._set_paused, self, True)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> aiohttp.WSMessage:
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        text = await self._queue.get()
+        if text is None:
+            self.closed = True
+            raise StopAsyncIteration
+        if self._paused and self._queue.qsize() <= RELAY_QUEUE_SIZE // 2:
+            self._paused = False
+            self.connection.loop.call_soon_threadsafe(self.connection._set_paused, self, False)
+        return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, text, None)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put_nowait(None)  # Ends a pending read
+        if not self.connection.loop.is_closed():
+            self.connection.loop.call_soon_threadsafe(self.connection._forget, self)
@@ -0,0 +1,114 @@
+# proc_stats.py
+
+import os
+from typing import Dict, List, Optional
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def _stat_fields(pid: int) -> Optional[List[bytes]]:
+    """The fields of /proc/<pid>/stat from the state on (field 3 of proc(5)), or None if the process is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces or parentheses, so split after the last ')'
+    return stat[stat.rfind(b")") + 2:].split()
+
+def _parent_map() -> Dict[int, int]:
+    """Maps every visible pid to its parent pid using /proc/<pid>/stat."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        fields = _stat_fields(int(entry))
+        if fields:
+            parents[int(entry)] = int(fields[1])
+    return parents
+
+def process_state(pid: int) -> Optional[str]:
+    """The one-letter state of a process ("R", "S", "Z", ...), or None if it does not exist."""
+    fields = _stat_fields(pid)
+    return fields[0].decode() if fields else None
+
+def process_start_time(pid: int) -> Optional[int]:
+    """When the process started, in clock ticks since boot; tells a process from a later one reusing its pid."""
+    fields = _stat_fields(pid)
+    return int(fields[19]) if fields else None
+
+def session_pids(session_id: int) -> List[int]:
+    """Every process in the given session; descendants stay in it after being reparented."""
+    pids = []
+    for pid in list_pids():
+        fields = _stat_fields(pid)
+        if fields and int(fields[3]) == session_id:
+            pids.append(pid)
+    return pids
+
+def process_cmdline(pid: int) -> List[str]:
+    """The arguments a process was started with, or an empty list if it is gone."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return [arg.decode(errors="replace") for arg in f.read().split(b"\0") if arg]
+    except OSError:
+        return []
+
+def list_pids() -> List[int]:
+    return [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+
+def child_map() -> Dict[int, List[int]]:
+    """Maps every visible pid to its children; build it once to walk several process trees."""
+    children: Dict[int, List[int]] = {}
+    for child, parent in _parent_map().items():
+        children.setdefault(parent, []).append(child)
+    return children
+
+def process_tree_pids(pid: int, children: Optional[Dict[int, List[int]]] = None) -> List[int]:
+    """Returns pid followed by all of its live descendants."""
+    if children is None:
+        children = child_map()
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    return pids
+
+def process_rss_bytes(pid: int) -> int:
+    """Resident set size of one process, or 0 if it is gone."""
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+def process_pss_bytes(pid: int) -> Optional[int]:
+    """Proportional set size of one process (shared pages split between their users), or None if unreadable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "rb") as f:
+            for line in f:
+                if line.startswith(b"Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+def process_tree_rss_bytes(pid: int) -> int:
+    """Summed RSS of a process and its descendants (shared pages are counted once per process)."""
+    return sum(process_rss_bytes(p) for p in process_tree_pids(pid))
+
+def process_tree_memory(pid: int, children: Optional[Dict[int, List[int]]] = None) -> Dict[str, int]:
+    """
+    Summed RSS and PSS of a process and its descendants.
+
+    PSS charges each shared page (the Chromium binary, shared renderer memory)
+    to its users in equal parts, so it does not overcount trees the way RSS
+    does. Processes whose smaps_rollup is unreadable are counted at their RSS.
+    """
+    rss = pss = 0
+    for p in process_tree_pids(pid, children):
+        process_rss = process_rss_bytes(p)
+        process_pss = process_pss_bytes(p)
+        rss += process_rss
+        pss += process_rss if process_pss is None else process_pss
+    return {"rss_bytes": rss, "pss_bytes": pss}
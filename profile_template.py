@@ -0,0 +1,175 @@
+# profile_template.py
+
+import errno
+import fcntl
+import glob
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional
+
+FICLONE = 0x40049409  # ioctl that shares a file's extents copy-on-write (btrfs, xfs, bcachefs)
+READY_MARKER = ".template-ready"
+# Files and directories that are per-run state and must not be cloned
+VOLATILE_ENTRIES = [
+    "SingletonCookie", "SingletonLock", "SingletonSocket", "DevToolsActivePort",
+    "Crashpad", "ShaderCache", "GrShaderCache", "GraphiteDawnCache",
+    "*/Cache", "*/Code Cache", "*/GPUCache", "*/DawnCache", "*/Session Storage", "*/Sessions",
+]
+
+class ProfileTemplate:
+    """
+    A pre-initialized Chromium user-data-dir that is cloned for every new instance.
+
+    The template is created once by running Chromium against an empty directory, so
+    clones skip first-run initialization. Clones are made with overlayfs or reflinks
+    where the host supports them and fall back to a plain copy, so discarding an
+    instance only throws away what that instance changed.
+    """
+    def __init__(self, template_dir: str, clone_mode: str = "reflink", retry_interval: float = 300):
+        self.template_dir = template_dir
+        self.clone_mode = clone_mode
+        self.retry_interval = retry_interval  # Seconds a failed build is not retried; launches use empty profiles meanwhile
+        self._retry_at = 0.0
+        self.overlay_root = os.path.join(os.path.dirname(template_dir.rstrip("/")), ".overlay")
+        self._lock = threading.Lock()
+        self._reflink_supported = True
+        self._overlay_supported = True
+
+    @property
+    def ready(self) -> bool:
+        return os.path.exists(os.path.join(self.template_dir, READY_MARKER))
+
+    def ensure(self, build_command: Callable[[str], List[str]], timeout: float = 30,
+               stop_process: Optional[Callable[[subprocess.Popen], None]] = None) -> bool:
+        """
+        Builds the template once, using build_command(user_data_dir) to start Chromium.
+
+        Chromium is started in its own session; stop_process, if given, stops it
+        and its helpers instead of a plain terminate of the browser process. A
+        failed build returns False at once for retry_interval seconds instead of
+        holding every launch behind another attempt.
+        """
+        if self.clone_mode == "none" or time.monotonic() < self._retry_at:
+            return False
+        with self._lock:
+            if self.ready:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False  # Another launch's build failed while this one waited
+            if self._build(build_command, timeout, stop_process):
+                return True
+            self._retry_at = time.monotonic() + self.retry_interval
+            print(f"Launching with empty profiles; retrying the profile template in {self.retry_interval:g}s.")
+            return False
+
+    def _build(self, build_command: Callable[[str], List[str]], timeout: float,
+               stop_process: Optional[Callable[[subprocess.Popen], None]]) -> bool:
+        staging_dir = self.template_dir.rstrip("/") + ".building"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        print(f"Building Chromium profile template in {self.template_dir}...")
+        try:
+            os.makedirs(staging_dir)
+            process = subprocess.Popen(build_command(staging_dir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                       start_new_session=True)
+            ready = self._wait_for_devtools(staging_dir, process, timeout)
+            # SIGTERM first lets Chromium flush its preferences
+            if stop_process is not None:
+                stop_process(process)
+            else:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            if not ready:
+                print("Chromium did not start while building the profile template.")
+                return False
+            self._strip_volatile(staging_dir)
+            open(os.path.join(staging_dir, READY_MARKER), "w").close()
+            shutil.rmtree(self.template_dir, ignore_errors=True)
+            os.rename(staging_dir, self.template_dir)
+            print("Chromium profile template ready.")
+            return True
+        except Exception as e:
+            print(f"Error building profile template: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _wait_for_devtools(self, user_data_dir: str, process: subprocess.Popen, timeout: float) -> bool:
+        """Chromium writes DevToolsActivePort once its first-run setup is done and it is listening."""
+        deadline = time.monotonic() + timeout
+        port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+        while time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(port_file):
+                time.sleep(1)  # Give the first-run profile writes a moment to land
+                return True
+            time.sleep(0.1)
+        return False
+
+    def _strip_volatile(self, user_data_dir: str):
+        for pattern in VOLATILE_ENTRIES:
+            for path in glob.glob(os.path.join(glob.escape(user_data_dir), pattern)):
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def clone(self, profile_path: str):
+        """Creates profile_path as a clone of the template, or as an empty directory without one."""
+        self.discard(profile_path)
+        if not self.ready:
+            os.makedirs(profile_path, exist_ok=True)
+            return
+        if self.clone_mode == "overlay" and self._overlay_supported:
+            if self._mount_overlay(profile_path):
+                return
+            self._overlay_supported = False
+            print("overlayfs unavailable, falling back to reflink clones.")
+        shutil.copytree(self.template_dir, profile_path, symlinks=True, copy_function=self._clone_file,
+                        ignore=shutil.ignore_patterns(READY_MARKER))
+
+    def _clone_file(self, src: str, dst: str):
+        if self.clone_mode != "copy" and self._reflink_supported:
+            try:
+                with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                    fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                shutil.copystat(src, dst)
+                return dst
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                    raise
+                self._reflink_supported = False
+                print("Filesystem does not support reflinks, cloning profiles by copy.")
+        return shutil.copy2(src, dst)
+
+    def _overlay_dirs(self, profile_path: str) -> tuple:
+        instance_dir = os.path.join(self.overlay_root, os.path.basename(profile_path.rstrip("/")))
+        return instance_dir, os.path.join(instance_dir, "upper"), os.path.join(instance_dir, "work")
+
+    def _mount_overlay(self, profile_path: str) -> bool:
+        instance_dir, upper_dir, work_dir = self._overlay_dirs(profile_path)
+        for path in (upper_dir, work_dir, profile_path):
+            os.makedirs(path, exist_ok=True)
+        options = f"lowerdir={self.template_dir},upperdir={upper_dir},workdir={work_dir}"
+        result = subprocess.run(["mount", "-t", "overlay", "overlay", "-o", options, profile_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            print(f"Failed to mount overlay profile at {profile_path}: {result.stderr.decode(errors='replace').strip()}")
+            shutil.rmtree(instance_dir, ignore_errors=True)
+            return False
+        return True
+
+    def discard(self, profile_path: str):
+        """Removes an instance profile; with overlayfs only its upper layer holds data."""
+        if os.path.ismount(profile_path):
+            subprocess.run(["umount", "-l", profile_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(self._overlay_dirs(profile_path)[0], ignore_errors=True)
+        shutil.rmtree(profile_path, ignore_errors=True)
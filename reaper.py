@@ -0,0 +1,133 @@
+# reaper.py
+
+import collections
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+class Reaper:
+    """
+    Tears down terminated resources on background threads.
+
+    Process shutdown and profile deletion can take seconds, so terminate_resource
+    only queues the work. The on_reaped callback runs once teardown finishes,
+    which is when a quarantined port or slot may be handed out again. Jobs that
+    do not fit in the queue wait in an unbounded overflow list; they are never
+    run on the submitting thread, which usually holds a pool lock.
+    """
+    def __init__(self, cleanup_func: Callable[[Any], None], workers: int = 2, max_queue: int = 64):
+        self.cleanup_func = cleanup_func
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.overflow = collections.deque()  # Jobs waiting for room in the queue, in submission order
+        self._teardowns: Dict[int, Any] = {}  # Resources queued or being torn down, by id()
+        self.reaping = 0
+        self.reaped_total = 0
+        self.failed_total = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self._stats_lock = threading.Lock()
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"reaper-{i}", daemon=True)
+            thread.start()
+
+    def submit(self, resource: Any, on_reaped: Optional[Callable[[Any], None]] = None,
+               work: Optional[Callable[[Any], None]] = None, spill: bool = True) -> bool:
+        """
+        Queues a resource for teardown; when the queue is full it waits in the overflow list.
+
+        work replaces cleanup_func for this job, for other slow per-resource chores
+        such as resetting a browser that is being recycled. With spill=False a job
+        that does not fit is dropped instead and False returned, so that optional
+        work can be skipped rather than delay teardowns.
+        """
+        job = (resource, on_reaped, work or self.cleanup_func)
+        with self._stats_lock:
+            queued = False
+            if not self.overflow:
+                try:
+                    self.jobs.put_nowait(job)
+                    queued = True
+                except queue.Full:
+                    if spill:
+                        print("Reaper queue is full; teardowns wait in the overflow list.")
+            if not queued and not spill:
+                return False
+            if not queued:
+                self.overflow.append(job)
+            if work is None:
+                self._teardowns[id(resource)] = resource
+            return True
+
+    def pending_teardowns(self) -> List[Any]:
+        """Resources whose teardown is queued or running; they still hold their processes and memory."""
+        with self._stats_lock:
+            return list(self._teardowns.values())
+
+    def drain(self, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for queued and running jobs; False if some are still left."""
+        deadline = time.monotonic() + timeout
+        # Overflow first: a job leaves it only after it has been counted in the queue
+        while self.overflow or self.jobs.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self._reap(*job)
+            finally:
+                self.jobs.task_done()
+                self._refill()
+
+    def _refill(self):
+        """Moves overflow jobs into the queue as room frees up."""
+        with self._stats_lock:
+            while self.overflow:
+                try:
+                    self.jobs.put_nowait(self.overflow[0])
+                except queue.Full:
+                    return
+                self.overflow.popleft()
+
+    def _reap(self, resource: Any, on_reaped: Optional[Callable[[Any], None]], work: Callable[[Any], None]):
+        with self._stats_lock:
+            self.reaping += 1
+        start = time.monotonic()
+        failed = False
+        try:
+            work(resource)
+        except Exception as e:
+            failed = True
+            print(f"Error reaping resource: {e}")
+        finally:
+            duration = time.monotonic() - start
+            with self._stats_lock:
+                if work is self.cleanup_func:
+                    self._teardowns.pop(id(resource), None)
+                self.reaping -= 1
+                self.reaped_total += 1
+                self.failed_total += failed
+                self.last_duration = duration
+                self.max_duration = max(self.max_duration, duration)
+                self.total_duration += duration
+            if on_reaped:
+                on_reaped(resource)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self.jobs.qsize() + len(self.overflow),
+                "overflow": len(self.overflow),
+                "reaping": self.reaping,
+                "reaped_total": self.reaped_total,
+                "failed_total": self.failed_total,
+                "last_duration_seconds": self.last_duration,
+                "max_duration_seconds": self.max_duration,
+                "mean_duration_seconds": self.total_duration / self.reaped_total if self.reaped_total else 0.0,
+            }
@@ -0,0 +1,135 @@
+# relay.py
+
+import asyncio
+import logging
+import aiohttp
+from config import RELAY_QUEUE_SIZE
+from metrics import RELAY_BYTES, RELAY_MESSAGES
+
+async def relay_websocket(client_websocket, chrome_websocket, session_id: str):
+    """
+    Relays CDP frames between a client and Chrome until either side goes away.
+
+    Each direction reads into a bounded queue that a separate writer drains, so a
+    slow receiver stalls reads from the sender instead of growing proxy memory.
+    As soon as one direction finishes, the other is cancelled and both sockets
+    are closed, so an upstream close reaches the client immediately.
+    """
+    client_to_chrome = asyncio.create_task(
+        _relay_direction(client_websocket, chrome_websocket, "client_to_chrome"), name=f"client_to_chrome_{session_id}"
+    )
+    chrome_to_client = asyncio.create_task(
+        _relay_direction(chrome_websocket, client_websocket, "chrome_to_client"), name=f"chrome_to_client_{session_id}"
+    )
+    tasks = {client_to_chrome, chrome_to_client}
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(chrome_websocket.close(), client_websocket.close(), return_exceptions=True)
+
+async def _relay_direction(source, sink, direction: str):
+    """Forwards frames from source to sink until source closes and everything queued is sent."""
+    queue = asyncio.Queue(RELAY_QUEUE_SIZE)
+    messages = RELAY_MESSAGES.labels(direction)
+    payload = RELAY_BYTES.labels(direction)
+
+    async def read():
+        try:
+            async for msg in source:
+                await queue.put(msg)
+        except Exception as e:
+            logging.error(f"Error reading WebSocket frame: {e}")
+        await queue.put(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            msg = await queue.get()
+            if msg is None:
+                break
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                await sink.send_str(msg.data)
+                # isascii() is O(1) on CPython strings, so only non-ASCII frames pay for encoding
+                size = len(msg.data) if msg.data.isascii() else len(msg.data.encode())
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                await sink.send_bytes(msg.data)
+                size = len(msg.data)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                logging.error(f"WebSocket error: {msg.data}")
+                break
+            else:
+                continue
+            messages.inc()
+            payload.inc(size)
+    finally:
+        reader.cancel()
+
+async def relay_websocket_legacy(client_websocket, chrome_websocket, session_id: str):
+    """
+    The original relay: logs every frame and polls for the client closing.
+
+    Kept for RELAY_MODE=legacy and as the baseline in benchmarks/bench_relay.py.
+    """
+    async def forward_to_chrome(msg):
+        """Forwards messages from the client to Chrome."""
+        try:
+            truncated_msg = (msg[:100] + "...") if isinstance(msg, str) and len(msg) > 100 else msg
+            logging.info(f"Client -> Chrome: {truncated_msg}")
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                await chrome_websocket.send_str(msg.data)
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                await chrome_websocket.send_bytes(msg.data)
+        except Exception as e:
+            logging.error(f"Error forwarding message to Chrome: {e}")
+
+    async def forward_to_client(msg):
+        """Forwards messages from Chrome to the client."""
+        try:
+            truncated_msg = (msg.data[:100] + "...") if isinstance(msg.data, str) and len(msg.data) > 100 else msg.data
+            logging.info(f"Chrome -> Client: {truncated_msg}")
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                await client_websocket.send_str(msg.data)
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                await client_websocket.send_bytes(msg.data)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                logging.error(f"WebSocket error: {msg}")
+        except Exception as e:
+            logging.error(f"Error forwarding message to client: {e}")
+
+    # Create tasks for forwarding messages in both directions
+    client_to_chrome_task = asyncio.create_task(
+        forward_messages(client_websocket, forward_to_chrome), name=f"client_to_chrome_{session_id}"
+    )
+    chrome_to_client_task = asyncio.create_task(
+        forward_messages(chrome_websocket, forward_to_client), name=f"chrome_to_client_{session_id}"
+    )
+
+    # Keep track of active tasks and remove them when done
+    active_tasks = {client_to_chrome_task, chrome_to_client_task}
+    for task in list(active_tasks):
+        task.add_done_callback(active_tasks.discard)
+
+    # Let the tasks run concurrently in the background
+    # The loop will continue until the client_websocket is closed externally
+    while not client_websocket.closed:
+        await asyncio.sleep(0.1)  # Check periodically
+
+    # If client_websocket is closed, cancel the pending tasks
+    for task in active_tasks:
+        if not task.done():
+            task.cancel()
+
+async def forward_messages(websocket, forward_func):
+    """
+    Continuously forwards messages between a websocket and a forwarding function.
+    """
+    try:
+        async for message in websocket:
+            await forward_func(message)
+    except asyncio.CancelledError:
+        logging.info("WebSocket task cancelled.")
+    except Exception as e:
+        logging.error(f"Error in WebSocket forwarding: {e}")
@@ -1,14 +1,20 @@
 # resource_pool.py
 
+import asyncio
+import math
+import sys
 import threading
 import queue
 import time
 import uuid
-import gc
 from typing import List, Optional, Dict, Tuple, Callable, Any
+from admission_queue import AdmissionQueue, AdmissionQueueFull
+from lease_scheduler import LeaseScheduler
+from metrics import ALLOCATION_SECONDS
+from reaper import Reaper
 
 class ResourcePool:
-    def __init__(self, max_instances: int, create_resource_func: Callable, cleanup_resource_func: Callable, health_check_func: Callable, warm_resources: int = 0, health_check_interval: int = 60, scale_down_interval: int = 300):
+    def __init__(self, max_instances: int, create_resource_func: Callable, cleanup_resource_func: Callable, health_check_func: Callable, warm_resources: int = 0, health_check_interval: int = 60, scale_down_interval: int = 300, reaper_workers: int = 2, reaper_queue_size: int = 64, autoscaler: Optional[Any] = None, admission_queue: Optional[AdmissionQueue] = None, journal: Optional[Any] = None):
         self.resources: Dict[Any, Any] = {}
         self.available_resource_ids = queue.Queue()
         self.lock = threading.RLock()
@@ -21,10 +27,18 @@ class ResourcePool:
         self.scale_down_interval = scale_down_interval
         self.all_resources_occupied = False
         self.max_instances = max_instances
+        self.waiters = admission_queue if admission_queue is not None else AdmissionQueue(max_size=sys.maxsize)  # (loop, future, lease) waiters, fair-queued per client key
+        self.launching = 0
+        self.capacity_watchers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []  # Atomic batches waiting to fit whole
+        self.lease_scheduler = LeaseScheduler(self._timeout_handler)
+        self.reaper = Reaper(cleanup_resource_func, reaper_workers, reaper_queue_size)
+        self.autoscaler = autoscaler
+        self.journal = journal  # Optional SessionJournal, told about every change to resources and sessions
 
         for i in range(max_instances):
             self.available_resource_ids.put(i)
 
+        self.restore_resources()
         self.maintain_warm_pool()
         self.start_health_check_thread()
         ##self.start_resource_replacement_thread()
@@ -41,6 +55,8 @@ class ResourcePool:
                             resource = self.create_resource_func(resource_id)
                             if resource:
                                 self.resources[resource_id] = resource
+                                self._journal_changed()
+                                self._dispatch_waiters()
                             else:
                                 self.available_resource_ids.put(resource_id)
                                 print(f"Failed to create resource for warming up at id {resource_id}.")
@@ -88,6 +104,13 @@ class ResourcePool:
         thread = threading.Thread(target=_replace_resources, daemon=True)
         thread.start()
 
+    def restore_resources(self):
+        """Called before the background threads start; subclasses re-adopt resources from a previous run here."""
+
+    def _journal_changed(self):
+        if self.journal:
+            self.journal.mark_dirty()
+
     def _timeout_handler(self, resource_id: Any, session_id: str):
         if resource_id in self.resources:
             resource = self.resources[resource_id]
@@ -125,65 +148,363 @@ class ResourcePool:
         resource.timeout = timeout
         resource.startup_attempts = 0
 
-        if resource.timeout_thread:
-            resource.timeout_thread.cancel()
-
         if timeout > 0:
-            resource.timeout_thread = threading.Timer(
-                timeout,
-                self._timeout_handler,
-                args=[resource_id, session_id]
-            )
-            resource.timeout_thread.start()
+            self.lease_scheduler.schedule(session_id, resource_id, timeout)
 
         self.sessions[session_id] = resource_id
+        if self.autoscaler:
+            self.autoscaler.session_started(session_id)
+        self._journal_changed()
         return resource_id, session_id
 
+    async def acquire_resource(self, timeout: int = 30, lease: Optional[int] = None, key: str = "") -> Optional[Tuple[Any, str]]:
+        """
+        Waits for a resource without blocking the event loop.
+
+        Callers with the same key are served in arrival order, different keys in
+        weighted round-robin: a waiter is handed a resource as soon as one is freed
+        or launched, and gives up after `timeout` seconds. The session lease
+        defaults to `timeout`; a lease of 0 never expires. Raises
+        AdmissionQueueFull if the caller would have to wait but the queue is full.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        lease = timeout if lease is None else lease
+        start = time.monotonic()
+        # The pool lock can be held by background threads, so never take it on the loop.
+        enqueue = loop.run_in_executor(None, self._enqueue_waiter, loop, future, lease, key)
+        try:
+            grant = await asyncio.shield(enqueue)
+            if grant:
+                ALLOCATION_SECONDS.labels("warm").observe(time.monotonic() - start)
+                return grant
+            grant = await asyncio.wait_for(future, timeout)
+            ALLOCATION_SECONDS.labels("cold").observe(time.monotonic() - start)
+            return grant
+        except asyncio.TimeoutError:
+            ALLOCATION_SECONDS.labels("timeout").observe(time.monotonic() - start)
+            print(f"No resource available within the timeout of {timeout} seconds.")
+            return None
+        except asyncio.CancelledError:
+            future.cancel()
+            enqueue.add_done_callback(self._release_abandoned_grant)
+            raise
+
+    def _enqueue_waiter(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future, lease: int, key: str = "") -> Optional[Tuple[Any, str]]:
+        """Assigns an idle resource right away if nobody is queued, otherwise queues the caller."""
+        if self.autoscaler:
+            self.autoscaler.record_arrival()
+        with self.lock:
+            idle = self._find_idle_resource()
+            self.all_resources_occupied = idle is None and not self._has_capacity()
+            if idle and not self._pending_waiters():
+                resource_id, resource = idle
+                return self.assign_resource(resource, resource_id, lease)
+            if not self.waiters.push(key, (loop, future, lease)):
+                raise AdmissionQueueFull(self.retry_after())
+            self._dispatch_waiters()
+            return None
+
+    def retry_after(self, count: int = 1) -> float:
+        """
+        Estimates the seconds until `count` more allocations could be served.
+
+        Waiters not covered by launches in flight are matched with leases in
+        expiry order, so the answer is when the lease that would free the last
+        of them runs out. Falls back to one launch time when no lease applies.
+        """
+        launch_seconds = self.autoscaler.launch_seconds if self.autoscaler else 1.0
+        with self.lock:
+            needed = self._pending_waiters() + count - self.launching - (1 if self._has_capacity() else 0)
+        if needed <= 0:
+            return max(1, math.ceil(launch_seconds))
+        expiries = self.lease_scheduler.soonest(needed)
+        return max(1, math.ceil(expiries[-1] if expiries else launch_seconds))
+
+    async def acquire_resources(self, count: int, timeout: int = 30, lease: Optional[int] = None, atomic: bool = False, key: str = "") -> List[Tuple[Any, str]]:
+        """
+        Waits for `count` resources at once, taking the pool lock a single time.
+
+        Idle resources are assigned immediately and the shortfall joins the waiter
+        queue as one block, so the launches it needs start in parallel. Best-effort
+        returns whatever was granted within `timeout`; atomic returns all `count`
+        or nothing. An atomic batch is only admitted once idle resources and free
+        launch slots cover all of it, and holds nothing while it waits for that;
+        partial grants of an admitted batch that still falls short are given back
+        to the idle set. Leases start when the batch is returned, not when each
+        resource was granted. Raises AdmissionQueueFull if none of the batch (for
+        atomic, not all of it) fits in the admission queue.
+        """
+        if atomic and count > self.max_instances:
+            print(f"Cannot reserve {count} resources; the pool holds at most {self.max_instances}.")
+            return []
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(count)]
+        lease = timeout if lease is None else lease
+        start = time.monotonic()
+        arrived = True
+        try:
+            while True:
+                # Grants are held without a lease (0) until the whole batch is settled
+                wake = loop.create_future()
+                enqueue = loop.run_in_executor(None, self._enqueue_batch, loop, futures, 0, key, atomic, wake, arrived)
+                arrived = False
+                grants = await asyncio.shield(enqueue)
+                remaining = start + timeout - time.monotonic()
+                if grants is not None or remaining <= 0:
+                    break
+                await asyncio.wait([wake], timeout=remaining)
+            if grants is None:
+                for _ in futures:
+                    ALLOCATION_SECONDS.labels("timeout").observe(time.monotonic() - start)
+                print(f"{count} resources did not become available together within {timeout} seconds.")
+                return []
+            for _ in grants:
+                ALLOCATION_SECONDS.labels("warm").observe(time.monotonic() - start)
+            queued = [future for future in futures[len(grants):] if not future.cancelled()]
+            if queued:
+                await asyncio.wait(queued, timeout=max(start + timeout - time.monotonic(), 0))
+        except asyncio.CancelledError:
+            delivered = [f.result() for f in futures if f.done() and not f.cancelled()]
+            for future in futures:
+                future.cancel()
+            enqueue.add_done_callback(self._release_abandoned_batch)
+            loop.run_in_executor(None, self._release_grants, delivered)
+            raise
+
+        for future in queued:
+            if future.done() and not future.cancelled():
+                ALLOCATION_SECONDS.labels("cold").observe(time.monotonic() - start)
+                grants.append(future.result())
+            else:
+                ALLOCATION_SECONDS.labels("timeout").observe(time.monotonic() - start)
+                future.cancel()  # A late grant is handed back by _deliver_grant
+
+        if atomic and len(grants) < count:
+            print(f"Only {len(grants)} of {count} resources available within {timeout} seconds; releasing them.")
+            await loop.run_in_executor(None, self._release_grants, grants)
+            return []
+        return await loop.run_in_executor(None, self._start_leases, grants, lease)
+
+    def _enqueue_batch(self, loop: asyncio.AbstractEventLoop, futures: List[asyncio.Future], lease: int, key: str = "",
+                       atomic: bool = False, wake: Optional[asyncio.Future] = None, arrived: bool = True) -> Optional[List[Tuple[Any, str]]]:
+        """
+        Assigns idle resources to the front of a batch and queues the rest as waiters.
+
+        Waiters that do not fit in the admission queue have their future cancelled.
+        An atomic batch that idle resources and free launch slots cannot cover yet
+        gets nothing: None is returned and `wake` is resolved when capacity frees up.
+        arrived is False when such a batch tries again, so it counts as one arrival.
+        """
+        if self.autoscaler and arrived:
+            for _ in futures:
+                self.autoscaler.record_arrival()
+        with self.lock:
+            if atomic and not self._batch_fits(len(futures)):
+                self.capacity_watchers.append((loop, wake))
+                return None
+            grants = []
+            if not self._pending_waiters():
+                while len(grants) < len(futures):
+                    idle = self._find_idle_resource()
+                    if idle is None:
+                        break
+                    resource_id, resource = idle
+                    grants.append(self.assign_resource(resource, resource_id, lease))
+            shortfall = futures[len(grants):]
+            fits = self.waiters.can_push(key, len(shortfall))
+            if fits < len(shortfall) and (atomic or not grants and not fits):
+                retry_after = self.retry_after(len(shortfall) - fits)
+                self._release_grants(grants)
+                raise AdmissionQueueFull(retry_after)
+            for future in shortfall[:fits]:
+                self.waiters.push(key, (loop, future, lease))
+            for future in shortfall[fits:]:
+                loop.call_soon_threadsafe(future.cancel)
+            self.all_resources_occupied = len(grants) < len(futures) and not self._has_capacity()
+            self._dispatch_waiters()
+            return grants
+
+    def _start_leases(self, grants: List[Tuple[Any, str]], lease: int) -> List[Tuple[Any, str]]:
+        """Starts the leases of a settled batch, dropping grants whose resource failed in the meantime."""
+        with self.lock:
+            started = []
+            for resource_id, session_id in grants:
+                resource = self.resources.get(resource_id)
+                if resource is None or resource.session_id != session_id:
+                    continue
+                resource.timeout = lease
+                if lease > 0:
+                    self.lease_scheduler.schedule(session_id, resource_id, lease)
+                started.append((resource_id, session_id))
+            self._journal_changed()
+            return started
+
+    def _release_abandoned_batch(self, enqueue: asyncio.Future):
+        if not enqueue.cancelled() and enqueue.exception() is None and enqueue.result():
+            asyncio.get_running_loop().run_in_executor(None, self._release_grants, enqueue.result())
+
+    def _release_grants(self, grants: List[Tuple[Any, str]]):
+        with self.lock:
+            for resource_id, session_id in grants:
+                self.release_resource(resource_id, session_id)
+
+    def _pending_waiters(self) -> int:
+        return self.waiters.pending()
+
+    def _find_idle_resource(self) -> Optional[Tuple[Any, Any]]:
+        for resource_id, resource in self.resources.items():
+            if resource.is_active and resource.session_id is None:
+                return resource_id, resource
+        return None
+
+    def _has_capacity(self) -> bool:
+        return self._launch_slots() > 0
+
+    def _launch_slots(self) -> int:
+        """Resources that may still be launched. Caller holds the lock."""
+        # Terminated resources count until the reaper has torn them down
+        active = sum(1 for r in self.resources.values() if r.is_active)
+        return self.max_instances - active - self.launching - len(self.reaper.pending_teardowns())
+
+    def _batch_fits(self, count: int) -> bool:
+        """Whether idle resources and launch slots not needed by queued waiters cover `count` now. Caller holds the lock."""
+        pending = self._pending_waiters()
+        idle = 0 if pending else sum(1 for r in self.resources.values() if r.is_active and r.session_id is None)
+        return idle + self._launch_slots() - max(pending - self.launching, 0) >= count
+
+    def _dispatch_waiters(self):
+        """Hands idle resources to queued waiters in fair-queue order and launches more if needed. Caller holds the lock."""
+        while True:
+            idle = self._find_idle_resource()
+            if idle is None:
+                break
+            waiter = self.waiters.pop()
+            if waiter is None:
+                break
+            loop, future, lease = waiter
+            resource_id, resource = idle
+            grant = self.assign_resource(resource, resource_id, lease)
+            loop.call_soon_threadsafe(self._deliver_grant, loop, future, grant)
+
+        shortfall = self._pending_waiters() - self.launching
+        while shortfall > 0 and self._has_capacity():
+            self.launching += 1
+            asyncio.run_coroutine_threadsafe(self._launch_for_waiters(), self.waiters.last_loop)
+            shortfall -= 1
+
+        # Atomic batches check again whether they fit whole
+        watchers, self.capacity_watchers = self.capacity_watchers, []
+        for loop, wake in watchers:
+            loop.call_soon_threadsafe(self._wake_watcher, wake)
+
+    @staticmethod
+    def _wake_watcher(wake: asyncio.Future):
+        if not wake.done():
+            wake.set_result(None)
+
+    def _deliver_grant(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future, grant: Tuple[Any, str]):
+        """Resolves a waiter on its own loop, or gives the resource back if the waiter already left."""
+        if future.done():
+            loop.run_in_executor(None, self.release_resource, *grant)
+        else:
+            future.set_result(grant)
+
+    def _release_abandoned_grant(self, enqueue: asyncio.Future):
+        if not enqueue.cancelled() and enqueue.exception() is None and enqueue.result():
+            asyncio.get_running_loop().run_in_executor(None, self.release_resource, *enqueue.result())
+
+    async def _launch_for_waiters(self):
+        """Launches one resource for the waiter queue; it goes to whoever is at the head when ready."""
+        loop = asyncio.get_running_loop()
+        resource_id = None
+        try:
+            resource_id = await self._create_and_register_async()
+            if resource_id is None:
+                await asyncio.sleep(1)  # Back off before the slot is retried
+        finally:
+            await loop.run_in_executor(None, self._finish_launch)
+
+    def _finish_launch(self):
+        with self.lock:
+            self.launching -= 1
+            self._dispatch_waiters()
+
+    def _create_and_register(self) -> Optional[Any]:
+        """Creates a resource, stores it in the pool and returns its id."""
+        try:
+            resource_id = self.available_resource_ids.get_nowait()
+        except queue.Empty:
+            return None
+        resource = self.create_resource_func(resource_id)
+        if not resource:
+            self.available_resource_ids.put(resource_id)
+            print(f"Failed to create resource for a waiter at id {resource_id}.")
+            return None
+        with self.lock:
+            self.resources[resource_id] = resource
+            self._journal_changed()
+        return resource_id
+
+    async def _create_and_register_async(self) -> Optional[Any]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._create_and_register)
+
+    def release_resource(self, resource_id: Any, session_id: str) -> bool:
+        """Returns an assigned resource that was never handed to a client back to the idle set."""
+        with self.lock:
+            resource = self.resources.get(resource_id)
+            if resource is None or resource.session_id != session_id:
+                return False
+            self.lease_scheduler.cancel(session_id)
+            self.sessions.pop(session_id, None)
+            self._session_ended(session_id)
+            resource.session_id = None
+            self._journal_changed()
+            self._dispatch_waiters()
+            return True
+
     def terminate_resource(self, resource_id: Any) -> bool:
         """Terminates a resource and cleans up."""
         with self.lock:
             if resource_id in self.resources:
                 resource = self.resources[resource_id]
 
-                # Cancel the timer if it exists
-                if resource.timeout_thread:
-                    resource.timeout_thread.cancel()
-                    resource.timeout_thread = None
-
-                # Remove session
+                # Remove session and its lease
                 if resource.session_id:
+                    self.lease_scheduler.cancel(resource.session_id)
                     self.sessions.pop(resource.session_id, None)
-
-                self.cleanup_resource_func(resource)
+                    self._session_ended(resource.session_id)
 
                 resource.is_active = False
                 resource.session_id = None
-                self.available_resource_ids.put(resource_id)
-                print(f"Resource at id {resource_id} terminated and resources cleaned up.")
-
-                # Trigger garbage collection
-                gc.collect()
+                # The id stays quarantined until the reaper has torn the resource down
+                self.reaper.submit(resource, lambda _: self._release_id(resource_id))
+                self._journal_changed()
+                print(f"Resource at id {resource_id} terminated; teardown queued.")
+                self._dispatch_waiters()
 
                 return True
             print(f"No resource found at id {resource_id} to terminate.")
             return False
 
+    def _session_ended(self, session_id: str):
+        if self.autoscaler:
+            self.autoscaler.session_ended(session_id)
+
+    def _release_id(self, resource_id: Any):
+        with self.lock:
+            self.available_resource_ids.put(resource_id)
+            self._dispatch_waiters()
+
     def extend_timeout(self, session_id: str, additional_time: int) -> bool:
         with self.lock:
             if session_id in self.sessions:
                 resource_id = self.sessions[session_id]
                 resource = self.resources[resource_id]
 
-                if resource.timeout_thread:
-                    resource.timeout_thread.cancel()
-
                 resource.timeout = additional_time
-                resource.timeout_thread = threading.Timer(
-                    additional_time,
-                    self._timeout_handler,
-                    args=[resource_id, session_id]
-                )
-                resource.timeout_thread.start()
+                self.lease_scheduler.schedule(session_id, resource_id, additional_time)
+                self._journal_changed()
                 print(f"Timeout for session {session_id} extended by {additional_time} seconds.")
                 return True
             print(f"Session {session_id} not found.")
@@ -0,0 +1,77 @@
+# session_journal.py
+
+import json
+import os
+import threading
+import time
+from typing import Callable, List
+
+class SessionJournal:
+    """
+    Keeps an on-disk copy of the pool's browser and session table.
+
+    Pool mutations only mark the journal dirty; a background thread takes a
+    snapshot and atomically replaces the file, coalescing bursts of changes into
+    one write at most every `min_interval` seconds. flush() writes synchronously
+    and is called on shutdown, so a graceful restart loses nothing.
+    """
+    VERSION = 1
+
+    def __init__(self, path: str, snapshot_func: Callable[[], List[dict]], min_interval: float = 0.2):
+        self.path = path
+        self.snapshot_func = snapshot_func
+        self.min_interval = min_interval
+        self._dirty = False
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+
+        thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        thread.start()
+
+    def load(self) -> List[dict]:
+        """Returns the browser records of the last journal written, or an empty list."""
+        try:
+            with open(self.path) as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable session journal {self.path}: {e}")
+            return []
+        if journal.get("version") != self.VERSION:
+            print(f"Ignoring session journal {self.path} with unknown version {journal.get('version')}.")
+            return []
+        return journal.get("browsers", [])
+
+    def mark_dirty(self):
+        with self._condition:
+            if not self._dirty:
+                self._dirty = True
+                self._condition.notify()
+
+    def flush(self):
+        """Writes the current table now."""
+        with self._condition:
+            self._dirty = False
+        self._write()
+
+    def _write(self):
+        with self._write_lock:
+            journal = {"version": self.VERSION, "written": time.time(), "browsers": self.snapshot_func()}
+            staging_path = f"{self.path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(staging_path, "w") as f:
+                    json.dump(journal, f, separators=(",", ":"))
+                os.replace(staging_path, self.path)
+            except OSError as e:
+                print(f"Failed to write session journal {self.path}: {e}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty:
+                    self._condition.wait()
+                self._dirty = False
+            self._write()
+            time.sleep(self.min_interval)
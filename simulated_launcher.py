@@ -0,0 +1,270 @@
+# simulated_launcher.py
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+from aiohttp import WSCloseCode, web
+from launcher_backend import LauncherBackend
+from models import BrowserInstance, LaunchProfile
+from pipe_transport import PipeConnection
+from config import DEBUGGING_PORT_MODE, DEBUGGING_TRANSPORT, LAUNCH_READY_TIMEOUT, SIMULATED_STARTUP_DELAY
+
+class SimulatedBrowser:
+    """
+    Serves a minimal DevTools endpoint: /json/version, /json/list and a CDP WebSocket,
+    or CDP on a pair of pipes like --remote-debugging-pipe.
+
+    Methods the pool itself uses (Target.*, Browser.getVersion and what a recycling
+    reset reads) get plausible results; every other method echoes its params back,
+    so clients can measure round trips through the relay.
+    """
+    def __init__(self):
+        self.port = 0
+        self.targets = {"initial": {"targetId": "initial", "type": "page", "url": "about:blank", "title": ""}}
+        self.contexts = set()  # Browser contexts created over CDP
+        self.sessions: Dict[str, str] = {}  # CDP session id: target id
+        self._runner: Optional[web.AppRunner] = None
+        self._websockets = set()  # Open DevTools connections, dropped on stop as a dying browser would
+        self._pipe: Optional[asyncio.WriteTransport] = None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None or self._pipe is not None
+
+    async def start(self, port: int, host: str = "127.0.0.1"):
+        app = web.Application()
+        app.router.add_get("/json/version", self.version)
+        app.router.add_get("/json/list", self.list_targets)
+        app.router.add_get("/json", self.list_targets)
+        app.router.add_get("/devtools/{tail:.*}", self.devtools)
+
+        runner = web.AppRunner(app, access_log=None, handle_signals=False)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        try:
+            await site.start()
+        except (OSError, asyncio.CancelledError):
+            await runner.cleanup()
+            raise
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._runner = runner
+
+    async def start_pipe(self, read_fd: int, write_fd: int):
+        """Serves CDP on NUL-terminated JSON read from read_fd, answering on write_fd, until the reader closes."""
+        loop = asyncio.get_running_loop()
+        browser = self
+        buffer = bytearray()
+
+        class Commands(asyncio.Protocol):
+            def data_received(self, data: bytes):
+                buffer.extend(data)
+                while b"\0" in buffer:
+                    end = buffer.index(b"\0")
+                    command = bytes(buffer[:end])
+                    del buffer[:end + 1]
+                    if browser._pipe is not None:
+                        browser._pipe.write(browser.reply(command.decode()).encode() + b"\0")
+
+            def connection_lost(self, exc):
+                if browser._pipe is not None:
+                    browser._pipe.close()
+                    browser._pipe = None
+
+        self._pipe, _ = await loop.connect_write_pipe(asyncio.Protocol, os.fdopen(write_fd, "wb", buffering=0))
+        await loop.connect_read_pipe(Commands, os.fdopen(read_fd, "rb", buffering=0))
+
+    async def stop(self):
+        runner, self._runner = self._runner, None
+        for ws in list(self._websockets):
+            await ws.close(code=WSCloseCode.GOING_AWAY)
+        if runner is not None:
+            await runner.cleanup()
+        pipe, self._pipe = self._pipe, None
+        if pipe is not None:
+            pipe.close()
+
+    def handle(self, method: str, params: dict, session_id: Optional[str] = None) -> dict:
+        if method == "Target.createTarget":
+            target_id = uuid.uuid4().hex
+            self.targets[target_id] = {"targetId": target_id, "type": "page", "url": params.get("url", ""),
+                                       "title": "", "browserContextId": params.get("browserContextId")}
+            return {"targetId": target_id}
+        if method == "Target.closeTarget":
+            return {"success": self.targets.pop(params.get("targetId"), None) is not None}
+        if method == "Target.getTargets":
+            return {"targetInfos": list(self.targets.values())}
+        if method == "Target.createBrowserContext":
+            context_id = uuid.uuid4().hex
+            self.contexts.add(context_id)
+            return {"browserContextId": context_id}
+        if method == "Target.getBrowserContexts":
+            return {"browserContextIds": list(self.contexts)}
+        if method == "Target.disposeBrowserContext":
+            self.contexts.discard(params.get("browserContextId"))
+            for target_id, target in list(self.targets.items()):
+                if target.get("browserContextId") == params.get("browserContextId"):
+                    del self.targets[target_id]
+            return {}
+        if method == "Target.attachToTarget":
+            attached = uuid.uuid4().hex
+            self.sessions[attached] = params.get("targetId")
+            return {"sessionId": attached}
+        if method == "Target.detachFromTarget":
+            self.sessions.pop(params.get("sessionId"), None)
+            return {}
+        if method in ("Page.getNavigationHistory", "Page.getFrameTree"):
+            url = self.targets.get(self.sessions.get(session_id), {}).get("url", "")
+            if method == "Page.getFrameTree":
+                return {"frameTree": {"frame": {"id": self.sessions.get(session_id), "url": url}}}
+            return {"currentIndex": 0, "entries": [{"id": 1, "url": url, "title": ""}]}
+        if method == "Storage.getCookies":
+            return {"cookies": []}
+        if method == "Browser.getVersion":
+            return {"protocolVersion": "1.3", "product": "SimulatedChromium/1.0", "userAgent": "SimulatedChromium"}
+        return {"echo": params}
+
+    def reply(self, data: str) -> str:
+        command = json.loads(data)
+        reply = {"id": command.get("id"), "result": self.handle(command.get("method", ""), command.get("params", {}), command.get("sessionId"))}
+        if "sessionId" in command:
+            reply["sessionId"] = command["sessionId"]
+        return json.dumps(reply)
+
+    async def version(self, request):
+        return web.json_response({
+            "Browser": "SimulatedChromium/1.0",
+            "Protocol-Version": "1.3",
+            "webSocketDebuggerUrl": f"ws://127.0.0.1:{self.port}/devtools/browser/simulated",
+        })
+
+    async def list_targets(self, request):
+        return web.json_response([
+            {**target, "id": target["targetId"],
+             "webSocketDebuggerUrl": f"ws://127.0.0.1:{self.port}/devtools/page/{target['targetId']}"}
+            for target in self.targets.values()
+        ])
+
+    async def devtools(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self._websockets.add(ws)
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                await ws.send_str(self.reply(msg.data))
+        finally:
+            self._websockets.discard(ws)
+        return ws
+
+class SimulatedProcess:
+    """Stands in for the subprocess.Popen of a simulated browser."""
+    def __init__(self, browser: SimulatedBrowser, loop: asyncio.AbstractEventLoop):
+        self.browser = browser
+        self.loop = loop
+        self.pid = os.getpid()
+        self._stopped = None
+
+    def poll(self) -> Optional[int]:
+        return None if self.browser.running else 0
+
+    def terminate(self):
+        self._stopped = asyncio.run_coroutine_threadsafe(self.browser.stop(), self.loop)
+
+    kill = terminate
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if self._stopped is not None:
+            self._stopped.result(timeout)
+        return 0
+
+class SimulatedLauncher(LauncherBackend):
+    """
+    Runs browsers as in-process DevTools stand-ins instead of Chromium processes.
+
+    Every simulated browser listens on its own debugging port, or with
+    DEBUGGING_TRANSPORT=pipe answers on a pair of pipes, served from one event
+    loop on a background thread, so the pool, the proxy and the relay are
+    exercised exactly as with Chromium but a launch costs a socket bind. Meant
+    for finding pool-level bottlenecks under load (LAUNCHER_BACKEND=simulated).
+    """
+    def __init__(self, launch_profile: LaunchProfile):
+        self.launch_profile = launch_profile
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, name="simulated-browsers", daemon=True)
+        thread.start()
+
+    async def _start(self, instance_id: int) -> BrowserInstance:
+        await asyncio.sleep(SIMULATED_STARTUP_DELAY)
+        browser = SimulatedBrowser()
+        if DEBUGGING_TRANSPORT == "pipe":
+            to_browser, from_pool = os.pipe()
+            to_pool, from_browser = os.pipe()
+            await browser.start_pipe(to_browser, from_browser)
+            try:
+                pipe = await asyncio.get_running_loop().run_in_executor(None, PipeConnection.open, to_pool, from_pool)
+            except asyncio.CancelledError:
+                await browser.stop()  # The launch timed out; nobody will stop this browser otherwise
+                raise
+            return BrowserInstance(
+                process=SimulatedProcess(browser, self.loop),
+                debugging_port=None,
+                last_used=time.time(),
+                profile_path="",
+                instance_id=instance_id,
+                pipe=pipe
+            )
+        await browser.start(0 if DEBUGGING_PORT_MODE == "auto" else instance_id)
+        return BrowserInstance(
+            process=SimulatedProcess(browser, self.loop),
+            debugging_port=browser.port,
+            last_used=time.time(),
+            profile_path="",
+            instance_id=instance_id,
+            ws_debugger_url=f"ws://127.0.0.1:{browser.port}/devtools/browser/simulated"
+        )
+
+    def launch_browser(self, instance_id: int) -> Optional[BrowserInstance]:
+        future = asyncio.run_coroutine_threadsafe(self._start(instance_id), self.loop)
+        try:
+            return future.result(LAUNCH_READY_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel() and future.exception() is None:
+                self.stop(future.result())  # Finished just as the wait gave up
+            print(f"Failed to launch simulated browser {instance_id}: not ready within {LAUNCH_READY_TIMEOUT}s")
+            return None
+        except Exception as e:
+            print(f"Failed to launch simulated browser {instance_id}: {e}")
+            return None
+
+    async def launch_browser_async(self, reserve_instance_id: Callable[[], int]) -> Optional[BrowserInstance]:
+        instance_id = await asyncio.get_running_loop().run_in_executor(None, reserve_instance_id)
+        future = asyncio.run_coroutine_threadsafe(self._start(instance_id), self.loop)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), LAUNCH_READY_TIMEOUT)
+        except Exception as e:
+            print(f"Failed to launch simulated browser {instance_id}: {e}")
+            return None
+
+    def is_ready(self, instance: BrowserInstance) -> bool:
+        return instance.process.browser.running
+
+    def is_alive(self, instance: BrowserInstance) -> bool:
+        return instance.process.browser.running
+
+    def stop(self, instance: BrowserInstance):
+        instance.process.terminate()
+        instance.process.wait(timeout=5)
+        if instance.pipe is not None:
+            instance.pipe.close()
+
+    def terminate(self, instance: BrowserInstance):
+        self.stop(instance)
+
+    def resource_usage(self, instance: BrowserInstance) -> Dict[str, int]:
+        return {"rss_bytes": 0, "pss_bytes": 0}  # Simulated browsers share the proxy's memory
@@ -1,7 +1,7 @@
 #!/bin/sh
 
-echo "Purging old session data..."
-rm -rf /config/chromium_profiles/*
+# Old session data under /config/chromium_profiles is purged by the pool itself,
+# which first re-adopts browsers still listed in its session journal
 
 # Define the path to the Chromium profile directory
 CHROMIUM_PROFILE_DIR="/config/xdg/config/chromium"
@@ -28,7 +28,8 @@ else
 fi
 
 
-python3 /main.py
+# exec so the container's SIGTERM reaches the proxy and it can write its session journal
+exec python3 /main.py
 #uvicorn main:app --host 0.0.0.0 --port 8888
 # Wait for all background processes to complete
 wait